@@ -1,7 +1,13 @@
 """The benchmarking module contains the code responsible for running Monte Carlo trials and collecting metrics which measure estimator performance (:term:`performance metrics <performance metric>`) and data distributional settings (:term:`data metrics <data metric>`). This module is responsible for *execution* of the experiments and metric functions. The metric functions themselves are defined alongside the objects which they measure. See :mod:`maccabee.modeling.performance_metrics` for performance metrics and :mod:`maccabee.data_analysis.data_metrics` for data metrics
 
+The :mod:`~maccabee.benchmarking.dgp_bank` submodule contains the :class:`~maccabee.benchmarking.dgp_bank.DGPBank` class, a persistent store of pre-sampled DGPs indexed by their data metric values, which can be used as a source of DGPs for benchmarking.
+
+The :mod:`~maccabee.benchmarking.dataset_corpus` submodule contains the :class:`~maccabee.benchmarking.dataset_corpus.DatasetCorpus` class, a persistent, memory-mapped store of sampled DGPs and their generated data sets, which allows new models to be benchmarked on exactly the same data as previous models without regenerating it.
+
 .. note::
-  For now, this module is made up of one submodule. In future releases, it may be broken into smaller, more specialized submodules. For convenience, all functions from the single submodule of this module can be imported directly from the module itself.
+  For convenience, all functions and classes from the submodules of this module can be imported directly from the module itself.
 """
 
 from .benchmarking import *
+from .dgp_bank import *
+from .dataset_corpus import *
@@ -9,6 +9,14 @@
 |
 
 * :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp_grid` is the next and final function up the benchmarking hierarchy. It takes a grid of sampling parameters corresponding to different levels of one of more data axes and then samples DGPs from each combination of sampling parameters in the grid using :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`. There is no additional aggregation as the metrics for each parameter combination are reported individually.
+
+|
+
+* :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_dgp_bank` sits alongside :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`. Rather than sampling DGPs, it draws them from a :class:`~maccabee.benchmarking.dgp_bank.DGPBank` based on their data metric values and then aggregates the metrics in the same way.
+
+|
+
+* :func:`~maccabee.benchmarking.benchmarking.benchmark_model_on_corpus` also sits alongside :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`. Rather than sampling DGPs and generating data sets, it reads stored data sets from a :class:`~maccabee.benchmarking.dataset_corpus.DatasetCorpus` and then aggregates the metrics in the same way.
 """
 
 from sklearn.model_selection import ParameterGrid
@@ -18,10 +26,10 @@ from multiprocessing import Pool, Process, Manager, cpu_count
 from functools import partial
 
 from ..parameters import build_parameters_from_axis_levels
-from ..data_generation import DataGeneratingProcessSampler, SampledDataGeneratingProcess
-from ..data_analysis import calculate_data_axis_metrics
+from ..data_generation import DataGeneratingProcessSampler, CoupledDGPSampler, SampledDataGeneratingProcess, DatasetHandle
+from ..data_analysis import calculate_data_axis_metrics_batch
 from ..modeling.performance_metrics import AVG_EFFECT_METRICS, INDIVIDUAL_EFFECT_METRICS
-from ..exceptions import UnknownEstimandException, UnknownEstimandAggregationException
+from ..exceptions import UnknownEstimandException, UnknownEstimandAggregationException, DatasetCorpusException
 from ..constants import Constants
 
 from ..utilities.threading import get_threading_context
@@ -53,7 +61,7 @@ def _aggregate_metric_results(metric_results, std=True):
 
     return aggregated_results
 
-def _gen_data_and_apply_model(dgp, model_class, estimand, index):
+def _gen_data_and_apply_model(dgp, model_class, estimand, seeds, index):
     """Helper method used execute the set of operations required to benchmark a single DGP. This set is as follows:
 
     * Sample a data set
@@ -64,19 +72,15 @@ def _gen_data_and_apply_model(dgp, model_class, estimand, index):
         dgp (:class:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess`): a DGP instance.
         model_class (:class:`~maccabee.modeling.models.CausalModel`): a class definition that inherits from :class:`~maccabee.modeling.models.CausalModel`, implementing a causal estimator.
         estimand (str): the string name of a causal estimand.
+        seeds (:class:`numpy.ndarray`): The seeds of the data sets in the sampling run. The data set is sampled with the seed at `index`.
         index (int): An index associated with the DGP that is returned with the results of this function. This is for the convenience of calling functions that may execute this method in parallel.
 
     Returns:
         tuple: a tuple with the index as the first entry, the estimated and true causal effects as a tuple in the second entry and the generated data (from the DGP) associated with the causal effects as the third entry.
     """
 
-    # TODO-FUTURE: consider implementing a mechanism to control this seeding.
-    # This is complex given the parallelism requires each worker to have a
-    # different source of entropy.
-    np.random.seed() # randomly seed the data sampling process.
-
     logger.info(f"Generating data set {index+1}")
-    dataset = dgp.generate_dataset()
+    dataset = dgp.generate_dataset(seed=seeds[index])
 
     logger.debug(f"Fitting causal model to data set {index+1}")
     # Fit model
@@ -92,28 +96,57 @@ def _gen_data_and_apply_model(dgp, model_class, estimand, index):
 
     return index, (estimate_val, true_val), dataset
 
-def _sample_dgp(dgp_sampler, index):
+def _gen_data_and_apply_model_batch(dgp, model_class, estimand, seeds, indeces):
+    """Helper method used in place of :func:`~maccabee.benchmarking.benchmarking._gen_data_and_apply_model` when the model has an optimized :meth:`~maccabee.modeling.models.CausalModel.fit_batch` method. It samples a chunk of the data sets in a sampling run and fits the model to all of them at once. The chunks are processed in parallel, so that batch fitting uses all of the workers.
+
+    Args:
+        dgp (:class:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess`): a DGP instance.
+        model_class (:class:`~maccabee.modeling.models.CausalModel`): a class definition that inherits from :class:`~maccabee.modeling.models.CausalModel`, implementing a causal estimator.
+        estimand (str): the string name of a causal estimand.
+        seeds (:class:`numpy.ndarray`): The seeds of the data sets in the sampling run. Each data set is sampled with the seed at its index.
+        indeces (list): The indeces of the data sets in the chunk.
+
+    Returns:
+        list: a list with one tuple per data set in the chunk. Each tuple has the same entries as the result of :func:`~maccabee.benchmarking.benchmarking._gen_data_and_apply_model`.
     """
+    datasets = []
+    for index in indeces:
+        logger.info(f"Generating data set {index+1}")
+        datasets.append(dgp.generate_dataset(seed=seeds[index]))
 
-    TODO fix these docs
+    logger.debug(f"Batch fitting causal model to {len(datasets)} data sets")
+    models = model_class.fit_batch(datasets)
 
-    Helper method to sample a :class:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess` instance from a :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler` instance. Optionally storing this in a supplied list-like data structure.
+    return [
+        (index, (model.estimate(estimand=estimand), dataset.ground_truth(estimand=estimand)), dataset)
+        for index, model, dataset in zip(indeces, models, datasets)
+    ]
+
+def _benchmark_dgp_with_cost_report(benchmark_dgp, dgp):
+    """Helper method which runs a concrete DGP benchmark function and collects the data metric cost report. This is required when the benchmark is executed in a worker process, in which case a supplied cost report dictionary would not be updated in the calling process.
 
     Args:
-        dgp_sampler (:class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler`): a :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler` instance from which to sample DGPs.
-        index (int): index at which to store the sampled DGP in the supplied data structure.
-        dgps (list): a list or integer-indexable data structure in which to store the sampled DGP.
+        benchmark_dgp (function): A partially applied :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp` function which takes only the DGP.
+        dgp (:class:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess`): The DGP to benchmark.
 
     Returns:
-        tuple: a tuple with the index as the first entry and the sampled DGP as the second entry.
+        tuple: a tuple with the benchmark results as the first entry and the data metric cost report dictionary as the second entry.
     """
-    # TODO-FUTURE: consider implementing a mechanism to control this seeding.
-    # This is complex given the parallelism requires each worker to have a
-    # different source of entropy.
-    np.random.seed() # seed the dgp sampling process
-    logger.info(f"Sampling DGP {index+1}")
-    sampled_dgp = dgp_sampler.sample_dgp()
-    return sampled_dgp
+    cost_report = {}
+    results = benchmark_dgp(dgp, data_metric_cost_report=cost_report)
+    return results, cost_report
+
+def _log_data_metric_cost_report(cost_report):
+    """Helper method which logs the time spent calculating each data metric, in descending order of cost.
+
+    Args:
+        cost_report (dict): A dictionary mapping flattened data metric names to total calculation times in seconds.
+    """
+    total_cost = sum(cost_report.values())
+    logger.info(f"Data metric cost report (total {np.round(total_cost, METRIC_ROUNDING)}s):")
+    for axis_metric_name, cost in sorted(
+        cost_report.items(), key=lambda item: item[1], reverse=True):
+        logger.info(f"    {axis_metric_name}: {np.round(cost, METRIC_ROUNDING)}s")
 
 def _get_performance_metric_data_structures(num_samples_from_dgp, n_observations, estimand):
     """Helper method to generate data structures to store performance metric data.
@@ -163,6 +196,9 @@ def benchmark_model_using_concrete_dgp(
     num_sampling_runs_per_dgp, num_samples_from_dgp,
     data_analysis_mode=False,
     data_metrics_spec=None,
+    data_metric_cost_report=None,
+    approximate_data_metrics=False,
+    dataset_handles=None,
     n_jobs=1):
     """Sample data sets from the given DGP instance and calculate performance and (optionally) data metrics.
 
@@ -173,7 +209,10 @@ def benchmark_model_using_concrete_dgp(
         num_sampling_runs_per_dgp (int): The number of sampling runs to perform. Each run is comprised of `num_samples_from_dgp` data set samples which are passed to the metric functions.
         num_samples_from_dgp (int): The number of data sets sampled from the DGP per sampling run.
         data_analysis_mode (bool): If ``True``, data metrics are calculated according to the supplied `data_metrics_spec`. This can be slow and may be unecessary. Defaults to True.
-        data_metrics_spec (type): A dictionary which specifies which :term:`data metrics <data metric>` to calculate and record. The keys are axis names and the values are lists of string metric names. All axis names and the metrics for each axis are available in the dictionary :obj:`maccabee.data_analysis.data_metrics.AXES_AND_METRIC_NAMES`. If None, all data metrics are calculated. Defaults to None.
+        data_metrics_spec (type): A dictionary which specifies which :term:`data metrics <data metric>` to calculate and record. The keys are axis names and the values are lists of string metric names. All axis names and the metrics for each axis are available in the dictionary :obj:`maccabee.data_analysis.data_metrics.AXES_AND_METRIC_NAMES`. If None, all data metrics are calculated. The :func:`~maccabee.data_analysis.data_metrics.build_data_metrics_spec` function can be used to build a spec which fits a per-data set time budget. Defaults to None.
+        data_metric_cost_report (dict): An optional dictionary into which the total time, in seconds, spent calculating each data metric is accumulated. The keys are the flattened axis and metric names. Defaults to None.
+        approximate_data_metrics (bool): If ``True``, the data metrics of large data sets are approximated using repeated stratified subsamples and standard errors are reported alongside each metric. See :func:`~maccabee.data_analysis.data_analysis.calculate_data_axis_metrics`. Defaults to False.
+        dataset_handles (list): An optional list to which a :class:`~maccabee.data_generation.dataset_handle.DatasetHandle` is appended for each sampled data set, in order of sampling run and sample. The handles regenerate the data sets on demand so they can be kept for later analysis at a negligible memory cost. Defaults to None.
         n_jobs (int): The number of processes on which to run the benchmark. Defaults to 1.
 
     Returns:
@@ -186,16 +225,16 @@ def benchmark_model_using_concrete_dgp(
     # Set DGP data analysis mode
     dgp.set_data_analysis_mode(data_analysis_mode)
 
-    # Build a runner function which samples a data set from the dgp,
-    # builds the model and finds the estimand value.
-    run_model_on_dgp = partial(_gen_data_and_apply_model, dgp, model_class, estimand)
+    # Models with an optimized batch fit method are fit to the data sets in
+    # each sampling run in batches, one per worker, after the data sets in
+    # the batch are generated.
+    batch_fitting = model_class.supports_batch_fit()
 
-    # Build a runner function which calculates the data metrics
-    # for a dataset given the data_metrics_spec
-    collect_dataset_metrics = partial(
-        calculate_data_axis_metrics,
-        observation_spec=data_metrics_spec,
-        flatten_result=True)
+    # Every data set is sampled with its own seed, drawn from fresh entropy,
+    # so that it can be regenerated from its handle.
+    dataset_seeds = np.random.SeedSequence().generate_state(
+        num_sampling_runs_per_dgp*num_samples_from_dgp).reshape(
+            num_sampling_runs_per_dgp, num_samples_from_dgp)
 
     sample_indeces = range(num_samples_from_dgp)
 
@@ -224,9 +263,11 @@ def benchmark_model_using_concrete_dgp(
         # used below in order to make use of the advanced chunksize handling.
         pool = Pool(processes=n_jobs) # , maxtasksperchild=1 todo remove
         map_func = partial(pool.map, chunksize=max(1, int(num_samples_from_dgp/n_jobs)))
+        chunk_map_func = partial(pool.map, chunksize=1)
     elif n_jobs == 0:
         logger.info("Running concrete DGP benchmark using a single process.")
         map_func = map
+        chunk_map_func = map
     else:
         raise ValueError("Invalid n_jobs value - should be integer from -1 to n")
 
@@ -240,6 +281,18 @@ def benchmark_model_using_concrete_dgp(
         # Synchronous loop over the sampling runs.
         for run_index in range(num_sampling_runs_per_dgp):
             logger.debug(f"Starting sampling run {run_index+1}")
+
+            # Build the runner functions which sample a data set from the dgp
+            # and (optionally) build the model and find the estimand value.
+            run_seeds = dataset_seeds[run_index]
+            run_model_on_dgp = partial(_gen_data_and_apply_model, dgp, model_class, estimand, run_seeds)
+            run_batch_model_on_dgp = partial(_gen_data_and_apply_model_batch, dgp, model_class, estimand, run_seeds)
+
+            if dataset_handles is not None:
+                dataset_handles.extend(
+                    DatasetHandle(dgp, seed, data_analysis_mode)
+                    for seed in run_seeds)
+
             # Data structures to store the datasets, sampled estimand values and
             # data metrics for each sample in this sampling run.
 
@@ -256,20 +309,42 @@ def benchmark_model_using_concrete_dgp(
             # and process data samples into estimand samples.
 
             logger.debug(f"Starting sampling for run {run_index+1}.")
-            for sample_index, effect_estimate_and_truth, dataset in map_func(
-                run_model_on_dgp, sample_indeces):
-
+            if batch_fitting:
+                # Split the data sets into one chunk per worker. Each worker
+                # samples its chunk and batch fits the model to it.
+                sample_chunks = [
+                    [int(index) for index in chunk] for chunk in np.array_split(
+                        sample_indeces, max(1, n_jobs))
+                    if len(chunk) > 0]
+                sample_results = (
+                    result
+                    for chunk_results in chunk_map_func(
+                        run_batch_model_on_dgp, sample_chunks)
+                    for result in chunk_results)
+            else:
+                sample_results = map_func(run_model_on_dgp, sample_indeces)
+
+            for sample_index, effect_estimate_and_truth, dataset in sample_results:
                 # Store estimand and data set samples.
                 estimand_sample_results[sample_index, :] = effect_estimate_and_truth
                 datasets[sample_index] = dataset
             logger.debug(f"Done sampling for run {run_index+1}.")
 
-            # If in data analysis mode, use the pool to run data metric
-            # calculation.
+            # If in data analysis mode, calculate the data metrics for all
+            # the data sets in the run in a single batched pass. This reuses
+            # the DGP variables which are shared across the data sets. The
+            # metrics without a batched implementation are spread over the
+            # workers.
             if data_analysis_mode:
                 logger.debug(f"Starting data analysis for run {run_index+1}.")
-                # Loop over generated datasets in order.
-                for data_metric_results in map_func(collect_dataset_metrics, datasets):
+                # Loop over the metric results for the generated datasets in order.
+                for data_metric_results in calculate_data_axis_metrics_batch(
+                    datasets,
+                    observation_spec=data_metrics_spec,
+                    flatten_result=True,
+                    cost_report=data_metric_cost_report,
+                    approximate=approximate_data_metrics,
+                    map_func=map_func):
                     # Record all metrics at the sampled data set level
                     # for later aggregation.
                     for axis_metric_name, axis_metric_val in data_metric_results.items():
@@ -300,6 +375,9 @@ def benchmark_model_using_concrete_dgp(
         pool.close()
         pool.join()
 
+    if data_analysis_mode and data_metric_cost_report is not None:
+        logger.debug(f"Data metric costs: {data_metric_cost_report}")
+
     # Aggregate perf and data metrics across sampling runs.
     performance_metric_aggregated_results = _aggregate_metric_results(performance_metric_run_results)
     data_metric_aggregated_results = _aggregate_metric_results(data_metric_run_results, std=False)
@@ -318,10 +396,14 @@ def benchmark_model_using_sampled_dgp(
     data_analysis_mode=False,
     data_metrics_spec=None,
     data_metric_intervals=False,
+    data_metric_cost_report=None,
+    approximate_data_metrics=False,
     dgp_class=SampledDataGeneratingProcess,
     dgp_kwargs={},
     n_jobs=1,
-    compile_functions=False):
+    compile_functions=False,
+    dgp_seed=None,
+    dgp_cache=None):
     """Short summary.
 
     Args:
@@ -334,10 +416,14 @@ def benchmark_model_using_sampled_dgp(
         num_sampling_runs_per_dgp (int): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. Defaults to 1.
         data_analysis_mode (bool): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. Defaults to False.
         data_metrics_spec (dict):  See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. Defaults to None.
+        data_metric_cost_report (dict): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. The times are accumulated across all sampled DGPs. Defaults to None.
+        approximate_data_metrics (bool): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. Defaults to False.
         dgp_class (:class:`maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`): The DGP class to instantiate after function sampling. This must be a subclass of :class:`maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`. This can be used to tweak aspects of the default sampled DGP. Defaults to SampledDataGeneratingProcess.
         dgp_kwargs (dict): A dictionary of keyword arguments to pass to the sampled DGPs at instantion time. Defaults to {}.
         n_jobs (int): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. Defaults to 1.
         compile_functions (bool): A boolean indicating whether sampling DGP functions should be compiled prior to execution. Defaults to ``False``.
+        dgp_seed (int): A seed from which the seeds of the sampled DGPs are derived. If supplied, each DGP is sampled with :meth:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler.sample_dgp` using its own seed so that the same DGPs are sampled in repeated runs. Defaults to None, in which case the DGPs are sampled as a batch using the global random state.
+        dgp_cache (:class:`~maccabee.data_generation.dgp_cache.DGPCache`): A cache in which the seeded DGPs are stored so that repeated runs load them rather than sampling them. Only used if `dgp_seed` is supplied. Defaults to None.
 
     Returns:
         tuple: A tuple with four entries. See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp` for a description of the entries but note that, in this func, the aggregate metric values are averaged across dgp samples and sampling runs and the raw metric values correspond to averages over sampling runs for each sampled DGP. This means each entry in the raw metrics list corresponds to the aggregated result of the :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp` function.
@@ -346,7 +432,8 @@ def benchmark_model_using_sampled_dgp(
         UnknownEstimandException: If an unknown estimand is supplied.
     """
 
-    perf_metric_names_and_funcs = _get_performance_metric_functions(estimand)
+    # Validate the estimand before any DGPs are sampled.
+    _get_performance_metric_functions(estimand)
 
     dgp_kwargs["compile_functions"] = compile_functions
 
@@ -354,29 +441,243 @@ def benchmark_model_using_sampled_dgp(
         dgp_class=dgp_class,
         parameters=dgp_sampling_params,
         data_source=data_source,
-        dgp_kwargs=dgp_kwargs)
+        dgp_kwargs=dgp_kwargs,
+        dgp_cache=dgp_cache)
 
-    dgp_sampler = partial(_sample_dgp, dgp_sampler)
-
-    # Build a multiprocessing pool which exploits the parallelism in the DGP
-    # sampling. Use it to sample all DGPs.
+    # Sample all DGPs as a batch, which exploits the parallelism in the DGP
+    # sampling by splitting the batch into chunks over the processes.
 
     # TODO-MULTIPROC: refactor this multiprocessing approach.
     # Attempt to move to the compile expression itself
     if n_jobs == -1:
         n_jobs = cpu_count()
 
-    logger.info(f"Sampling DGPs using {n_jobs} processes")
+    if dgp_seed is not None:
+        # Seeded DGPs are sampled individually so that each one can be
+        # loaded from the DGP cache.
+        logger.info("Sampling seeded DGPs")
+        dgp_seeds = np.random.SeedSequence(dgp_seed).generate_state(num_dgp_samples)
+        dgps = [dgp_sampler.sample_dgp(seed=int(seed)) for seed in dgp_seeds]
+    else:
+        logger.info(f"Sampling DGPs using {n_jobs} processes")
+        dgps = dgp_sampler.sample_dgps(num_dgp_samples, n_jobs=n_jobs)
 
-    dgps = robust_parallel_map(
-        dgp_sampler,
-        range(num_dgp_samples),
+    return _benchmark_model_using_dgps(
+        dgps, model_class, estimand,
+        num_samples_from_dgp=num_samples_from_dgp,
+        num_sampling_runs_per_dgp=num_sampling_runs_per_dgp,
+        data_analysis_mode=data_analysis_mode,
+        data_metrics_spec=data_metrics_spec,
+        data_metric_intervals=data_metric_intervals,
+        data_metric_cost_report=data_metric_cost_report,
+        approximate_data_metrics=approximate_data_metrics,
         n_jobs=n_jobs)
 
-    # Data structures for storing the metric results for each sampled DGP.
-    performance_metric_dgp_results = defaultdict(list)
-    performance_metric_raw_run_results = defaultdict(list)
-    data_metric_dgp_results = defaultdict(list)
+def benchmark_model_using_dgp_bank(
+    dgp_bank,
+    model_class, estimand,
+    num_dgp_samples,
+    num_samples_from_dgp,
+    metric_ranges=None,
+    axis_levels=None,
+    target_metrics=None,
+    num_sampling_runs_per_dgp=1,
+    data_analysis_mode=False,
+    data_metrics_spec=None,
+    data_metric_intervals=False,
+    data_metric_cost_report=None,
+    approximate_data_metrics=False,
+    n_jobs=1):
+    """Benchmark a model using DGPs from a :class:`~maccabee.benchmarking.dgp_bank.DGPBank` rather than freshly sampled DGPs. The DGPs are selected by their banked data metric values so benchmarks against a region of the :term:`distributional problem space` start without any DGP sampling.
+
+    Args:
+        dgp_bank (:class:`~maccabee.benchmarking.dgp_bank.DGPBank`): The bank from which DGPs are drawn.
+        model_class (:class:`~maccabee.modeling.models.CausalModel`): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`.
+        estimand (string): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`.
+        num_dgp_samples (int): The number of DGPs to benchmark. If `target_metrics` is supplied, these are the nearest DGPs to the target. Otherwise, they are selected at random from the DGPs which meet the `metric_ranges` and `axis_levels` conditions. Fewer DGPs are used if the bank doesn't contain enough matches.
+        num_samples_from_dgp (int): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`.
+        metric_ranges (dict): See :meth:`~maccabee.benchmarking.dgp_bank.DGPBank.query_range`. Defaults to None.
+        axis_levels (dict): See :meth:`~maccabee.benchmarking.dgp_bank.DGPBank.query_range`. Defaults to None.
+        target_metrics (dict): See :meth:`~maccabee.benchmarking.dgp_bank.DGPBank.query_nearest`. If supplied, `metric_ranges` and `axis_levels` are ignored. Defaults to None.
+        num_sampling_runs_per_dgp (int): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. Defaults to 1.
+        data_analysis_mode (bool): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. Defaults to False.
+        data_metrics_spec (dict):  See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. Defaults to None.
+        data_metric_intervals (bool): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`. Defaults to False.
+        data_metric_cost_report (dict): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`. Defaults to None.
+        approximate_data_metrics (bool): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. Defaults to False.
+        n_jobs (int): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. Defaults to 1.
+
+    Returns:
+        tuple: See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`.
+
+    Raises:
+        UnknownEstimandException: If an unknown estimand is supplied.
+    """
+    if target_metrics is not None:
+        dgp_indices = dgp_bank.query_nearest(target_metrics, k=num_dgp_samples)
+    else:
+        matching_indices = dgp_bank.query_range(
+            metric_ranges=metric_ranges, axis_levels=axis_levels)
+        dgp_indices = np.random.choice(matching_indices,
+            size=min(num_dgp_samples, len(matching_indices)), replace=False)
+
+    if len(dgp_indices) < num_dgp_samples:
+        logger.warning(f"DGP bank only contains {len(dgp_indices)} matching DGPs. {num_dgp_samples} requested.")
+
+    logger.info(f"Benchmarking using {len(dgp_indices)} DGPs from the DGP bank")
+    dgps = dgp_bank.get_dgps(dgp_indices)
+
+    if n_jobs == -1:
+        n_jobs = cpu_count()
+
+    return _benchmark_model_using_dgps(
+        dgps, model_class, estimand,
+        num_samples_from_dgp=num_samples_from_dgp,
+        num_sampling_runs_per_dgp=num_sampling_runs_per_dgp,
+        data_analysis_mode=data_analysis_mode,
+        data_metrics_spec=data_metrics_spec,
+        data_metric_intervals=data_metric_intervals,
+        data_metric_cost_report=data_metric_cost_report,
+        approximate_data_metrics=approximate_data_metrics,
+        n_jobs=n_jobs)
+
+def benchmark_model_on_corpus(
+    corpus,
+    model_class, estimand,
+    num_samples_from_dgp=None,
+    num_sampling_runs_per_dgp=1,
+    dgp_indices=None,
+    data_analysis_mode=False,
+    data_metrics_spec=None,
+    data_metric_intervals=False,
+    data_metric_cost_report=None,
+    approximate_data_metrics=False,
+    n_jobs=1):
+    """Benchmark a model using the stored data sets in a :class:`~maccabee.benchmarking.dataset_corpus.DatasetCorpus` rather than data sets generated from freshly sampled DGPs. The data sets are read directly from the corpus's memory maps so new models are evaluated on exactly the same data as previously benchmarked models without any sampling cost. The sampling runs of each DGP use consecutive, non-overlapping, blocks of its stored data sets.
+
+    Args:
+        corpus (:class:`~maccabee.benchmarking.dataset_corpus.DatasetCorpus`): The corpus from which data sets are read.
+        model_class (:class:`~maccabee.modeling.models.CausalModel`): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`.
+        estimand (string): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`.
+        num_samples_from_dgp (int): The number of data sets per sampling run. Defaults to None, in which case all of the data sets of each DGP are split evenly between the sampling runs.
+        num_sampling_runs_per_dgp (int): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. Defaults to 1.
+        dgp_indices (list): The corpus indices of the DGPs to benchmark. Defaults to None, in which case all DGPs are used.
+        data_analysis_mode (bool): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. The data metrics can only be calculated if the corpus's data sets were generated in data analysis mode. Defaults to False.
+        data_metrics_spec (dict):  See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. Defaults to None.
+        data_metric_intervals (bool): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`. Defaults to False.
+        data_metric_cost_report (dict): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`. Defaults to None.
+        approximate_data_metrics (bool): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_concrete_dgp`. Defaults to False.
+        n_jobs (int): The number of processes on which to run the benchmark. Each process reads the corpus independently. If 0, the benchmark runs in the calling process. Defaults to 1.
+
+    Returns:
+        tuple: See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`. The final entry is the list of the corpus indices of the benchmarked DGPs rather than the DGPs.
+
+    Raises:
+        UnknownEstimandException: If an unknown estimand is supplied.
+        DatasetCorpusException: If a DGP has fewer stored data sets than the sampling runs require.
+    """
+    if dgp_indices is None:
+        dgp_indices = list(range(len(corpus)))
+
+    for dgp_index in dgp_indices:
+        n_required_datasets = num_sampling_runs_per_dgp*(num_samples_from_dgp or 1)
+        if corpus.get_n_datasets(dgp_index) < n_required_datasets:
+            raise DatasetCorpusException(
+                f"DGP {dgp_index} has {corpus.get_n_datasets(dgp_index)} data sets. {n_required_datasets} are required.")
+
+    if n_jobs == -1:
+        n_jobs = cpu_count()
+
+    logger.info(f"Benchmarking using {len(dgp_indices)} DGPs from the dataset corpus")
+    benchmark_dgp = partial(
+        _benchmark_model_using_corpus_dgp,
+        corpus=corpus,
+        model_class=model_class,
+        estimand=estimand,
+        num_sampling_runs_per_dgp=num_sampling_runs_per_dgp,
+        num_samples_from_dgp=num_samples_from_dgp,
+        data_analysis_mode=data_analysis_mode,
+        data_metrics_spec=data_metrics_spec,
+        approximate_data_metrics=approximate_data_metrics)
+
+    return _aggregate_dgp_benchmarks(
+        benchmark_dgp, dgp_indices, estimand,
+        data_analysis_mode=data_analysis_mode,
+        data_metric_intervals=data_metric_intervals,
+        data_metric_cost_report=data_metric_cost_report,
+        n_jobs=n_jobs) + (dgp_indices,)
+
+def _benchmark_model_using_corpus_dgp(dgp_index,
+    corpus, model_class, estimand,
+    num_sampling_runs_per_dgp, num_samples_from_dgp,
+    data_analysis_mode, data_metrics_spec, approximate_data_metrics,
+    data_metric_cost_report=None):
+    # The corpus equivalent of benchmark_model_using_concrete_dgp. The data
+    # sets of each sampling run are read from the corpus rather than
+    # generated and the model is fit in the current process.
+    if num_samples_from_dgp is None:
+        num_samples_from_dgp = corpus.get_n_datasets(dgp_index) // num_sampling_runs_per_dgp
+
+    perf_metric_names_and_funcs = _get_performance_metric_functions(estimand)
+
+    performance_metric_run_results = defaultdict(list)
+    data_metric_run_results = defaultdict(list)
+
+    thread_context = get_threading_context(1)
+    with thread_context():
+        for run_index in range(num_sampling_runs_per_dgp):
+            logger.debug(f"Starting corpus sampling run {run_index+1} for DGP {dgp_index}")
+            datasets = list(corpus.iter_datasets(dgp_index, range(
+                run_index*num_samples_from_dgp, (run_index+1)*num_samples_from_dgp)))
+
+            if model_class.supports_batch_fit():
+                models = model_class.fit_batch(datasets)
+            else:
+                models = []
+                for dataset in datasets:
+                    model = model_class(dataset)
+                    model.fit()
+                    models.append(model)
+
+            estimand_sample_results = [
+                (model.estimate(estimand=estimand), dataset.ground_truth(estimand=estimand))
+                for model, dataset in zip(models, datasets)
+            ]
+            estimate_vals = np.array([estimate for estimate, _ in estimand_sample_results])
+            true_vals = np.array([truth for _, truth in estimand_sample_results])
+
+            for metric_name, metric_func in perf_metric_names_and_funcs.items():
+                performance_metric_run_results[metric_name].append(metric_func(
+                    estimate_vals, true_vals))
+
+            if data_analysis_mode:
+                data_metrics_sample_results = defaultdict(list)
+                for data_metric_results in calculate_data_axis_metrics_batch(
+                    datasets,
+                    observation_spec=data_metrics_spec,
+                    flatten_result=True,
+                    cost_report=data_metric_cost_report,
+                    approximate=approximate_data_metrics):
+                    for axis_metric_name, axis_metric_val in data_metric_results.items():
+                        data_metrics_sample_results[axis_metric_name].append(
+                            axis_metric_val)
+
+                for axis_metric_name, vals in data_metrics_sample_results.items():
+                    data_metric_run_results[axis_metric_name].append(
+                        np.mean(vals))
+
+    return (_aggregate_metric_results(performance_metric_run_results),
+        performance_metric_run_results,
+        _aggregate_metric_results(data_metric_run_results, std=False),
+        data_metric_run_results)
+
+def _benchmark_model_using_dgps(dgps, model_class, estimand,
+    num_samples_from_dgp, num_sampling_runs_per_dgp,
+    data_analysis_mode, data_metrics_spec, data_metric_intervals,
+    data_metric_cost_report, approximate_data_metrics, n_jobs):
+    # Benchmark the model against each DGP in dgps and aggregate the
+    # results across DGPs. This is shared by the sampled DGP and DGP bank
+    # benchmarks.
 
     # Build benchmark executable. Note that parallelism is turned off
     # in this executable. Parallelism is at the DGP level.
@@ -388,15 +689,56 @@ def benchmark_model_using_sampled_dgp(
         num_samples_from_dgp=num_samples_from_dgp,
         data_analysis_mode=data_analysis_mode,
         data_metrics_spec=data_metrics_spec,
+        approximate_data_metrics=approximate_data_metrics,
         n_jobs=0)
 
-    n_benchmark_workers = min(n_jobs, num_dgp_samples)
+    return _aggregate_dgp_benchmarks(
+        benchmark_dgp, dgps, estimand,
+        data_analysis_mode=data_analysis_mode,
+        data_metric_intervals=data_metric_intervals,
+        data_metric_cost_report=data_metric_cost_report,
+        n_jobs=n_jobs) + (dgps,)
+
+def _aggregate_dgp_benchmarks(benchmark_dgp, dgps, estimand,
+    data_analysis_mode, data_metric_intervals, data_metric_cost_report, n_jobs):
+    # Run benchmark_dgp, which has the signature of
+    # benchmark_model_using_concrete_dgp, for each entry in dgps using
+    # n_jobs workers, or in this process if n_jobs is 0, and aggregate the
+    # results across DGPs.
+    perf_metric_names_and_funcs = _get_performance_metric_functions(estimand)
+    num_dgp_samples = len(dgps)
 
-    logger.info(f"Starting benchmarking with sampled DGPs using {n_benchmark_workers} workers.")
-    results_data = robust_parallel_map(
-        benchmark_dgp,
-        dgps,
-        n_jobs=n_jobs)
+    # Data structures for storing the metric results for each sampled DGP.
+    performance_metric_dgp_results = defaultdict(list)
+    performance_metric_raw_run_results = defaultdict(list)
+    data_metric_dgp_results = defaultdict(list)
+
+    if n_jobs == 0:
+        logger.info("Starting benchmarking with sampled DGPs using a single process.")
+        results_data_and_cost_reports = [
+            _benchmark_dgp_with_cost_report(benchmark_dgp, dgp)
+            for dgp in dgps
+        ]
+    elif n_jobs >= 1:
+        n_benchmark_workers = min(n_jobs, num_dgp_samples)
+
+        logger.info(f"Starting benchmarking with sampled DGPs using {n_benchmark_workers} workers.")
+        results_data_and_cost_reports = robust_parallel_map(
+            partial(_benchmark_dgp_with_cost_report, benchmark_dgp),
+            dgps,
+            n_jobs=n_jobs)
+    else:
+        raise ValueError("Invalid n_jobs value - should be integer from -1 to n")
+
+    # The cost reports are collected in the worker processes so they
+    # are merged here.
+    results_data = []
+    for res_data, dgp_cost_report in results_data_and_cost_reports:
+        results_data.append(res_data)
+        if data_metric_cost_report is not None:
+            for axis_metric_name, cost in dgp_cost_report.items():
+                data_metric_cost_report[axis_metric_name] = \
+                    data_metric_cost_report.get(axis_metric_name, 0) + cost
 
     # TODO remove
     # with Pool(processes=n_benchmark_workers, maxtasksperchild=1) as pool:
@@ -425,11 +767,13 @@ def benchmark_model_using_sampled_dgp(
             logger.debug(f"Done aggregate data metric collection for DGP {i+1}/{num_dgp_samples}")
 
     logger.info("Done benchmarking with sampled DGPs.")
+    if data_analysis_mode and data_metric_cost_report is not None:
+        _log_data_metric_cost_report(data_metric_cost_report)
 
     return (_aggregate_metric_results(performance_metric_dgp_results),
         performance_metric_dgp_results, performance_metric_raw_run_results,
         _aggregate_metric_results(data_metric_dgp_results, std=data_metric_intervals),
-        data_metric_dgp_results, dgps)
+        data_metric_dgp_results)
 
 
 def benchmark_model_using_sampled_dgp_grid(
@@ -441,16 +785,27 @@ def benchmark_model_using_sampled_dgp_grid(
     data_analysis_mode=False,
     data_metrics_spec=None,
     data_metric_intervals=True,
+    data_metric_cost_report=None,
+    approximate_data_metrics=False,
     param_overrides={},
     dgp_class=SampledDataGeneratingProcess,
     dgp_kwargs={},
     n_jobs=1,
-    compile_functions=False):
+    compile_functions=False,
+    coupled_sampling=False,
+    coupling_seed=None,
+    dgp_seed=None,
+    dgp_cache=None):
     """This function is a thin wrapper around the :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp` function. It is used to run the sampeld DGP benchmark across many different sampling parameter value combinations. The signature is the same as the wrapped function with `dgp_sampling_params` replaced by `dgp_param_grid` and the new `param_overrides` option. For all other arguments, see :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`.
 
     Args:
         dgp_param_grid (dict): A dictionary mapping :term:`data axis <distributional problem space axis>` names to a list of data axis levels. Axis names are available as constants in :class:`maccabee.constants.Constants.AxisNames` and axis levels available as constants in :class:`maccabee.constants.Constants.AxisLevels`. The :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp` function is called for each combination of axis level values - the cartesian product of the lists in the dictionary.
+        data_metric_cost_report (dict): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`. The times are accumulated across all parameter combinations. Defaults to None.
         param_overrides (dict): A dictionary mapping parameter names to values of those parameters. The values in this dict override the values in the grid and any default parameter values. For all available parameter names and allowed values, see the :download:`parameter_schema.yml </../../maccabee/parameters/parameter_schema.yml>` file.
+        coupled_sampling (bool): Indicates whether the DGPs at the different parameter combinations are sampled using coupled :class:`~maccabee.data_generation.coupled_sampler.CoupledDGPSampler` instances. If ``True``, the DGP components which depend only on parameters that are the same at two parameter combinations are sampled once and shared by the DGPs with the same index at both combinations. This reduces the sampling cost and the variance of comparisons between parameter combinations. Coupled DGPs are sampled in the main process. Defaults to ``False``.
+        coupling_seed (int): The seed of the coupled samplers. Only used if `coupled_sampling` is ``True``. Defaults to None, in which case a seed is drawn from the global random state.
+        dgp_seed (int): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`. The same seed is used at every parameter combination. Not used if `coupled_sampling` is ``True``. Defaults to None.
+        dgp_cache (:class:`~maccabee.data_generation.dgp_cache.DGPCache`): See :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_sampled_dgp`. Defaults to None.
 
     Returns:
         :class:`~pandas.DataFrame`: A :class:`~pandas.DataFrame` containing one row per axis level combination and a column for each axis and each performance and data metric (as well as their standard deviations).
@@ -458,6 +813,16 @@ def benchmark_model_using_sampled_dgp_grid(
 
     metric_param_results = defaultdict(list)
 
+    # The coupled samplers share a seed and a component cache across
+    # all the parameter combinations.
+    if coupled_sampling:
+        if coupling_seed is None:
+            coupling_seed = np.random.randint(2**31)
+        coupled_component_cache = {}
+
+        if n_jobs == -1:
+            n_jobs = cpu_count()
+
 
     # Iterate over all DGP sampler parameter configurations
     for param_spec in ParameterGrid(dgp_param_grid):
@@ -470,22 +835,48 @@ def benchmark_model_using_sampled_dgp_grid(
 
         # Run sampling benchmark.
         logger.info(f"Running benchmarking with params {param_spec} and {n_jobs} workers.")
-        param_performance_metric_data, _, _, param_data_metric_data, _, dgps = \
-            benchmark_model_using_sampled_dgp(
-                dgp_sampling_params=dgp_params,
-                data_source=data_source,
-                model_class=model_class,
-                estimand=estimand,
-                num_dgp_samples=num_dgp_samples,
-                num_sampling_runs_per_dgp=num_sampling_runs_per_dgp,
-                num_samples_from_dgp=num_samples_from_dgp,
-                data_analysis_mode=data_analysis_mode,
-                data_metrics_spec=data_metrics_spec,
-                data_metric_intervals=data_metric_intervals,
+        if coupled_sampling:
+            dgp_kwargs["compile_functions"] = compile_functions
+            dgp_sampler = CoupledDGPSampler(
+                dgp_params, data_source,
+                coupling_seed=coupling_seed,
+                component_cache=coupled_component_cache,
                 dgp_class=dgp_class,
-                dgp_kwargs=dgp_kwargs,
-                n_jobs=n_jobs,
-                compile_functions=compile_functions)
+                dgp_kwargs=dgp_kwargs)
+
+            param_performance_metric_data, _, _, param_data_metric_data, _, dgps = \
+                _benchmark_model_using_dgps(
+                    dgp_sampler.sample_dgps(num_dgp_samples),
+                    model_class, estimand,
+                    num_samples_from_dgp=num_samples_from_dgp,
+                    num_sampling_runs_per_dgp=num_sampling_runs_per_dgp,
+                    data_analysis_mode=data_analysis_mode,
+                    data_metrics_spec=data_metrics_spec,
+                    data_metric_intervals=data_metric_intervals,
+                    data_metric_cost_report=data_metric_cost_report,
+                    approximate_data_metrics=approximate_data_metrics,
+                    n_jobs=n_jobs)
+        else:
+            param_performance_metric_data, _, _, param_data_metric_data, _, dgps = \
+                benchmark_model_using_sampled_dgp(
+                    dgp_sampling_params=dgp_params,
+                    data_source=data_source,
+                    model_class=model_class,
+                    estimand=estimand,
+                    num_dgp_samples=num_dgp_samples,
+                    num_sampling_runs_per_dgp=num_sampling_runs_per_dgp,
+                    num_samples_from_dgp=num_samples_from_dgp,
+                    data_analysis_mode=data_analysis_mode,
+                    data_metrics_spec=data_metrics_spec,
+                    data_metric_intervals=data_metric_intervals,
+                    data_metric_cost_report=data_metric_cost_report,
+                    approximate_data_metrics=approximate_data_metrics,
+                    dgp_class=dgp_class,
+                    dgp_kwargs=dgp_kwargs,
+                    n_jobs=n_jobs,
+                    compile_functions=compile_functions,
+                    dgp_seed=dgp_seed,
+                    dgp_cache=dgp_cache)
 
 
         # Store the params for this run in the results dict
@@ -0,0 +1,374 @@
+"""This submodule contains the :class:`~maccabee.benchmarking.dataset_corpus.DatasetCorpus` class. A dataset corpus is a persistent, local store of sampled :term:`DGPs <DGP>` and the data sets generated from them. New estimators can be benchmarked against the data sets in a corpus, using :func:`~maccabee.benchmarking.benchmarking.benchmark_model_on_corpus`, without resampling DGPs or regenerating data. This ensures that all estimators are evaluated on exactly the same data and limits the cost of benchmarking to reading the data and fitting the estimator.
+
+The corpus is stored in a directory which contains a manifest file and a set of NumPy array files for each DGP:
+
+* The DGP variables which are shared by all of the data sets sampled from the DGP - the covariates and the cached, deterministic, DGP variables like the potential outcomes - are stored once, one array file per variable.
+* The stochastic DGP variables, like the treatment assignment and observed outcome, are stored in a single array file with one ``(n_variables, n_observations)`` block per data set.
+* The DGP itself is stored, if possible, in the compact format of :mod:`maccabee.data_generation.serialization`.
+
+All arrays are stored as ``float64`` and are opened as read-only memory maps. The original dtype of each variable, and of each column of the covariate DataFrames, is recorded in the manifest so that discrete variables, like the ``int8`` treatment assignment and compact discrete covariates, are restored with their dtype. Floating point data is built as views of the memory maps, without copying, so it is read at I/O speed and only the data which is used is loaded. Discrete data is small and is copied into its original dtype when it is read. As the files are never modified after they are written, many processes can read a corpus concurrently and share the operating system's page cache. The corpus is grown by a single writer. New DGPs are visible to readers after they call :meth:`~maccabee.benchmarking.dataset_corpus.DatasetCorpus.refresh`.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from ..constants import Constants
+from ..exceptions import DatasetCorpusException, DGPSerializationException
+from ..data_generation import GeneratedDataSet, SampledDataGeneratingProcess
+from ..data_generation.serialization import save_dgps, load_dgps
+
+from ..logging import get_logger
+logger = get_logger(__name__)
+
+DGPVariables = Constants.DGPVariables
+
+#: The version of the corpus manifest format.
+DATASET_CORPUS_FORMAT_VERSION = 1
+
+MANIFEST_FILE_NAME = "manifest.json"
+
+# The number of DGPs whose memory maps are kept open.
+_OPEN_DGP_CACHE_SIZE = 16
+
+def _restore_dtype(values, dtype):
+    # Convert stored float64 values back to the dtype of the original
+    # variable. Floating point values are returned as views of the memory
+    # map rather than copied.
+    dtype = np.dtype(dtype)
+    if dtype == values.dtype:
+        return values
+    return values.astype(dtype)
+
+def _build_data_frame(values, columns, dtypes, index):
+    # Build a DataFrame from a stored 2D array, restoring the dtype of each
+    # column. Corpora written without column dtypes are read as float64.
+    if dtypes is None or all(np.dtype(dtype) == values.dtype for dtype in dtypes):
+        return pd.DataFrame(values, columns=columns, index=index, copy=False)
+
+    data_frame = pd.DataFrame({
+        column_index: _restore_dtype(values[:, column_index], dtype)
+        for column_index, dtype in enumerate(dtypes)
+    }, index=index, copy=False)
+    data_frame.columns = columns
+    return data_frame
+
+class DatasetCorpus():
+    """A persistent corpus of sampled DGPs and generated data sets. Opening a directory which already contains a corpus loads its manifest. The data is only read when data sets are accessed.
+
+    Args:
+        path (str): The path to the directory in which the corpus is stored. The directory is created if it doesn't exist.
+
+    Attributes:
+        path
+
+    Raises:
+        DatasetCorpusException: If the existing corpus in `path` has an unsupported format version.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._open_dgps = {}
+
+        os.makedirs(path, exist_ok=True)
+
+        if os.path.exists(self._manifest_path()):
+            self.refresh()
+        else:
+            self._manifest = {
+                "version": DATASET_CORPUS_FORMAT_VERSION,
+                "dgps": []
+            }
+
+    def __len__(self):
+        return len(self._manifest["dgps"])
+
+    def __getstate__(self):
+        # Corpora are sent to worker processes by path. The workers open
+        # their own memory maps.
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def _manifest_path(self):
+        return os.path.join(self.path, MANIFEST_FILE_NAME)
+
+    def refresh(self):
+        """Reload the manifest from disk. This picks up DGPs added by another process using the same corpus directory.
+
+        Raises:
+            DatasetCorpusException: See the class docs.
+        """
+        with open(self._manifest_path(), "r") as manifest_file:
+            manifest = json.load(manifest_file)
+
+        if manifest["version"] != DATASET_CORPUS_FORMAT_VERSION:
+            raise DatasetCorpusException(
+                f"Unsupported dataset corpus format version {manifest['version']}.")
+
+        self._manifest = manifest
+
+    def _write_manifest(self):
+        # The manifest is replaced atomically so readers never see a
+        # partial corpus.
+        temp_manifest_path = self._manifest_path() + ".tmp"
+        with open(temp_manifest_path, "w") as manifest_file:
+            json.dump(self._manifest, manifest_file)
+        os.replace(temp_manifest_path, self._manifest_path())
+
+    def add_dgp(self, dgp, n_datasets, seed=None):
+        """Generate `n_datasets` data sets from `dgp` and add the DGP and the data sets to the corpus. The data sets are generated with the DGP's current data analysis mode. Enable data analysis mode if the corpus will be used to calculate data metrics.
+
+        Args:
+            dgp (:class:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess`): The DGP. Sampled DGPs are stored with the data sets and can be recovered with :meth:`~maccabee.benchmarking.dataset_corpus.DatasetCorpus.load_dgp`. Other DGPs are not stored.
+            n_datasets (int): The number of data sets to generate.
+            seed (int): A seed from which the seeds of the data sets are derived. Defaults to None, in which case fresh entropy is used.
+
+        Returns:
+            int: The index of the DGP in the corpus.
+
+        Raises:
+            ValueError: If `n_datasets` is smaller than 1.
+        """
+        if n_datasets < 1:
+            raise ValueError(f"n_datasets must be at least 1, got {n_datasets}.")
+
+        dgp_index = len(self)
+        file_prefix = f"dgp-{dgp_index:06d}"
+        dataset_seeds = np.random.SeedSequence(seed).generate_state(n_datasets)
+        shared_dgp_variables = type(dgp)._get_cached_dgp_variables()
+
+        dgp_record = {
+            "n_datasets": n_datasets,
+            "dataset_seeds": dataset_seeds.tolist(),
+            "dgp": None,
+            "index": None,
+            "shared": {},
+            "scalars": {},
+            "sampled": [],
+            "sampled_dtypes": [],
+            "samples": f"{file_prefix}-samples.npy"
+        }
+
+        samples = None
+        for dataset_index, dataset_seed in enumerate(dataset_seeds):
+            dataset = dgp.generate_dataset(seed=dataset_seed)
+
+            if samples is None:
+                # Store the shared variables and create the sample array
+                # based on the variables in the first data set.
+                dgp_record["n_observations"] = len(dataset.X)
+                dgp_record["index"] = f"{file_prefix}-index.npy"
+                np.save(os.path.join(self.path, dgp_record["index"]),
+                    np.asarray(dataset.X.index, dtype=np.int64))
+
+                for dgp_var_name in DGPVariables.all().values():
+                    try:
+                        dgp_var_value = dataset.get_dgp_variable(dgp_var_name)
+                    except Exception:
+                        continue
+
+                    if np.ndim(dgp_var_value) == 0:
+                        dgp_record["scalars"][dgp_var_name] = float(dgp_var_value)
+                    elif np.ndim(dgp_var_value) == 2 or dgp_var_name in shared_dgp_variables:
+                        variable_file = f"{file_prefix}-{dgp_var_name}.npy"
+                        np.save(os.path.join(self.path, variable_file),
+                            np.asarray(dgp_var_value, dtype=np.float64))
+                        if isinstance(dgp_var_value, pd.DataFrame):
+                            columns = list(map(str, dgp_var_value.columns))
+                            dtypes = [dtype.str for dtype in dgp_var_value.dtypes]
+                        else:
+                            columns = None
+                            dtypes = np.asarray(dgp_var_value).dtype.str
+                        dgp_record["shared"][dgp_var_name] = {
+                            "file": variable_file,
+                            "columns": columns,
+                            "dtypes": dtypes
+                        }
+                    else:
+                        dgp_record["sampled"].append(dgp_var_name)
+
+                # The observed outcome variables are stored first, as they
+                # are in generated data sets.
+                dgp_record["sampled"].sort(key=lambda dgp_var_name: (
+                    dgp_var_name != DGPVariables.TREATMENT_ASSIGNMENT_NAME,
+                    dgp_var_name != DGPVariables.OBSERVED_OUTCOME_NAME))
+                dgp_record["sampled_dtypes"] = [
+                    np.asarray(dataset.get_dgp_variable(dgp_var_name)).dtype.str
+                    for dgp_var_name in dgp_record["sampled"]]
+
+                samples = np.lib.format.open_memmap(
+                    os.path.join(self.path, dgp_record["samples"]), mode="w+",
+                    dtype=np.float64,
+                    shape=(n_datasets, len(dgp_record["sampled"]), dgp_record["n_observations"]))
+
+            for row, dgp_var_name in enumerate(dgp_record["sampled"]):
+                samples[dataset_index, row] = dataset.get_dgp_variable_array(dgp_var_name)
+
+        samples.flush()
+        del samples
+
+        if isinstance(dgp, SampledDataGeneratingProcess):
+            try:
+                dgp_record["dgp"] = f"{file_prefix}-dgp.npz"
+                save_dgps(os.path.join(self.path, dgp_record["dgp"]), [dgp])
+            except DGPSerializationException:
+                logger.warning(f"DGP {dgp_index} can't be serialized. Only its data sets are stored in the corpus.")
+                dgp_record["dgp"] = None
+
+        self._manifest["dgps"].append(dgp_record)
+        self._write_manifest()
+
+        logger.info(f"Added DGP {dgp_index} with {n_datasets} data sets to the dataset corpus.")
+        return dgp_index
+
+    def add_sampled_dgps(self, dgp_sampler, n_dgps, n_datasets_per_dgp, seed=None,
+        data_analysis_mode=False):
+        """Sample `n_dgps` DGPs using `dgp_sampler` and add each of them to the corpus, with `n_datasets_per_dgp` data sets, using :meth:`~maccabee.benchmarking.dataset_corpus.DatasetCorpus.add_dgp`.
+
+        Args:
+            dgp_sampler (:class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler`): The sampler used to sample DGPs.
+            n_dgps (int): The number of DGPs to sample.
+            n_datasets_per_dgp (int): The number of data sets generated from each DGP.
+            seed (int): A seed from which the seeds of the DGPs and data sets are derived. If supplied, the DGPs are sampled with :meth:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler.sample_dgp` using their own seeds. Defaults to None, in which case the DGPs are sampled using the global random state.
+            data_analysis_mode (bool): The data analysis mode in which the data sets are generated. Defaults to False.
+
+        Returns:
+            list: The corpus indices of the added DGPs.
+        """
+        if seed is None:
+            dgps = dgp_sampler.sample_dgps(n_dgps)
+            dataset_seeds = [None]*n_dgps
+        else:
+            dgp_seeds, dataset_seeds = np.random.SeedSequence(seed).generate_state(
+                2*n_dgps).reshape(2, n_dgps)
+            dgps = [dgp_sampler.sample_dgp(seed=dgp_seed) for dgp_seed in dgp_seeds]
+
+        dgp_indices = []
+        for dgp, dataset_seed in zip(dgps, dataset_seeds):
+            dgp.set_data_analysis_mode(data_analysis_mode)
+            dgp_indices.append(self.add_dgp(dgp, n_datasets_per_dgp, seed=dataset_seed))
+
+        return dgp_indices
+
+    def _get_dgp_record(self, dgp_index):
+        try:
+            return self._manifest["dgps"][dgp_index]
+        except IndexError:
+            raise DatasetCorpusException(f"The dataset corpus has no DGP {dgp_index}.")
+
+    def _open_dgp(self, dgp_index):
+        # Open the memory maps of a DGP's arrays, keeping the maps of
+        # recently used DGPs open.
+        if dgp_index not in self._open_dgps:
+            dgp_record = self._get_dgp_record(dgp_index)
+
+            def open_array(file_name):
+                return np.load(os.path.join(self.path, file_name), mmap_mode="r")
+
+            index = pd.Index(open_array(dgp_record["index"]))
+            shared_data = {}
+            for dgp_var_name, variable_record in dgp_record["shared"].items():
+                values = open_array(variable_record["file"])
+                dtypes = variable_record.get("dtypes", None)
+                if variable_record["columns"] is not None:
+                    values = _build_data_frame(
+                        values, variable_record["columns"], dtypes, index)
+                elif dtypes is not None:
+                    values = _restore_dtype(values, dtypes)
+                shared_data[dgp_var_name] = values
+
+            if len(self._open_dgps) >= _OPEN_DGP_CACHE_SIZE:
+                self._open_dgps.pop(next(iter(self._open_dgps)))
+            self._open_dgps[dgp_index] = (
+                shared_data, open_array(dgp_record["samples"]))
+
+        return self._open_dgps[dgp_index]
+
+    def get_n_datasets(self, dgp_index):
+        """Returns the number of data sets stored for the DGP with index `dgp_index`.
+
+        Args:
+            dgp_index (int): The corpus index of the DGP.
+
+        Returns:
+            int: The number of data sets.
+        """
+        return self._get_dgp_record(dgp_index)["n_datasets"]
+
+    def get_dataset(self, dgp_index, dataset_index):
+        """Returns a stored data set. The DGP variables of the data set are read-only views of the corpus's memory maps.
+
+        Args:
+            dgp_index (int): The corpus index of the DGP.
+            dataset_index (int): The index of the data set among the data sets of the DGP.
+
+        Returns:
+            :class:`~maccabee.data_generation.generated_data_set.GeneratedDataSet`: The data set.
+
+        Raises:
+            DatasetCorpusException: If there is no such data set in the corpus.
+        """
+        dgp_record = self._get_dgp_record(dgp_index)
+        if not 0 <= dataset_index < dgp_record["n_datasets"]:
+            raise DatasetCorpusException(
+                f"DGP {dgp_index} has no data set {dataset_index}.")
+
+        shared_data, samples = self._open_dgp(dgp_index)
+
+        dgp_variable_dict = dict(shared_data)
+        dgp_variable_dict.update(dgp_record["scalars"])
+        sampled_dtypes = dgp_record.get(
+            "sampled_dtypes", [np.float64]*len(dgp_record["sampled"]))
+        dgp_variable_dict.update(
+            (dgp_var_name, _restore_dtype(values, dtype))
+            for dgp_var_name, values, dtype in zip(
+                dgp_record["sampled"], samples[dataset_index], sampled_dtypes))
+
+        # All variables are passed as shared so that the data set holds
+        # references to the memory maps rather than copies.
+        return GeneratedDataSet(dgp_variable_dict,
+            shared_dgp_variables=frozenset(dgp_variable_dict))
+
+    def iter_datasets(self, dgp_index, dataset_indices=None):
+        """Iterate over the stored data sets of a DGP using :meth:`~maccabee.benchmarking.dataset_corpus.DatasetCorpus.get_dataset`.
+
+        Args:
+            dgp_index (int): The corpus index of the DGP.
+            dataset_indices (list): The indices of the data sets. Defaults to None, in which case all of the DGP's data sets are returned.
+
+        Yields:
+            :class:`~maccabee.data_generation.generated_data_set.GeneratedDataSet`: The data sets, in order.
+        """
+        if dataset_indices is None:
+            dataset_indices = range(self.get_n_datasets(dgp_index))
+
+        for dataset_index in dataset_indices:
+            yield self.get_dataset(dgp_index, dataset_index)
+
+    def load_dgp(self, dgp_index, data_source=None,
+        dgp_class=SampledDataGeneratingProcess, dgp_kwargs={}):
+        """Load a stored DGP. See :func:`~maccabee.data_generation.serialization.load_dgps`.
+
+        Args:
+            dgp_index (int): The corpus index of the DGP.
+            data_source (:class:`~maccabee.data_sources.data_sources.DataSource`): The data source of the DGP. Defaults to None.
+            dgp_class (:class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`): The class of the loaded DGP. Defaults to :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`.
+            dgp_kwargs (dict): Keyword arguments passed to the loaded DGP. Defaults to {}.
+
+        Returns:
+            :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`: The DGP.
+
+        Raises:
+            DatasetCorpusException: If the DGP was not stored in the corpus.
+        """
+        dgp_record = self._get_dgp_record(dgp_index)
+        if dgp_record["dgp"] is None:
+            raise DatasetCorpusException(f"DGP {dgp_index} is not stored in the corpus.")
+
+        dgp, = load_dgps(os.path.join(self.path, dgp_record["dgp"]),
+            data_source=data_source, dgp_class=dgp_class, dgp_kwargs=dgp_kwargs)
+        return dgp
@@ -0,0 +1,498 @@
+"""This submodule contains the :class:`~maccabee.benchmarking.dgp_bank.DGPBank` class. A DGP bank is a persistent, local, corpus of sampled :term:`DGPs <DGP>` which are stored alongside the realized values of their :term:`data metrics <data metric>`. The bank is indexed by these metric values, which are the coordinates of the DGPs in the :term:`distributional problem space`. This allows DGPs at a target location in the space to be retrieved directly, rather than sampled using axis-level parameters in the hope that the realized metrics land near the target.
+
+The bank is stored in a directory which contains a manifest file and a series of shards. Each shard holds a batch of DGPs, saved using the compact format in :mod:`maccabee.data_generation.serialization`, and an array of their metric values. The bank is grown by adding shards, either directly or incrementally in a background thread using :meth:`~maccabee.benchmarking.dgp_bank.DGPBank.grow_in_background`. DGPs from the bank can be benchmarked using :func:`~maccabee.benchmarking.benchmarking.benchmark_model_using_dgp_bank`.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.stats import rankdata
+
+from ..constants import Constants
+from ..exceptions import DGPBankException
+from ..data_analysis import calculate_data_axis_metrics
+from ..data_analysis.data_metrics import get_data_metric_direction
+from ..data_generation import SampledDataGeneratingProcess
+from ..data_generation.serialization import save_dgps, load_dgps, get_data_source_fingerprint
+
+from ..logging import get_logger
+logger = get_logger(__name__)
+
+#: The version of the bank manifest format.
+DGP_BANK_FORMAT_VERSION = 1
+
+MANIFEST_FILE_NAME = "manifest.json"
+
+# The file which is locked while the manifest is updated.
+_LOCK_FILE_NAME = "manifest.lock"
+
+# The number of loaded shards which are kept in memory.
+_LOADED_SHARD_CACHE_SIZE = 4
+
+# The quantiles of the bank's axis scores which separate the axis levels.
+_AXIS_LEVEL_QUANTILES = {
+    Constants.AxisLevels.LOW: (0, 1/3),
+    Constants.AxisLevels.MEDIUM: (1/3, 2/3),
+    Constants.AxisLevels.HIGH: (2/3, 1)
+}
+
+class DGPBank():
+    """A persistent bank of sampled DGPs indexed by their data metric values. Opening a directory which already contains a bank loads its manifest and metric values. The DGPs themselves are only loaded when they are retrieved by a query.
+
+    Args:
+        path (str): The path to the directory in which the bank is stored. The directory is created if it doesn't exist.
+        data_source (:class:`~maccabee.data_sources.data_sources.DataSource`): The data source of the DGPs in the bank. All DGPs in a bank must share a data source, which must match the one used to create the bank.
+        data_metrics_spec (dict): The data metrics which are calculated for each DGP and used to index the bank. See :func:`~maccabee.data_analysis.data_analysis.calculate_data_axis_metrics`. Only used when the bank is created, after which the metrics are read from the manifest. Defaults to None, in which case all metrics are calculated.
+        n_metric_datasets (int): The number of data sets sampled from each DGP to calculate its metric values. The values are averaged over the data sets. Defaults to 1.
+        dgp_class (:class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`): The class of the DGPs loaded from the bank. Defaults to :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`.
+        dgp_kwargs (dict): Keyword arguments passed to the DGPs loaded from the bank. Defaults to {}.
+
+    Attributes:
+        path
+        data_source
+        metric_names: The flattened names of the metrics which index the bank.
+
+    Raises:
+        DGPBankException: If the existing bank in `path` has an unsupported format version or was built with a different data source.
+    """
+
+    def __init__(self, path, data_source, data_metrics_spec=None,
+        n_metric_datasets=1,
+        dgp_class=SampledDataGeneratingProcess, dgp_kwargs={}):
+
+        self.path = path
+        self.data_source = data_source
+        self.data_metrics_spec = data_metrics_spec
+        self.n_metric_datasets = n_metric_datasets
+        self.dgp_class = dgp_class
+        self.dgp_kwargs = dgp_kwargs
+
+        self._lock = threading.RLock()
+        self._growth_stop_event = threading.Event()
+        self._growth_thread = None
+        self._loaded_shards = OrderedDict()
+
+        os.makedirs(path, exist_ok=True)
+        self._data_source_fingerprint = get_data_source_fingerprint(data_source)
+
+        if os.path.exists(self._manifest_path()):
+            self.refresh()
+        else:
+            self._manifest = {
+                "version": DGP_BANK_FORMAT_VERSION,
+                "data_source_fingerprint": self._data_source_fingerprint,
+                "data_metrics_spec": data_metrics_spec,
+                "metric_names": None,
+                "shards": []
+            }
+            self.metric_names = None
+            self._metric_values = np.empty((0, 0))
+            self._dgp_locations = np.empty((0, 2), dtype=int)
+            self._index_cache = {}
+
+    def __len__(self):
+        return len(self._dgp_locations)
+
+    def _manifest_path(self):
+        return os.path.join(self.path, MANIFEST_FILE_NAME)
+
+    @contextmanager
+    def _manifest_file_lock(self):
+        # Hold an exclusive lock on the bank's lock file so that only one
+        # process updates the manifest at a time. The lock is released by
+        # the operating system if the process exits.
+        with open(os.path.join(self.path, _LOCK_FILE_NAME), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def refresh(self):
+        """Reload the bank from disk. This picks up shards added by other processes using the same bank directory. Any number of processes can add DGPs to the same bank. Shards are written under unique names and the manifest is updated while holding a lock on a file in the bank directory.
+
+        Raises:
+            DGPBankException: See the class docs.
+        """
+        with self._lock:
+            with open(self._manifest_path(), "r") as manifest_file:
+                manifest = json.load(manifest_file)
+
+            if manifest["version"] != DGP_BANK_FORMAT_VERSION:
+                raise DGPBankException(
+                    f"Unsupported DGP bank format version {manifest['version']}.")
+
+            if manifest["data_source_fingerprint"] != self._data_source_fingerprint:
+                raise DGPBankException(
+                    "The supplied data source does not match the data source of the DGP bank.")
+
+            self._manifest = manifest
+            self.metric_names = manifest["metric_names"]
+            self.data_metrics_spec = manifest["data_metrics_spec"]
+
+            # Load the metric values of all shards and record the
+            # (shard, position) location of each DGP.
+            metric_arrays = []
+            dgp_locations = []
+            for shard_index, shard in enumerate(manifest["shards"]):
+                metric_arrays.append(np.load(os.path.join(self.path, shard["metrics"])))
+                dgp_locations.extend(
+                    (shard_index, position) for position in range(shard["n_dgps"]))
+
+            if len(metric_arrays) > 0:
+                self._metric_values = np.vstack(metric_arrays)
+            else:
+                self._metric_values = np.empty((0, 0))
+            self._dgp_locations = np.array(dgp_locations, dtype=int).reshape((-1, 2))
+            self._index_cache = {}
+
+    def _calculate_dgp_metrics(self, dgp):
+        # Calculate the metric values of a DGP, averaged over
+        # n_metric_datasets sampled data sets. Metrics which can't be
+        # calculated for a (degenerate) data set are None. These are
+        # excluded from the average, and metrics which are missing for all
+        # the data sets are stored as NaN.
+        metric_results = [
+            calculate_data_axis_metrics(
+                dgp.generate_dataset(),
+                observation_spec=self.data_metrics_spec,
+                flatten_result=True)
+            for _ in range(self.n_metric_datasets)
+        ]
+
+        dgp_metrics = {}
+        for metric_name in metric_results[0]:
+            metric_values = np.array([
+                np.nan if result[metric_name] is None else result[metric_name]
+                for result in metric_results
+            ], dtype=float)
+
+            if np.all(np.isnan(metric_values)):
+                dgp_metrics[metric_name] = np.nan
+            else:
+                dgp_metrics[metric_name] = np.nanmean(metric_values)
+
+        return dgp_metrics
+
+    def add_dgps(self, dgps):
+        """Calculate the metric values of the DGPs in `dgps` and add them to the bank as a new shard. DGPs for which the metrics can't be calculated are skipped with a warning.
+
+        Args:
+            dgps (list): A list of :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess` instances built on the bank's data source.
+
+        Returns:
+            int: The number of DGPs added.
+        """
+        banked_dgps = []
+        banked_metrics = []
+        for dgp in dgps:
+            try:
+                banked_metrics.append(self._calculate_dgp_metrics(dgp))
+                banked_dgps.append(dgp)
+            except Exception:
+                logger.warning("Skipping DGP with failed data metric calculation.", exc_info=True)
+
+        if len(banked_dgps) == 0:
+            return 0
+
+        with self._lock, self._manifest_file_lock():
+            # Reload the manifest to include the shards added by other
+            # processes since the bank was last loaded.
+            if os.path.exists(self._manifest_path()):
+                self.refresh()
+
+            if self.metric_names is None:
+                self.metric_names = sorted(banked_metrics[0].keys())
+                self._manifest["metric_names"] = self.metric_names
+
+            metric_values = np.array([
+                [metrics.get(metric_name, np.nan) for metric_name in self.metric_names]
+                for metrics in banked_metrics
+            ], dtype=float)
+
+            # Write the shard files under unique names and then the manifest.
+            # The manifest is replaced atomically so readers never see a
+            # partial bank.
+            shard_name = f"shard-{uuid.uuid4().hex}"
+            shard = {
+                "dgps": f"{shard_name}-dgps.npz",
+                "metrics": f"{shard_name}-metrics.npy",
+                "n_dgps": len(banked_dgps)
+            }
+            save_dgps(os.path.join(self.path, shard["dgps"]), banked_dgps)
+            np.save(os.path.join(self.path, shard["metrics"]), metric_values)
+
+            self._manifest["shards"].append(shard)
+            temp_manifest_path = f"{self._manifest_path()}.{uuid.uuid4().hex}.tmp"
+            with open(temp_manifest_path, "w") as manifest_file:
+                json.dump(self._manifest, manifest_file)
+            os.replace(temp_manifest_path, self._manifest_path())
+
+            # Update the in-memory index.
+            shard_index = len(self._manifest["shards"]) - 1
+            if len(self._metric_values) == 0:
+                self._metric_values = metric_values
+            else:
+                self._metric_values = np.vstack([self._metric_values, metric_values])
+            self._dgp_locations = np.vstack([
+                self._dgp_locations,
+                [(shard_index, position) for position in range(len(banked_dgps))]
+            ])
+            self._index_cache = {}
+
+        logger.info(f"Added {len(banked_dgps)} DGPs to the DGP bank. Bank size: {len(self)}")
+        return len(banked_dgps)
+
+    def grow(self, dgp_sampler, n_dgps, batch_size=100):
+        """Sample `n_dgps` DGPs using `dgp_sampler` and add them to the bank in batches of size `batch_size`.
+
+        Args:
+            dgp_sampler (:class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler`): The sampler used to sample DGPs. This must use the bank's data source.
+            n_dgps (int): The number of DGPs to sample.
+            batch_size (int): The number of DGPs sampled and stored in each shard. Defaults to 100.
+
+        Returns:
+            int: The number of DGPs added.
+        """
+        n_added = 0
+        n_sampled = 0
+        while n_sampled < n_dgps and not self._growth_stop_event.is_set():
+            n_batch_dgps = min(batch_size, n_dgps - n_sampled)
+            n_added += self.add_dgps(dgp_sampler.sample_dgps(n_batch_dgps))
+            n_sampled += n_batch_dgps
+
+        return n_added
+
+    def grow_in_background(self, dgp_sampler, n_dgps, batch_size=100):
+        """Grow the bank, as in :meth:`~maccabee.benchmarking.dgp_bank.DGPBank.grow`, in a background thread. The bank can be queried while it grows. New DGPs become available after each batch.
+
+        Args:
+            dgp_sampler (:class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler`): See :meth:`~maccabee.benchmarking.dgp_bank.DGPBank.grow`.
+            n_dgps (int): See :meth:`~maccabee.benchmarking.dgp_bank.DGPBank.grow`.
+            batch_size (int): See :meth:`~maccabee.benchmarking.dgp_bank.DGPBank.grow`. Defaults to 100.
+
+        Returns:
+            :class:`threading.Thread`: The background thread.
+
+        Raises:
+            DGPBankException: If the bank is already growing in the background.
+        """
+        if self.is_growing():
+            raise DGPBankException("The DGP bank is already growing in the background.")
+
+        self._growth_stop_event.clear()
+        self._growth_thread = threading.Thread(
+            target=self.grow,
+            args=(dgp_sampler, n_dgps, batch_size),
+            daemon=True)
+        self._growth_thread.start()
+
+        return self._growth_thread
+
+    def is_growing(self):
+        """Returns ``True`` if the bank is growing in the background."""
+        return self._growth_thread is not None and self._growth_thread.is_alive()
+
+    def stop_growth(self, wait=True):
+        """Stop background growth after the current batch.
+
+        Args:
+            wait (bool): Whether to wait for the background thread to finish. Defaults to True.
+        """
+        self._growth_stop_event.set()
+        if wait and self._growth_thread is not None:
+            self._growth_thread.join()
+
+    def get_metric_values(self):
+        """Returns the metric values of all DGPs in the bank.
+
+        Returns:
+            :class:`numpy.ndarray`: An array with one row per DGP and one column per metric in :attr:`metric_names`.
+        """
+        return self._metric_values
+
+    def _get_metric_column(self, metric_name):
+        if self.metric_names is None or metric_name not in self.metric_names:
+            raise DGPBankException(f"Unknown DGP bank metric {metric_name}.")
+        return self.metric_names.index(metric_name)
+
+    def _get_axis_metric_names(self, axis_or_metric_name):
+        # The flattened names of the bank metrics of an axis, or the single
+        # metric with the given flattened name.
+        if self.metric_names is not None and axis_or_metric_name in self.metric_names:
+            return [axis_or_metric_name]
+
+        metric_names = [
+            metric_name for metric_name in (self.metric_names or [])
+            if metric_name.startswith(axis_or_metric_name + " ")
+        ]
+        if len(metric_names) == 0:
+            raise DGPBankException(
+                f"Unknown DGP bank metric or axis {axis_or_metric_name}.")
+        return metric_names
+
+    def get_axis_scores(self, axis_or_metric_name):
+        """Calculate the position of each DGP in the bank along an axis. The values of each metric of the axis are converted to percentile ranks within the bank, which are reversed for metrics which decrease as the axis level increases (see :func:`~maccabee.data_analysis.data_metrics.get_data_metric_direction`). The score of a DGP is the mean of its ranks over the metrics with known values.
+
+        Args:
+            axis_or_metric_name (str): An axis name or a flattened metric name, in which case only that metric is used.
+
+        Returns:
+            :class:`numpy.ndarray`: The score of each DGP, between 0 and 1. Higher scores correspond to higher axis levels. DGPs without values for any of the metrics have a NaN score.
+
+        Raises:
+            DGPBankException: If the axis or metric is not in the bank.
+        """
+        metric_ranks = []
+        for metric_name in self._get_axis_metric_names(axis_or_metric_name):
+            values = self._metric_values[:, self._get_metric_column(metric_name)]
+            known_values = np.isfinite(values)
+
+            ranks = np.full(len(values), np.nan)
+            ranks[known_values] = (rankdata(values[known_values]) - 0.5)/max(1, np.sum(known_values))
+
+            # Flattened metric names are made up of the axis name, which
+            # contains no spaces, and the metric name.
+            axis_name, axis_metric_name = metric_name.split(" ", 1)
+            try:
+                direction = get_data_metric_direction(axis_name, axis_metric_name)
+            except (KeyError, ValueError):
+                direction = 1
+            metric_ranks.append(ranks if direction >= 0 else 1 - ranks)
+
+        metric_ranks = np.array(metric_ranks)
+        known_ranks = np.isfinite(metric_ranks)
+        n_known_ranks = np.sum(known_ranks, axis=0)
+        with np.errstate(invalid="ignore"):
+            return np.where(n_known_ranks > 0,
+                np.sum(np.where(known_ranks, metric_ranks, 0), axis=0)/n_known_ranks,
+                np.nan)
+
+    def _get_level_matches(self, axis_or_metric_name, level):
+        # Select the DGPs in the third of the bank's axis scores which
+        # corresponds to the axis level.
+        if level not in _AXIS_LEVEL_QUANTILES:
+            raise DGPBankException(f"Unknown axis level {level}.")
+
+        scores = self.get_axis_scores(axis_or_metric_name)
+        if not np.any(np.isfinite(scores)):
+            return np.zeros(len(self), dtype=bool)
+
+        low, high = np.nanquantile(scores, _AXIS_LEVEL_QUANTILES[level])
+        return (scores >= low) & (scores <= high)
+
+    def query_range(self, metric_ranges=None, axis_levels=None):
+        """Find the DGPs in the bank with metric values in the given ranges.
+
+        Args:
+            metric_ranges (dict): A dictionary mapping flattened metric names to (low, high) tuples of inclusive metric bounds. Either bound can be None. Defaults to None.
+            axis_levels (dict): A dictionary mapping axis or flattened metric names to levels from ``Constants.AxisLevels``. Each level selects the DGPs in the corresponding third of the bank's axis scores, which combine all of the metrics of an axis taking into account the direction of each metric. See :meth:`~maccabee.benchmarking.dgp_bank.DGPBank.get_axis_scores`. Defaults to None.
+
+        Returns:
+            :class:`numpy.ndarray`: The bank indices of the DGPs which meet all the range conditions. Pass these to :meth:`~maccabee.benchmarking.dgp_bank.DGPBank.get_dgps` to load the DGPs.
+        """
+        with self._lock:
+            matches = np.ones(len(self), dtype=bool)
+            for axis_or_metric_name, level in (axis_levels or {}).items():
+                matches &= self._get_level_matches(axis_or_metric_name, level)
+
+            for metric_name, (low, high) in (metric_ranges or {}).items():
+                values = self._metric_values[:, self._get_metric_column(metric_name)]
+                if low is not None:
+                    matches &= values >= low
+                if high is not None:
+                    matches &= values <= high
+
+            return np.flatnonzero(matches)
+
+    def _get_index(self, metric_names):
+        # Build (once per bank state) a KD-tree over the standardized values
+        # of the metrics in metric_names. DGPs with missing values are excluded.
+        if metric_names not in self._index_cache:
+            columns = [self._get_metric_column(metric_name) for metric_name in metric_names]
+            values = self._metric_values[:, columns]
+            indexed_dgps = np.flatnonzero(np.all(np.isfinite(values), axis=1))
+            values = values[indexed_dgps]
+
+            means = np.mean(values, axis=0) if len(values) > 0 else np.zeros(len(columns))
+            stds = np.std(values, axis=0) if len(values) > 0 else np.ones(len(columns))
+            stds[stds == 0] = 1
+
+            self._index_cache[metric_names] = (
+                cKDTree((values - means)/stds), indexed_dgps, means, stds)
+
+        return self._index_cache[metric_names]
+
+    def query_nearest(self, target_metrics, k=1):
+        """Find the `k` DGPs in the bank with metric values nearest to `target_metrics`. Distances are measured over the standardized metric values.
+
+        Args:
+            target_metrics (dict): A dictionary mapping flattened metric names to target values. Only these metrics are used to measure distance.
+            k (int): The number of DGPs to find. Defaults to 1.
+
+        Returns:
+            :class:`numpy.ndarray`: The bank indices of the (up to) `k` nearest DGPs, nearest first.
+        """
+        with self._lock:
+            metric_names = tuple(sorted(target_metrics))
+            tree, indexed_dgps, means, stds = self._get_index(metric_names)
+            if len(indexed_dgps) == 0:
+                return np.empty(0, dtype=int)
+
+            target = (np.array([target_metrics[name] for name in metric_names]) - means)/stds
+            _, nearest = tree.query(target, k=min(k, len(indexed_dgps)))
+
+            return indexed_dgps[np.atleast_1d(nearest)]
+
+    def _load_shard(self, shard_index):
+        # Load the DGPs in a shard, keeping recently used shards in memory.
+        if shard_index in self._loaded_shards:
+            self._loaded_shards.move_to_end(shard_index)
+        else:
+            shard = self._manifest["shards"][shard_index]
+            self._loaded_shards[shard_index] = load_dgps(
+                os.path.join(self.path, shard["dgps"]),
+                data_source=self.data_source,
+                dgp_class=self.dgp_class,
+                dgp_kwargs=self.dgp_kwargs)
+
+            if len(self._loaded_shards) > _LOADED_SHARD_CACHE_SIZE:
+                self._loaded_shards.popitem(last=False)
+
+        return self._loaded_shards[shard_index]
+
+    def get_dgps(self, indices):
+        """Load the DGPs with the given bank indices.
+
+        Args:
+            indices (list): Bank indices as returned by the query methods.
+
+        Returns:
+            list: A list of :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess` instances.
+        """
+        with self._lock:
+            return [
+                self._load_shard(shard_index)[position]
+                for shard_index, position in self._dgp_locations[np.asarray(indices, dtype=int)]
+            ]
+
+    def get_dgp_metrics(self, indices):
+        """Returns the metric values of the DGPs with the given bank indices.
+
+        Args:
+            indices (list): Bank indices as returned by the query methods.
+
+        Returns:
+            list: A list of dictionaries mapping flattened metric names to values.
+        """
+        return [
+            dict(zip(self.metric_names, self._metric_values[index]))
+            for index in indices
+        ]
@@ -124,6 +124,11 @@ class Constants:
         # is necessary.
         NORMALIZATION_DATA_SAMPLE_FRACTION = 0.75
 
+        # The maximum number of (observation, term) values which are
+        # evaluated at once when the normalization of a batch of sampled
+        # DGPs is stacked. Larger batches are evaluated in blocks.
+        MAX_STACKED_NORMALIZATION_VALUES = 2**24
+
         # The subfunctions which are sampled to construct the sampled
         # treatent and outcome functions.
         LINEAR = "LINEAR"
@@ -324,6 +329,26 @@ class Constants:
         WASS_DIST = "Wass dist"
         NAIVE_TE = "Naive TE"
 
+    class DataMetricApproximation(ConstantGroup):
+        """[INTERNAL] Constants related to the approximate calculation of data metrics on stratified subsamples of large data sets. See :func:`~maccabee.data_analysis.data_analysis.calculate_data_axis_metrics`."""
+
+        # Data sets with fewer observations than this are always
+        # analyzed exactly.
+        MIN_OBSERVATIONS_FOR_APPROXIMATION = 10000
+
+        # The subsample size used for the pilot run which estimates
+        # the variance of each metric.
+        PILOT_SUBSAMPLE_SIZE = 2000
+
+        # If the subsample size required to reach the target error is
+        # larger than this fraction of the data, the metric is calculated
+        # exactly.
+        MAX_SUBSAMPLE_FRACTION = 0.5
+
+        # The minimum number of observations drawn from each treatment
+        # group in a subsample.
+        MIN_STRATUM_SIZE = 2
+
     ### External Data constants ###
 
     class ExternalCovariateData(ConstantGroup):
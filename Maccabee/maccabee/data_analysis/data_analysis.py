@@ -1,13 +1,124 @@
-"""This submodule contains the functions responsible for calculating the metrics used to quantify the position of a data set on each of the :term:`axes <distributional problem space axis>` of the :term:`distributional problem space`. As described in the sibling :mod:`~maccabee.data_analysis.data_metrics` submodule, each axis may have multiple metrics. The primary function in this module takes a :class:`maccabee.data_generation.generated_data_set.GeneratedDataSet` instance and an `observation_spec` which selects which axes and associated metrics to calculate. It then executes the calculation using the dictionary-based metric definitions from :mod:`~maccabee.data_analysis.data_metrics`.
+"""This submodule contains the functions responsible for calculating the metrics used to quantify the position of a data set on each of the :term:`axes <distributional problem space axis>` of the :term:`distributional problem space`. As described in the sibling :mod:`~maccabee.data_analysis.data_metrics` submodule, each axis may have multiple metrics. The primary function in this module takes a :class:`maccabee.data_generation.generated_data_set.GeneratedDataSet` instance and an `observation_spec` which selects which axes and associated metrics to calculate. It then executes the calculation using the dictionary-based metric definitions from :mod:`~maccabee.data_analysis.data_metrics`. For very large data sets, the metrics can optionally be approximated using repeated stratified subsampling. A second, batched, function calculates the same metrics for many data sets sampled from a single DGP in one pass.
 """
 
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
+from time import perf_counter
+from functools import partial
 
-from .data_metrics import AXES_AND_METRICS, AXIS_METRIC_FUNCTIONS
+from ..constants import Constants
+from .data_metrics import AXES_AND_METRICS, AXIS_METRIC_FUNCTIONS, AXIS_METRIC_BATCH_FUNCTIONS
 
+DataMetricApproximation = Constants.DataMetricApproximation
 
-def calculate_data_axis_metrics(dataset, observation_spec=None, flatten_result=False):
+
+def _take_observations(value, indices):
+    # Select the observations at the given positions from a DGP variable.
+    # Non-observation level values, like scalars, are returned unchanged.
+    if isinstance(value, (pd.Series, pd.DataFrame)):
+        return value.iloc[indices]
+    elif isinstance(value, np.ndarray) and value.ndim >= 1:
+        return value[indices]
+    else:
+        return value
+
+def _stratified_subsample_indices(treatment_status, subsample_size):
+    # Sample observation positions without replacement, drawing from the
+    # treated and control groups in proportion to their size.
+    treatment_status = np.asarray(treatment_status)
+    n_observations = len(treatment_status)
+
+    indices = []
+    for group_indices in [
+        np.flatnonzero(treatment_status == 1),
+        np.flatnonzero(treatment_status != 1)]:
+
+        group_size = len(group_indices)
+        group_subsample_size = int(round(
+            subsample_size*group_size/n_observations))
+        group_subsample_size = min(group_size, max(
+            group_subsample_size, DataMetricApproximation.MIN_STRATUM_SIZE))
+
+        indices.append(np.random.choice(
+            group_indices, size=group_subsample_size, replace=False))
+
+    return np.sort(np.concatenate(indices))
+
+def _calculate_subsampled_metric(func, dgp_var_kwargs, constant_kwargs,
+    treatment_status, subsample_size, n_subsample_repeats):
+    # Calculate a metric on repeated stratified subsamples.
+    # Returns the list of results for each subsample.
+    results = []
+    for _ in range(n_subsample_repeats):
+        indices = _stratified_subsample_indices(treatment_status, subsample_size)
+        subsample_kwargs = dict(
+            (arg_name, _take_observations(value, indices))
+            for arg_name, value in dgp_var_kwargs.items())
+        results.append(func(**subsample_kwargs, **constant_kwargs))
+
+    return results
+
+def _calculate_approximate_metric(func, dgp_var_kwargs, constant_kwargs,
+    treatment_status, target_relative_error, n_subsample_repeats):
+    """Helper method which approximates the value of a metric using the mean of the metric values calculated on repeated stratified subsamples.
+
+    The subsample size is selected automatically. A pilot run estimates the standard deviation of the metric across subsamples. Assuming that this standard deviation scales with the inverse square root of the subsample size, the subsample size is then chosen such that the standard error of the mean over the repeated subsamples is `target_relative_error` times the size of the estimate. If the required subsample size is a large fraction of the data, the metric is calculated exactly.
+
+    Args:
+        func (function): The metric calculation function.
+        dgp_var_kwargs (dict): The DGP variable arguments of the metric function.
+        constant_kwargs (dict): The constant arguments of the metric function.
+        treatment_status (:class:`~pandas.Series`): The treatment assignment vector used to stratify subsamples.
+        target_relative_error (float): The target standard error as a fraction of the metric value.
+        n_subsample_repeats (int): The number of subsamples.
+
+    Returns:
+        tuple: a tuple with the metric estimate as the first entry and its standard error as the second. The standard error is 0 if the metric was calculated exactly and None if the estimate is None.
+    """
+    n_observations = len(treatment_status)
+    max_subsample_size = int(
+        DataMetricApproximation.MAX_SUBSAMPLE_FRACTION*n_observations)
+    pilot_subsample_size = DataMetricApproximation.PILOT_SUBSAMPLE_SIZE
+
+    if n_subsample_repeats < 2 or pilot_subsample_size > max_subsample_size:
+        return func(**dgp_var_kwargs, **constant_kwargs), 0
+
+    # Pilot run to estimate the variance of the metric.
+    results = _calculate_subsampled_metric(
+        func, dgp_var_kwargs, constant_kwargs, treatment_status,
+        pilot_subsample_size, n_subsample_repeats)
+
+    if any(res is None for res in results):
+        return None, None
+
+    pilot_std = np.std(results, ddof=1)
+    target_std = target_relative_error*np.abs(np.mean(results))*np.sqrt(n_subsample_repeats)
+
+    if pilot_std > 0:
+        if target_std > 0:
+            subsample_size = int(np.ceil(
+                pilot_subsample_size*(pilot_std/target_std)**2))
+        else:
+            subsample_size = n_observations
+    else:
+        subsample_size = pilot_subsample_size
+
+    if subsample_size > max_subsample_size:
+        return func(**dgp_var_kwargs, **constant_kwargs), 0
+
+    if subsample_size > pilot_subsample_size:
+        results = _calculate_subsampled_metric(
+            func, dgp_var_kwargs, constant_kwargs, treatment_status,
+            subsample_size, n_subsample_repeats)
+
+        if any(res is None for res in results):
+            return None, None
+
+    return np.mean(results), np.std(results, ddof=1)/np.sqrt(n_subsample_repeats)
+
+def calculate_data_axis_metrics(dataset, observation_spec=None, flatten_result=False, cost_report=None,
+    approximate=False, target_relative_error=0.01, n_subsample_repeats=5):
     """This function takes a :class:`maccabee.data_generation.generated_data_set.GeneratedDataSet` instance and calculates the data metrics specified in `observation_spec`. It is primarily during the benchmarking process but can be used as a stand alone method for custom workflows.
 
     Args:
@@ -17,6 +128,14 @@ def calculate_data_axis_metrics(dataset, observation_spec=None, flatten_result=F
 
         flatten_result (bool): indicates whether the results should be flattened into a single dictionary by concatenating the axis and metric names into a single key rather than returning nested dictionaries with axis and metric names as the keys at the first and second level of nesting.
 
+        cost_report (dict): An optional dictionary into which the wall-clock time, in seconds, spent calculating each metric is accumulated. The keys are the flattened metric names (see `flatten_result`). The times are added to any existing values so a single dictionary can be used to report on many data sets. Defaults to None.
+
+        approximate (bool): indicates whether the metrics should be approximated using repeated stratified subsamples of the data. Each subsample is drawn without replacement from the treated and control groups in proportion to their size. The metric estimate is the mean of the subsample values and its standard error is reported as an additional result with the metric name followed by " (se)". The subsample size is chosen automatically to reach `target_relative_error`. Data sets with fewer than ``Constants.DataMetricApproximation.MIN_OBSERVATIONS_FOR_APPROXIMATION`` observations, and metrics which would require large subsamples, are calculated exactly with a standard error of 0. Note that the standard error captures only the subsampling variance. Metrics which depend on the density of the data, like the nearest counterfactual distance, are biased upwards in subsamples. Defaults to ``False``.
+
+        target_relative_error (float): The target standard error of approximated metrics, as a fraction of the metric value. Only used if `approximate` is ``True``. Defaults to 0.01.
+
+        n_subsample_repeats (int): The number of subsamples used to approximate each metric. Only used if `approximate` is ``True``. Defaults to 5.
+
     Returns:
         dict: A dictionary of axis names and associated metric results. If flatten_result is ``False``, then this is a dictionary in which axis names are mapped to dictionaries with metric name keys and real valued values. If flatten_result is ``True``, then this is a dictionary in which the keys are the concatenation of axis and metric names and the values are the corresponding real values.
 
@@ -26,6 +145,12 @@ def calculate_data_axis_metrics(dataset, observation_spec=None, flatten_result=F
 
     axis_metric_results = {}
 
+    if approximate:
+        treatment_status = dataset.get_dgp_variable(
+            Constants.DGPVariables.TREATMENT_ASSIGNMENT_NAME)
+        approximate = len(treatment_status) >= \
+            DataMetricApproximation.MIN_OBSERVATIONS_FOR_APPROXIMATION
+
     for axis, metrics in AXES_AND_METRICS.items():
         if (observation_spec is not None) and (axis not in observation_spec):
             continue # this axis not in observation specs.
@@ -52,14 +177,252 @@ def calculate_data_axis_metrics(dataset, observation_spec=None, flatten_result=F
             constant_kwargs = metric.get("constant_args", {})
 
             # Call the metric function with inputs as kwargs.
-            res = func(**dgp_var_kwargs, **constant_kwargs)
+            start_time = perf_counter()
+            if approximate:
+                res, res_se = _calculate_approximate_metric(
+                    func, dgp_var_kwargs, constant_kwargs, treatment_status,
+                    target_relative_error, n_subsample_repeats)
+            else:
+                res = func(**dgp_var_kwargs, **constant_kwargs)
 
             # Store results.
             metric_name = metric["name"]
 
+            if cost_report is not None:
+                cost_report[f"{axis} {metric_name}"] = \
+                    cost_report.get(f"{axis} {metric_name}", 0) + (perf_counter() - start_time)
+
             if flatten_result:
                 axis_metric_results[f"{axis} {metric_name}"] = res
+                if approximate:
+                    axis_metric_results[f"{axis} {metric_name} (se)"] = res_se
             else:
                 axis_metric_results[axis][metric_name] = res
+                if approximate:
+                    axis_metric_results[axis][f"{metric_name} (se)"] = res_se
 
     return axis_metric_results
+
+def _collect_batch_dgp_variable(datasets, dgp_var_name):
+    # Fetch the values of a DGP variable from each data set in the batch.
+    # The variable is shared if it has the same value in every data set,
+    # which is the case for the deterministic/cached DGP variables.
+    # Returns the raw values, the (shared or stacked) array of values and
+    # the shared status.
+    values = [dataset.get_dgp_variable(dgp_var_name) for dataset in datasets]
+
+    first_value = values[0]
+    first_array = np.asarray(first_value)
+
+    shared = all(
+        (value is first_value) or np.array_equal(first_array, np.asarray(value))
+        for value in values[1:])
+
+    if shared:
+        return values, first_array, True
+    else:
+        return values, np.stack([np.asarray(value) for value in values]), False
+
+def _apply_metric_function(func, constant_kwargs, dgp_var_kwargs):
+    # Calculate a metric for a single data set. This is a module level
+    # function so that it can be mapped over worker processes.
+    return func(**dgp_var_kwargs, **constant_kwargs)
+
+def _calculate_data_axis_metrics_with_cost_report(metric_kwargs, dataset):
+    # Calculate the metrics of a single data set and return the cost report
+    # alongside the results. A cost report dictionary supplied to a worker
+    # process would not be updated in the calling process.
+    cost_report = {}
+    results = calculate_data_axis_metrics(
+        dataset, cost_report=cost_report, **metric_kwargs)
+    return results, cost_report
+
+def calculate_data_axis_metrics_batch(datasets, observation_spec=None, flatten_result=False, cost_report=None,
+    approximate=False, target_relative_error=0.01, n_subsample_repeats=5, map_func=map):
+    """This function is the batched equivalent of :func:`~maccabee.data_analysis.data_analysis.calculate_data_axis_metrics`. It takes a list of :class:`~maccabee.data_generation.generated_data_set.GeneratedDataSet` instances, sampled from the same DGP, and calculates the data metrics specified in `observation_spec` for every data set.
+
+    DGP variables which have the same value in every data set (for example, the covariates and potential outcomes of a sampled DGP) are supplied once while the variables which vary across data sets (for example, the treatment assignment and observed outcome) are stacked. Metrics with a batched implementation in :data:`~maccabee.data_analysis.data_metrics.AXIS_METRIC_BATCH_FUNCTIONS` are then calculated for all data sets in a single vectorized pass. All other metrics are calculated separately for each data set.
+
+    Args:
+        datasets (list): A list of :class:`~maccabee.data_generation.generated_data_set.GeneratedDataSet` instances generated from the same :class:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess`.
+        observation_spec (dict): See :func:`~maccabee.data_analysis.data_analysis.calculate_data_axis_metrics`. Defaults to None.
+        flatten_result (bool): See :func:`~maccabee.data_analysis.data_analysis.calculate_data_axis_metrics`. Defaults to False.
+        cost_report (dict): See :func:`~maccabee.data_analysis.data_analysis.calculate_data_axis_metrics`. The time spent on the whole batch is recorded. Defaults to None.
+        approximate (bool): See :func:`~maccabee.data_analysis.data_analysis.calculate_data_axis_metrics`. Approximated metrics are calculated separately for each data set. Defaults to False.
+        target_relative_error (float): See :func:`~maccabee.data_analysis.data_analysis.calculate_data_axis_metrics`. Defaults to 0.01.
+        n_subsample_repeats (int): See :func:`~maccabee.data_analysis.data_analysis.calculate_data_axis_metrics`. Defaults to 5.
+        map_func (function): The map function used to calculate the metrics which are calculated separately for each data set, including all approximated metrics. Supply the ``map`` method of a :class:`multiprocessing.pool.Pool` to spread these calculations over its workers. Metrics with a user-supplied function are always calculated in the calling process, as the function may not be picklable. Defaults to the built-in ``map``.
+
+    Returns:
+        list: A list with one metric result dictionary per data set, in the order of `datasets`. Each dictionary has the format described in :func:`~maccabee.data_analysis.data_analysis.calculate_data_axis_metrics`.
+
+    Raises:
+        UnknownDGPVariableException: if a selected metric function specifies an unknown DGP variable as an arg to its calculation function.
+    """
+
+    if approximate:
+        # Subsamples are drawn independently for each data set so
+        # there are no shared inputs to exploit.
+        metric_kwargs = {
+            "observation_spec": observation_spec,
+            "flatten_result": flatten_result,
+            "approximate": True,
+            "target_relative_error": target_relative_error,
+            "n_subsample_repeats": n_subsample_repeats
+        }
+        batch_metric_results = []
+        for metric_results, dataset_cost_report in map_func(
+            partial(_calculate_data_axis_metrics_with_cost_report, metric_kwargs),
+            datasets):
+            batch_metric_results.append(metric_results)
+            if cost_report is not None:
+                for axis_metric_name, cost in dataset_cost_report.items():
+                    cost_report[axis_metric_name] = \
+                        cost_report.get(axis_metric_name, 0) + cost
+
+        return batch_metric_results
+
+    n_datasets = len(datasets)
+    batch_metric_results = [{} for _ in range(n_datasets)]
+
+    # DGP variables are fetched and stacked once per batch.
+    dgp_var_store = {}
+
+    for axis, metrics in AXES_AND_METRICS.items():
+        if (observation_spec is not None) and (axis not in observation_spec):
+            continue # this axis not in observation specs.
+
+        if not flatten_result:
+            for axis_metric_results in batch_metric_results:
+                axis_metric_results[axis] = {}
+
+        for metric in metrics:
+            if (observation_spec is not None) and (metric["name"] not in observation_spec[axis]):
+                 continue # this metric not in observation specs.
+
+            func = metric["function"]
+            batch_func, batchable_args = None, set()
+            metric_map_func = map
+            if not callable(func):
+                metric_map_func = map_func
+                batch_func, batchable_args = AXIS_METRIC_BATCH_FUNCTIONS.get(
+                    func, (None, set()))
+                func = AXIS_METRIC_FUNCTIONS[func]
+
+            for dgp_var_name in metric["args"].values():
+                if dgp_var_name not in dgp_var_store:
+                    dgp_var_store[dgp_var_name] = _collect_batch_dgp_variable(
+                        datasets, dgp_var_name)
+
+            constant_kwargs = metric.get("constant_args", {})
+            start_time = perf_counter()
+
+            varying_args = set(
+                arg_name
+                for arg_name, dgp_var_name in metric["args"].items()
+                if not dgp_var_store[dgp_var_name][2])
+
+            if len(varying_args) == 0:
+                # All inputs are shared, so the metric is calculated once.
+                dgp_var_kwargs = dict([
+                    (arg_name, dgp_var_store[dgp_var_name][0][0])
+                    for arg_name, dgp_var_name in metric["args"].items()
+                ])
+                results = [func(**dgp_var_kwargs, **constant_kwargs)]*n_datasets
+
+            elif (batch_func is not None) and varying_args.issubset(batchable_args):
+                # Vectorized calculation over all the data sets.
+                dgp_var_kwargs = dict([
+                    (arg_name, dgp_var_store[dgp_var_name][1])
+                    for arg_name, dgp_var_name in metric["args"].items()
+                ])
+                res = batch_func(**dgp_var_kwargs, **constant_kwargs)
+                if res is None:
+                    results = [None]*n_datasets
+                else:
+                    results = list(np.broadcast_to(res, (n_datasets,)))
+
+            else:
+                # Fall back to calculation for each data set.
+                results = list(metric_map_func(
+                    partial(_apply_metric_function, func, constant_kwargs),
+                    [
+                        dict([
+                            (arg_name, dgp_var_store[dgp_var_name][0][dataset_index])
+                            for arg_name, dgp_var_name in metric["args"].items()
+                        ])
+                        for dataset_index in range(n_datasets)
+                    ]))
+
+            # Store results.
+            metric_name = metric["name"]
+
+            if cost_report is not None:
+                cost_report[f"{axis} {metric_name}"] = \
+                    cost_report.get(f"{axis} {metric_name}", 0) + (perf_counter() - start_time)
+
+            for axis_metric_results, res in zip(batch_metric_results, results):
+                if flatten_result:
+                    axis_metric_results[f"{axis} {metric_name}"] = res
+                else:
+                    axis_metric_results[axis][metric_name] = res
+
+    return batch_metric_results
+
+def measure_data_metric_costs(
+    n_observations, n_covariates, n_transformed_covariates=None,
+    observation_spec=None, n_repeats=3):
+    """Measure the time, in seconds, required to calculate each data metric for a single data set of the given size on the current machine. The metrics are calculated on a synthetic data set with normally distributed covariates, a random treatment assignment and a linear outcome. The result can be supplied as the `metric_costs` argument of :func:`~maccabee.data_analysis.data_metrics.build_data_metrics_spec` to replace the declared metric cost models.
+
+    Args:
+        n_observations (int): The number of observations in the synthetic data set.
+        n_covariates (int): The number of observed covariates.
+        n_transformed_covariates (int): The number of transformed covariates. If None, this is equal to `n_covariates`. Defaults to None.
+        observation_spec (dict): See :func:`~maccabee.data_analysis.data_analysis.calculate_data_axis_metrics`. Defaults to None.
+        n_repeats (int): The number of timed repetitions. The minimum time is reported. Defaults to 3.
+
+    Returns:
+        dict: A dictionary mapping flattened metric names to the measured cost in seconds.
+    """
+    # Avoid the circular import, data_generation imports this package.
+    from ..data_generation import GeneratedDataSet
+
+    DGPVariables = Constants.DGPVariables
+
+    if n_transformed_covariates is None:
+        n_transformed_covariates = n_covariates
+
+    X = pd.DataFrame(np.random.normal(size=(n_observations, n_covariates)))
+    X_transformed = pd.DataFrame(
+        np.random.normal(size=(n_observations, n_transformed_covariates)))
+    T = pd.Series(np.random.binomial(1, 0.5, size=n_observations))
+    Y0 = X_transformed.sum(axis=1) + np.random.normal(size=n_observations)
+    TE = pd.Series(np.random.normal(1, 1, size=n_observations))
+    Y1 = Y0 + TE
+    Y = Y0 + T*TE
+
+    dataset = GeneratedDataSet({
+        DGPVariables.COVARIATES_NAME: X,
+        DGPVariables.TRANSFORMED_COVARIATES_NAME: X_transformed,
+        DGPVariables.PROPENSITY_SCORE_NAME: pd.Series(np.full(n_observations, 0.5)),
+        DGPVariables.PROPENSITY_LOGIT_NAME: pd.Series(np.zeros(n_observations)),
+        DGPVariables.TREATMENT_ASSIGNMENT_NAME: T,
+        DGPVariables.OUTCOME_NOISE_NAME: pd.Series(np.zeros(n_observations)),
+        DGPVariables.POTENTIAL_OUTCOME_WITHOUT_TREATMENT_NAME: Y0,
+        DGPVariables.POTENTIAL_OUTCOME_WITH_TREATMENT_NAME: Y1,
+        DGPVariables.TREATMENT_EFFECT_NAME: TE,
+        DGPVariables.OBSERVED_OUTCOME_NAME: Y
+    })
+
+    metric_costs = {}
+    for _ in range(n_repeats):
+        cost_report = {}
+        calculate_data_axis_metrics(
+            dataset, observation_spec=observation_spec,
+            flatten_result=True, cost_report=cost_report)
+
+        for metric_name, cost in cost_report.items():
+            metric_costs[metric_name] = min(
+                cost, metric_costs.get(metric_name, cost))
+
+    return metric_costs
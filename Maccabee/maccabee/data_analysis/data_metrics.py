@@ -12,7 +12,9 @@ The main :data:`~maccabee.data_analysis.data_metrics.AXES_AND_METRICS` dictionar
 
 * The arguments to the generic metric function. These concretize what the metric measures by applying the generic function to specific data. For example, by passing the original covariates and observed outcome as the arguments :math:`X` and :math:`y` of the linear regression function, one can construct a metric for the linearity of the outcome. The arguments are specified by a dictionary which maps the generic functions (generic) argument names to DGP data variable names from :class:`maccabee.constants.Constants.DGPVariables`. These constant names are then used to access the corresponding data from :class:`~maccabee.data_generation.generated_data_set.GeneratedDataSet` instances.
 
+A metric definition dictionary can also contain a ``"direction"`` component, which is 1 if larger metric values correspond to higher levels of the axis and -1 if they correspond to lower levels. For example, the nonlinearity axes are measured using linear :math:`R^2` values, which are high when the nonlinearity is low. Metrics without a direction are assumed to have a direction of 1. See :func:`~maccabee.data_analysis.data_metrics.get_data_metric_direction`.
 
+Data metrics differ in cost by orders of magnitude. A metric definition dictionary can optionally contain a fourth component - a ``"cost_model"`` callable which takes the number of observations and the dimensionality of the metric inputs and returns the expected calculation time in seconds. If it is absent, the declared cost model for the generic metric function in :data:`~maccabee.data_analysis.data_metrics.AXIS_METRIC_COST_MODELS` is used. The :func:`~maccabee.data_analysis.data_metrics.build_data_metrics_spec` function uses these cost models to select metrics under a per-data set time budget.
 """
 
 import numpy as np
@@ -21,6 +23,7 @@ from scipy.spatial.distance import cdist
 import ot
 import pandas as pd
 from collections import defaultdict
+import math
 
 from ..constants import Constants
 from ..parameters import build_parameters_from_axis_levels
@@ -37,6 +40,9 @@ DataMetricFunctions = Constants.DataMetricFunctions
 #: The dictionary mapping axis names to a list of metric definition dictionaries.
 #: Each metric definition dictionary has a name, calculation function, and argument
 #: mapping that specifies which DGP variables to supply as each function arg.
+#: The direction of each metric is 1 if larger values of the metric correspond
+#: to higher levels of the axis and -1 if they correspond to lower levels. For
+#: example, a high linear r2 indicates a low level of nonlinearity.
 AXES_AND_METRICS = {
     AxisNames.OUTCOME_NONLINEARITY: [
         {
@@ -45,7 +51,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.COVARIATES_NAME,
                 "y": DGPVariables.OBSERVED_OUTCOME_NAME
             },
-            "name": "Lin r2(X_obs, Y)"
+            "name": "Lin r2(X_obs, Y)",
+            "direction": -1
         },
         {
             "function": DataMetricFunctions.LINEAR_R2,
@@ -53,7 +60,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.TRANSFORMED_COVARIATES_NAME,
                 "y": DGPVariables.OBSERVED_OUTCOME_NAME
             },
-            "name": "Lin r2(X_true, Y)"
+            "name": "Lin r2(X_true, Y)",
+            "direction": -1
         },
         {
             "function": DataMetricFunctions.LINEAR_R2,
@@ -61,7 +69,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.COVARIATES_NAME,
                 "y": DGPVariables.POTENTIAL_OUTCOME_WITH_TREATMENT_NAME
             },
-            "name": "Lin r2(X_obs, Y1)"
+            "name": "Lin r2(X_obs, Y1)",
+            "direction": -1
         },
         {
             "function": DataMetricFunctions.LINEAR_R2,
@@ -69,7 +78,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.COVARIATES_NAME,
                 "y": DGPVariables.POTENTIAL_OUTCOME_WITHOUT_TREATMENT_NAME
             },
-            "name": "Lin r2(X_obs, Y0)"
+            "name": "Lin r2(X_obs, Y0)",
+            "direction": -1
         },
         {
             "function": DataMetricFunctions.LINEAR_R2,
@@ -77,7 +87,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.TRANSFORMED_COVARIATES_NAME,
                 "y": DGPVariables.POTENTIAL_OUTCOME_WITH_TREATMENT_NAME
             },
-            "name": "Lin r2(X_true, Y1)"
+            "name": "Lin r2(X_true, Y1)",
+            "direction": -1
         },
         {
             "function": DataMetricFunctions.LINEAR_R2,
@@ -85,7 +96,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.TRANSFORMED_COVARIATES_NAME,
                 "y": DGPVariables.POTENTIAL_OUTCOME_WITHOUT_TREATMENT_NAME
             },
-            "name": "Lin r2(X_true, Y0)"
+            "name": "Lin r2(X_true, Y0)",
+            "direction": -1
         },
         {
             "function": DataMetricFunctions.LINEAR_R2,
@@ -93,7 +105,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.COVARIATES_NAME,
                 "y": DGPVariables.TREATMENT_EFFECT_NAME
             },
-            "name": "Lin r2(X_obs, TE)"
+            "name": "Lin r2(X_obs, TE)",
+            "direction": -1
         },
         {
             "function": DataMetricFunctions.LINEAR_R2,
@@ -101,7 +114,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.TRANSFORMED_COVARIATES_NAME,
                 "y": DGPVariables.TREATMENT_EFFECT_NAME
             },
-            "name": "Lin r2(X_true, TE)"
+            "name": "Lin r2(X_true, TE)",
+            "direction": -1
         }
     ],
 
@@ -112,7 +126,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.COVARIATES_NAME,
                 "y": DGPVariables.TREATMENT_ASSIGNMENT_NAME
             },
-            "name": "Log r2(X_obs, T)"
+            "name": "Log r2(X_obs, T)",
+            "direction": -1
         },
         {
             "function": DataMetricFunctions.LINEAR_R2,
@@ -120,7 +135,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.COVARIATES_NAME,
                 "y": DGPVariables.PROPENSITY_LOGIT_NAME
             },
-            "name": "Lin r2(X_obs, Treat Logit)"
+            "name": "Lin r2(X_obs, Treat Logit)",
+            "direction": -1
         },
         {
             "function": DataMetricFunctions.LINEAR_R2,
@@ -128,7 +144,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.TRANSFORMED_COVARIATES_NAME,
                 "y": DGPVariables.PROPENSITY_LOGIT_NAME
             },
-            "name": "Lin r2(X_true, Treat Logit)"
+            "name": "Lin r2(X_true, Treat Logit)",
+            "direction": -1
         }
     ],
 
@@ -141,7 +158,8 @@ AXES_AND_METRICS = {
             "constant_args": {
                 "value": 1
             },
-            "name": "Percent(T==1)"
+            "name": "Percent(T==1)",
+            "direction": 1
         }
     ],
 
@@ -152,7 +170,8 @@ AXES_AND_METRICS = {
                 "covariates": DGPVariables.COVARIATES_NAME,
                 "treatment_status": DGPVariables.TREATMENT_ASSIGNMENT_NAME
             },
-            "name": "NN dist X_obs: T=1<->T=0"
+            "name": "NN dist X_obs: T=1<->T=0",
+            "direction": -1
         },
         {
             "function": DataMetricFunctions.NN_CF_MAHALA_DIST,
@@ -160,7 +179,8 @@ AXES_AND_METRICS = {
                 "covariates": DGPVariables.TRANSFORMED_COVARIATES_NAME,
                 "treatment_status": DGPVariables.TREATMENT_ASSIGNMENT_NAME
             },
-            "name": "NN dist X_true: T=1<->T=0"
+            "name": "NN dist X_true: T=1<->T=0",
+            "direction": -1
         }
     ],
 
@@ -171,7 +191,8 @@ AXES_AND_METRICS = {
                 "covariates": DGPVariables.TRANSFORMED_COVARIATES_NAME,
                 "treatment_status": DGPVariables.TREATMENT_ASSIGNMENT_NAME
             },
-            "name": "Mean dist X_true: T=1<->T=0"
+            "name": "Mean dist X_true: T=1<->T=0",
+            "direction": -1
         },
         {
             "function": DataMetricFunctions.WASS_DIST,
@@ -179,7 +200,8 @@ AXES_AND_METRICS = {
                 "covariates": DGPVariables.TRANSFORMED_COVARIATES_NAME,
                 "treatment_status": DGPVariables.TREATMENT_ASSIGNMENT_NAME
             },
-            "name": "Wass dist X_true: T=1<->T=0"
+            "name": "Wass dist X_true: T=1<->T=0",
+            "direction": -1
         },
         {
             "function": DataMetricFunctions.WASS_DIST,
@@ -187,7 +209,8 @@ AXES_AND_METRICS = {
                 "covariates": DGPVariables.COVARIATES_NAME,
                 "treatment_status": DGPVariables.TREATMENT_ASSIGNMENT_NAME
             },
-            "name": "Wass dist X_obs: T=1<->T=0"
+            "name": "Wass dist X_obs: T=1<->T=0",
+            "direction": -1
         },
         {
             "function": DataMetricFunctions.NAIVE_TE,
@@ -196,7 +219,8 @@ AXES_AND_METRICS = {
                 "observed_outcome": DGPVariables.OBSERVED_OUTCOME_NAME,
                 "treatment_status": DGPVariables.TREATMENT_ASSIGNMENT_NAME
             },
-            "name": "Naive TE"
+            "name": "Naive TE",
+            "direction": -1
         }
     ],
 
@@ -207,7 +231,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.OBSERVED_OUTCOME_NAME,
                 "y": DGPVariables.PROPENSITY_LOGIT_NAME
             },
-            "name": "Lin r2(Y, Treat Logit)"
+            "name": "Lin r2(Y, Treat Logit)",
+            "direction": 1
         },
         {
             "function": DataMetricFunctions.LINEAR_R2,
@@ -215,7 +240,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.POTENTIAL_OUTCOME_WITHOUT_TREATMENT_NAME,
                 "y": DGPVariables.PROPENSITY_LOGIT_NAME
             },
-            "name": "Lin r2(Y0, Treat Logit)"
+            "name": "Lin r2(Y0, Treat Logit)",
+            "direction": 1
         },
         {
             "function": DataMetricFunctions.LOGISTIC_R2,
@@ -223,7 +249,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.POTENTIAL_OUTCOME_WITHOUT_TREATMENT_NAME,
                 "y": DGPVariables.TREATMENT_ASSIGNMENT_NAME
             },
-            "name": "Log r2(Y0, T)"
+            "name": "Log r2(Y0, T)",
+            "direction": 1
         },
         {
             "function": DataMetricFunctions.LOGISTIC_R2,
@@ -231,7 +258,8 @@ AXES_AND_METRICS = {
                 "X": DGPVariables.OBSERVED_OUTCOME_NAME,
                 "y": DGPVariables.TREATMENT_ASSIGNMENT_NAME
             },
-            "name": "Log r2(Y, T)"
+            "name": "Log r2(Y, T)",
+            "direction": 1
         }
     ],
 
@@ -242,7 +270,8 @@ AXES_AND_METRICS = {
                 "x1": DGPVariables.TREATMENT_EFFECT_NAME,
                 "x2": DGPVariables.OBSERVED_OUTCOME_NAME
             },
-            "name": "std(TE)/std(Y)"
+            "name": "std(TE)/std(Y)",
+            "direction": 1
         }
     ]
 }
@@ -397,6 +426,135 @@ def _naive_TE_estimate_error(TE, observed_outcome, treatment_status):
     ATE_est = np.mean(Y_t) - np.mean(Y_c)
     return np.abs(ATE_true - ATE_est)
 
+### Batched metric functions
+
+# Below are the batched equivalents of some of the metric functions above.
+# They are used to calculate a metric for K data sets sampled from the same
+# DGP in a single pass. Each batched function takes the same arguments as
+# its single data set counterpart. Arguments which vary across the data sets
+# are supplied stacked, with a leading axis of length K, while arguments which
+# are shared by all the data sets are supplied once, without the leading axis.
+# The functions return values which broadcast to a K-length array.
+
+def _batch_linear_regression_r2(X, y):
+    # A single factorization of the shared design matrix is used to
+    # solve for the K stacked outcome vectors.
+    X = np.asarray(X, dtype=float)
+    if X.ndim == 1:
+        X = X.reshape((-1, 1))
+
+    design = np.hstack([np.ones((X.shape[0], 1)), X])
+    Y = np.asarray(y, dtype=float).T
+
+    coefs = np.linalg.lstsq(design, Y, rcond=None)[0]
+    ss_res = np.sum((Y - design@coefs)**2, axis=0)
+    ss_tot = np.sum((Y - np.mean(Y, axis=0))**2, axis=0)
+
+    # Mirror the sklearn R^2 conventions for constant outcomes.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r2 = 1 - (ss_res/ss_tot)
+    constant_outcome = np.isclose(ss_tot, 0)
+    r2[constant_outcome] = np.where(
+        np.isclose(ss_res[constant_outcome], 0), 1.0, 0.0)
+
+    return r2
+
+def _batch_percent(x, value):
+    return 100*np.mean(np.asarray(x) == value, axis=-1)
+
+def _batch_treat_and_control_masks(treatment_status):
+    treatment_status = np.asarray(treatment_status)
+    return (
+        (treatment_status == 1).astype(float),
+        (treatment_status == 0).astype(float))
+
+def _batch_l2_distance_between_means(covariates, treatment_status):
+    # Group means are found by multiplying the (K, n) treatment matrix
+    # with the shared (n, p) covariate matrix.
+    covariates = np.asarray(covariates, dtype=float)
+    if covariates.ndim == 1:
+        covariates = covariates.reshape((-1, 1))
+
+    treated, control = _batch_treat_and_control_masks(treatment_status)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        treated_means = (treated@covariates)/np.sum(treated, axis=1, keepdims=True)
+        control_means = (control@covariates)/np.sum(control, axis=1, keepdims=True)
+
+    return np.linalg.norm(treated_means - control_means, axis=1)
+
+# The maximum number of entries in each row block of the pairwise
+# distance matrix used by the batched nearest neighbor metric. This bounds
+# the memory used by the metric to a few tens of megabytes.
+BATCH_DISTANCE_BLOCK_ENTRIES = 2**22
+
+def _batch_mean_mahalanobis_between_nearest_counterfactual(covariates, treatment_status):
+    # The inverse covariance matrix depends only on the pooled covariates
+    # so it is shared by all data sets. The pairwise distance matrix is
+    # calculated in blocks of rows and each block is shared by all the
+    # treatment vectors, which accumulate the nearest neighbor distances of
+    # their treated observations in the block. Degenerate samples, like
+    # those without control observations, fail individually and get None
+    # as in the unbatched metric.
+    covariates = np.asarray(covariates, dtype=float)
+    if covariates.ndim == 1:
+        covariates = covariates.reshape((-1, 1))
+    treatment_status = np.asarray(treatment_status)
+    n_samples = len(treatment_status)
+
+    try:
+        VI = np.linalg.inv(np.cov(covariates.T).reshape(
+            (covariates.shape[1], covariates.shape[1]))).T
+    except Exception:
+        logger.exception("Ill-conditioned Mahalanobis distance calculation")
+        return [None]*n_samples
+
+    treated = treatment_status == 1
+    control = treatment_status == 0
+    n_observations = covariates.shape[0]
+    block_size = max(1, BATCH_DISTANCE_BLOCK_ENTRIES // n_observations)
+
+    nn_distance_sums = np.zeros(n_samples)
+    failed_samples = set()
+    for block_start in range(0, n_observations, block_size):
+        block_rows = slice(block_start, block_start + block_size)
+        block_distance_matrix = cdist(
+            covariates[block_rows], covariates, "mahalanobis", VI=VI)
+        np.nan_to_num(block_distance_matrix, copy=False, nan=np.inf)
+
+        for sample_index, sample_treated in enumerate(treated[:, block_rows]):
+            if (sample_index in failed_samples) or not np.any(sample_treated):
+                continue
+
+            try:
+                distance_matrix = block_distance_matrix[
+                    np.ix_(sample_treated, control[sample_index])]
+                nn_distance_sums[sample_index] += np.sum(np.min(distance_matrix, axis=1))
+            except Exception:
+                logger.exception("Ill-conditioned Mahalanobis distance calculation")
+                failed_samples.add(sample_index)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        nn_distance_means = nn_distance_sums/np.sum(treated, axis=1)
+
+    return [
+        None if sample_index in failed_samples else nn_distance_mean
+        for sample_index, nn_distance_mean in enumerate(nn_distance_means)
+    ]
+
+def _batch_standard_deviation_ratio(x1, x2):
+    return np.std(x1, axis=-1)/np.std(x2, axis=-1)
+
+def _batch_naive_TE_estimate_error(TE, observed_outcome, treatment_status):
+    treated, control = _batch_treat_and_control_masks(treatment_status)
+    observed_outcome = np.asarray(observed_outcome, dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        treated_mean = np.sum(treated*observed_outcome, axis=-1)/np.sum(treated, axis=-1)
+        control_mean = np.sum(control*observed_outcome, axis=-1)/np.sum(control, axis=-1)
+
+    ATE_true = np.mean(TE, axis=-1)
+    return np.abs(ATE_true - (treated_mean - control_mean))
+
 #: The dictionary mapping constant metric function names to
 #: function callables from this module.
 AXIS_METRIC_FUNCTIONS = {
@@ -409,3 +567,205 @@ AXIS_METRIC_FUNCTIONS = {
     DataMetricFunctions.WASS_DIST: _wasserstein,
     DataMetricFunctions.NAIVE_TE: _naive_TE_estimate_error
 }
+
+
+#: The dictionary mapping constant metric function names to batched
+#: function callables from this module. Each entry is a tuple of the batched
+#: callable and the set of argument names which may vary across the data sets
+#: in the batch. Metrics without an entry, or with other varying arguments,
+#: are calculated separately for each data set.
+AXIS_METRIC_BATCH_FUNCTIONS = {
+    DataMetricFunctions.LINEAR_R2: (_batch_linear_regression_r2, {"y"}),
+    DataMetricFunctions.PERCENT: (_batch_percent, {"x"}),
+    DataMetricFunctions.L2_MEAN_DIST: (
+        _batch_l2_distance_between_means, {"treatment_status"}),
+    DataMetricFunctions.NN_CF_MAHALA_DIST: (
+        _batch_mean_mahalanobis_between_nearest_counterfactual,
+        {"treatment_status"}),
+    DataMetricFunctions.STD_RATIO: (
+        _batch_standard_deviation_ratio, {"x1", "x2"}),
+    DataMetricFunctions.NAIVE_TE: (
+        _batch_naive_TE_estimate_error,
+        {"TE", "observed_outcome", "treatment_status"})
+}
+
+### Metric cost models
+
+# Below are the declared cost models for the generic metric functions.
+# Each takes the number of observations and the dimensionality of the
+# metric's (matrix) inputs and returns the approximate calculation time in
+# seconds on a single core. The constants are rough and are only intended
+# to capture the relative cost and scaling of the metrics. Measured costs
+# can be supplied instead, see measure_data_metric_costs in the sibling
+# data_analysis submodule.
+
+def _linear_regression_r2_cost(n_observations, n_dimensions):
+    return 5e-4 + 2e-8*n_observations*(n_dimensions**2)
+
+def _logistic_regression_r2_cost(n_observations, n_dimensions):
+    return 2e-3 + 1e-7*n_observations*n_dimensions
+
+def _vector_reduction_cost(n_observations, n_dimensions):
+    return 1e-4 + 1e-8*n_observations
+
+def _l2_distance_between_means_cost(n_observations, n_dimensions):
+    return 5e-4 + 1e-8*n_observations*n_dimensions
+
+def _mean_mahalanobis_between_nearest_counterfactual_cost(n_observations, n_dimensions):
+    return 1e-3 + 2e-9*(n_observations**2)*n_dimensions
+
+def _wasserstein_cost(n_observations, n_dimensions):
+    return 1e-3 + (3e-8 + 1e-9*n_dimensions)*(n_observations**2)
+
+#: The dictionary mapping constant metric function names to declared
+#: cost models. Each cost model is a callable which takes the number of
+#: observations and the dimensionality of the metric inputs and returns the
+#: approximate calculation time in seconds.
+AXIS_METRIC_COST_MODELS = {
+    DataMetricFunctions.LINEAR_R2: _linear_regression_r2_cost,
+    DataMetricFunctions.LOGISTIC_R2: _logistic_regression_r2_cost,
+    DataMetricFunctions.PERCENT: _vector_reduction_cost,
+    DataMetricFunctions.L2_MEAN_DIST: _l2_distance_between_means_cost,
+    DataMetricFunctions.NN_CF_MAHALA_DIST: _mean_mahalanobis_between_nearest_counterfactual_cost,
+    DataMetricFunctions.STD_RATIO: _vector_reduction_cost,
+    DataMetricFunctions.WASS_DIST: _wasserstein_cost,
+    DataMetricFunctions.NAIVE_TE: _vector_reduction_cost
+}
+
+def _find_metric_definition(axis_name, metric_name):
+    for metric in AXES_AND_METRICS[axis_name]:
+        if metric["name"] == metric_name:
+            return metric
+
+    raise ValueError(f"Unknown metric {metric_name} for axis {axis_name}")
+
+def get_data_metric_direction(axis_name, metric_name):
+    """Returns the direction of a data metric, which is 1 if larger values of the metric correspond to higher levels of the axis and -1 otherwise. See the module docs.
+
+    Args:
+        axis_name (str): The name of an axis from :class:`~maccabee.constants.Constants.AxisNames`.
+        metric_name (str): The name of a metric for the axis, from :data:`~maccabee.data_analysis.data_metrics.AXES_AND_METRIC_NAMES`.
+
+    Returns:
+        int: The direction of the metric.
+
+    Raises:
+        ValueError: if the metric is unknown.
+    """
+    return _find_metric_definition(axis_name, metric_name).get("direction", 1)
+
+def estimate_data_metric_cost(axis_name, metric_name,
+    n_observations, n_covariates, n_transformed_covariates=None):
+    """Estimate the time, in seconds, required to calculate a data metric for a single data set using the metric's declared cost model.
+
+    Args:
+        axis_name (str): The name of an axis from :class:`~maccabee.constants.Constants.AxisNames`.
+        metric_name (str): The name of a metric for the axis, from :data:`~maccabee.data_analysis.data_metrics.AXES_AND_METRIC_NAMES`.
+        n_observations (int): The number of observations in the data set.
+        n_covariates (int): The number of observed covariates.
+        n_transformed_covariates (int): The number of transformed covariates. If None, this is assumed to be equal to `n_covariates`. Defaults to None.
+
+    Returns:
+        float: The estimated calculation time in seconds. This is ``math.inf`` if the metric has no cost model.
+
+    Raises:
+        ValueError: if the metric is unknown.
+    """
+    metric = _find_metric_definition(axis_name, metric_name)
+
+    if n_transformed_covariates is None:
+        n_transformed_covariates = n_covariates
+
+    cost_model = metric.get("cost_model", None)
+    if cost_model is None:
+        cost_model = AXIS_METRIC_COST_MODELS.get(metric["function"], None)
+    if cost_model is None:
+        return math.inf
+
+    # The dimensionality of the metric is set by its widest input.
+    arg_dimensions = {
+        DGPVariables.COVARIATES_NAME: n_covariates,
+        DGPVariables.TRANSFORMED_COVARIATES_NAME: n_transformed_covariates
+    }
+    n_dimensions = max(
+        arg_dimensions.get(dgp_var_name, 1)
+        for dgp_var_name in metric["args"].values())
+
+    return cost_model(n_observations, n_dimensions)
+
+def build_data_metrics_spec(
+    n_observations, n_covariates, time_budget,
+    axes=None, n_transformed_covariates=None, metric_costs=None):
+    """Build a `data_metrics_spec` dictionary, as used by the :mod:`~maccabee.benchmarking` functions, which selects one metric per axis such that the total expected cost of calculating the metrics for a single data set is within `time_budget`.
+
+    The metrics for each axis are ranked by informativeness according to their order in :data:`~maccabee.data_analysis.data_metrics.AXES_AND_METRICS`, with the first metric being the most informative. Selection proceeds in two phases. First, the cheapest metric of each axis is selected, in order of increasing cost, until the budget is exhausted. This maximizes the number of axes which are measured. Second, the selected metric of each axis is upgraded to the most informative metric which fits in the remaining budget.
+
+    Args:
+        n_observations (int): The number of observations in each data set.
+        n_covariates (int): The number of observed covariates.
+        time_budget (float): The per-data set time budget in seconds.
+        axes (list): A list of the names of the axes to measure. If None, all axes are measured. Defaults to None.
+        n_transformed_covariates (int): See :func:`~maccabee.data_analysis.data_metrics.estimate_data_metric_cost`. Defaults to None.
+        metric_costs (dict): An optional dictionary mapping flattened metric names (the concatenation of the axis and metric names as produced by ``calculate_data_axis_metrics(..., flatten_result=True)``) to measured costs in seconds. Measured costs take precedence over the declared cost models. Defaults to None.
+
+    Returns:
+        dict: A dictionary mapping axis names to a list containing the selected metric name. Axes for which no metric fits in the budget are omitted.
+
+    Examples
+        >>> build_data_metrics_spec(n_observations=1000, n_covariates=10, time_budget=0.05)
+        {'PERCENT_TREATED': ['Percent(T==1)'], 'TE_HETEROGENEITY': ['std(TE)/std(Y)'], ...}
+    """
+
+    if axes is None:
+        axes = list(AXES_AND_METRICS.keys())
+
+    if metric_costs is None:
+        metric_costs = {}
+
+    # The cost of every metric for each axis, in informativeness order.
+    axis_metric_costs = {}
+    for axis in axes:
+        axis_metric_costs[axis] = [
+            (metric_name, metric_costs.get(
+                f"{axis} {metric_name}",
+                estimate_data_metric_cost(
+                    axis, metric_name, n_observations,
+                    n_covariates, n_transformed_covariates)))
+            for metric_name in AXES_AND_METRIC_NAMES[axis]
+        ]
+
+    remaining_budget = time_budget
+    selected_metrics = {}
+
+    # Phase 1: cover as many axes as possible using the cheapest metrics.
+    cheapest_axis_metrics = [
+        (axis, *min(costs, key=lambda metric_cost: metric_cost[1]))
+        for axis, costs in axis_metric_costs.items()
+        if len(costs) > 0
+    ]
+
+    for axis, metric_name, cost in sorted(
+        cheapest_axis_metrics, key=lambda entry: entry[2]):
+        if cost <= remaining_budget:
+            selected_metrics[axis] = (metric_name, cost)
+            remaining_budget -= cost
+        else:
+            logger.info(f"No metric for axis {axis} fits in the data metric time budget.")
+
+    # Phase 2: upgrade each axis to the most informative affordable metric.
+    for axis in axes:
+        if axis not in selected_metrics:
+            continue
+
+        _, selected_cost = selected_metrics[axis]
+        for metric_name, cost in axis_metric_costs[axis]:
+            if (cost - selected_cost) <= remaining_budget:
+                selected_metrics[axis] = (metric_name, cost)
+                remaining_budget -= (cost - selected_cost)
+                break
+
+    logger.debug(f"Selected data metrics with expected cost {time_budget - remaining_budget}s.")
+
+    return dict(
+        (axis, [metric_name])
+        for axis, (metric_name, _) in selected_metrics.items())
@@ -1,12 +1,18 @@
 """This module contains the classes and functions responsible for data generation. The :class:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess` class is central to the data generation process: :class:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess` instances are used to sample :class:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess` instances (sampled :term:`DGPs <DGP>`). :class:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess` instances - either sampled as above or concretely defined - are then used to sample :class:`~maccabee.data_generation.generated_data_set.GeneratedDataSet` instances (sampled data sets). Models are then benchmarked against these sampled data sets.
 
-This module is comprised of three submodules which align with the three components of the data generation process as outlined above.
+This module is comprised of three submodules which align with the three components of the data generation process as outlined above. Further submodules contain the compact representation of the treatment and outcome functions in sampled DGPs (:mod:`~maccabee.data_generation.sampled_functions`), the compact serialization format for sampled DGPs (:mod:`~maccabee.data_generation.serialization`), an on-disk cache of sampled DGPs (:mod:`~maccabee.data_generation.dgp_cache`), lightweight handles which regenerate sampled data sets on demand (:mod:`~maccabee.data_generation.dataset_handle`), a sampler which targets ranges of data metric values (:mod:`~maccabee.data_generation.target_seeking_sampler`) and a sampler which couples the DGPs sampled with different parameters (:mod:`~maccabee.data_generation.coupled_sampler`).
 
 .. note::
 
-  For convenience, all the classes and functions that are split across the three submodules below can be imported directly from the parent :mod:`maccabee.data_generation` module.
+  For convenience, all the classes and functions that are split across the submodules below can be imported directly from the parent :mod:`maccabee.data_generation` module.
 """
 
 from .data_generating_process import *
 from .data_generating_process_sampler import *
 from .generated_data_set import *
+from .sampled_functions import *
+from .serialization import *
+from .target_seeking_sampler import *
+from .coupled_sampler import *
+from .dgp_cache import *
+from .dataset_handle import *
@@ -0,0 +1,244 @@
+"""This submodule contains the :class:`~maccabee.data_generation.coupled_sampler.CoupledDGPSampler` class. This class extends the :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler` with coupled sampling, which is used to compare sampling parameterizations that differ in only some parameters, like the points of a sampling parameter grid.
+
+Coupled samplers identify each DGP by an integer index. Each component of the DGP with a given index - the observed covariates, the potential confounders, the outcome and treatment transforms and their constants, the alignment adjustment, the treatment effect and the normalization data samples - is sampled from its own random stream, seeded by the shared coupling seed, the DGP index and the component. Components which depend only on parameters that are the same in two coupled samplers are therefore identical in the DGPs with the same index, and only the components affected by the changed parameters differ. This gives paired comparisons between the parameterizations which have much lower variance than comparisons between independently sampled DGPs.
+
+Coupled samplers can also share a component cache. Sampled components are stored in the cache under a key made up of the DGP index and the component's inputs, so components which are unchanged between samplers are reused rather than resampled. In particular, the normalization of the treatment, outcome and treatment effect functions, which is the most expensive part of DGP sampling, is only performed once for each distinct function.
+"""
+
+from contextlib import contextmanager
+import hashlib
+
+import numpy as np
+
+from ..constants import Constants
+from .data_generating_process import SampledDataGeneratingProcess
+from .data_generating_process_sampler import DataGeneratingProcessSampler
+from .utils import seeded_random_state
+
+from ..logging import get_logger
+logger = get_logger(__name__)
+
+SamplingConstants = Constants.DGPSampling
+
+#: The components of a DGP which are sampled from separate random streams.
+#: The position of a component in this tuple identifies its stream so new
+#: components must be appended to preserve the streams of existing ones.
+COUPLED_COMPONENTS = (
+    "observed_covariates",
+    "potential_confounders",
+    "outcome_transforms",
+    "treatment_transforms",
+    "alignment",
+    "outcome_constants",
+    "treatment_constants",
+    "treatment_function_normalization",
+    "outcome_function_normalization",
+    "treatment_effect",
+    "treatment_effect_normalization"
+)
+
+def _term_table_digest(term_table):
+    # A digest of the terms and constants in a term table which is used
+    # to identify functions in the component cache.
+    digest = hashlib.sha1()
+    for array in (term_table.forms, term_table.covariate_indices,
+        term_table.coefficients, term_table.thresholds):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+def _sort_terms(term_table):
+    # Put the terms of an uninitialized term table in key order. The
+    # alignment step orders terms by whether they are aligned, so this
+    # ensures that the same set of terms receives the same constants
+    # regardless of the alignment of the other function.
+    term_keys = term_table.keys()
+    return term_table.take(sorted(range(len(term_keys)), key=term_keys.__getitem__))
+
+def _hashable_parameter_value(value):
+    if isinstance(value, dict):
+        return tuple(sorted(
+            (key, _hashable_parameter_value(val)) for key, val in value.items()))
+    elif isinstance(value, (list, tuple)):
+        return tuple(_hashable_parameter_value(val) for val in value)
+    return value
+
+class CoupledDGPSampler(DataGeneratingProcessSampler):
+    """CoupledDGPSampler(...)
+
+    A :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler` which samples coupled DGPs. See the module docs for a description of coupled sampling. Coupled samplers must be given the same `coupling_seed` and data source. They can share a `component_cache`.
+
+    Args:
+        parameters (:class:`~maccabee.parameters.parameter_store.ParameterStore`): See :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler`.
+        data_source (:class:`~maccabee.data_sources.data_sources.DataSource`): See :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler`.
+        coupling_seed (int): The seed shared by coupled samplers. The random streams of the DGP components are derived from this seed.
+        component_cache (dict): A dictionary in which sampled components are stored for reuse by this sampler and other coupled samplers. The dictionary should only be shared by samplers with the same `coupling_seed` and data source. Defaults to None, in which case the sampler has its own cache.
+        dgp_class (:class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`): See :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler`.
+        dgp_kwargs (dict): See :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler`.
+    """
+
+    def __init__(self, parameters, data_source, coupling_seed,
+        component_cache=None,
+        dgp_class=SampledDataGeneratingProcess, dgp_kwargs={}):
+
+        super().__init__(parameters, data_source,
+            dgp_class=dgp_class, dgp_kwargs=dgp_kwargs)
+
+        self.coupling_seed = coupling_seed
+        if component_cache is None:
+            component_cache = {}
+        self.component_cache = component_cache
+
+    @contextmanager
+    def _component_stream(self, dgp_index, component_name):
+        # Seed the global random state with the stream of the given DGP
+        # component. The sampling steps draw from the global random state so
+        # this fixes all of their draws.
+        seed_sequence = np.random.SeedSequence([
+            self.coupling_seed, dgp_index, COUPLED_COMPONENTS.index(component_name)])
+
+        with seeded_random_state(seed_sequence.generate_state(1)[0]):
+            yield
+
+    def _parameter_key(self, *param_names):
+        return tuple(
+            (param_name, _hashable_parameter_value(getattr(self.params, param_name)))
+            for param_name in param_names)
+
+    def _get_cached_component(self, cache_key, sample_component):
+        # Return the component stored under cache_key, sampling and storing
+        # it using sample_component if it is not in the cache.
+        if cache_key not in self.component_cache:
+            self.component_cache[cache_key] = sample_component()
+        else:
+            logger.debug("Reusing cached DGP component %s", cache_key[:2])
+
+        return self.component_cache[cache_key]
+
+    def sample_dgp(self, dgp_index=0):
+        """Sample the DGP with the given index. This executes the same steps as :meth:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler.sample_dgp` but each component is sampled from its own random stream and is reused from the component cache where possible. Sampling a DGP with the same index twice produces the same DGP.
+
+        Args:
+            dgp_index (int): The index of the DGP. Defaults to 0.
+
+        Returns:
+            :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`: A :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess` instance representing the sampled DGP.
+        """
+        covariate_indices = np.arange(len(self.data_source.get_covar_names()))
+
+        # The observed covariate data is identified by the parameter which
+        # controls its sampling. This key is part of the cache key of all
+        # the components which are normalized using the observed data.
+        observed_data_key = self._parameter_key("OBSERVATION_PROBABILITY")
+
+        def sample_observed_covariate_data():
+            with self._component_stream(dgp_index, "observed_covariates"):
+                return self.sample_observed_covariate_data(
+                    self.get_source_covariate_data())
+
+        observed_covariate_data = self._get_cached_component(
+            (dgp_index, "observed_covariates", observed_data_key),
+            sample_observed_covariate_data)
+
+        with self._component_stream(dgp_index, "potential_confounders"):
+            potential_confounder_indices = self.sample_potential_confounders(
+                covariate_indices)
+
+        # Sample the outcome and treatment transforms, the alignment
+        # adjustment and the transform constants from separate streams.
+        with self._component_stream(dgp_index, "outcome_transforms"):
+            outcome_covariate_transforms = self.sample_covariate_transforms(
+                potential_confounder_indices,
+                self.params.OUTCOME_MECHANISM_COVARIATE_SELECTION_PROBABILITY)
+
+        with self._component_stream(dgp_index, "treatment_transforms"):
+            treatment_covariate_transforms = self.sample_covariate_transforms(
+                potential_confounder_indices,
+                self.params.TREAT_MECHANISM_COVARIATE_SELECTION_PROBABILITY)
+
+        with self._component_stream(dgp_index, "alignment"):
+            outcome_covariate_transforms, treatment_covariate_transforms = \
+                self.align_covariate_transforms(
+                    outcome_covariate_transforms, treatment_covariate_transforms)
+
+        outcome_covariate_transforms = _sort_terms(outcome_covariate_transforms)
+        treatment_covariate_transforms = _sort_terms(treatment_covariate_transforms)
+
+        with self._component_stream(dgp_index, "outcome_constants"):
+            outcome_covariate_transforms = outcome_covariate_transforms.initialize_constants(
+                self.params.sample_subfunction_constants)
+
+        with self._component_stream(dgp_index, "treatment_constants"):
+            treatment_covariate_transforms = treatment_covariate_transforms.initialize_constants(
+                self.params.sample_subfunction_constants)
+
+        # Build the normalized functions. These are identified by their
+        # terms and the parameters used in their normalization.
+        def sample_treatment_assignment_function():
+            with self._component_stream(dgp_index, "treatment_function_normalization"):
+                return self.sample_treatment_assignment_function(
+                    treatment_covariate_transforms, observed_covariate_data)
+
+        treatment_assignment_logit_func, treatment_assignment_function = \
+            self._get_cached_component(
+                (dgp_index, "treatment_function", observed_data_key,
+                    _term_table_digest(treatment_covariate_transforms),
+                    self._parameter_key("TARGET_PROPENSITY_SCORE")),
+                sample_treatment_assignment_function)
+
+        def sample_untreated_outcome_subfunction():
+            outcome_values = None
+            if SamplingConstants.NORMALIZE_SAMPLED_OUTCOME_FUNCTION:
+                with self._component_stream(dgp_index, "outcome_function_normalization"):
+                    sampled_data = observed_covariate_data.sample(
+                        frac=SamplingConstants.NORMALIZATION_DATA_SAMPLE_FRACTION)
+                outcome_values = outcome_covariate_transforms.evaluate(sampled_data)
+
+            return self.build_untreated_outcome_subfunction(
+                outcome_covariate_transforms, outcome_values)
+
+        untreated_outcome_subfunc = self._get_cached_component(
+            (dgp_index, "untreated_outcome_subfunction", observed_data_key,
+                _term_table_digest(outcome_covariate_transforms)),
+            sample_untreated_outcome_subfunction)
+
+        with self._component_stream(dgp_index, "treatment_effect"):
+            base_treatment_effect, interaction_terms = \
+                self.sample_treatment_effect_interaction_terms(
+                    outcome_covariate_transforms)
+
+        if interaction_terms is not None:
+            def sample_treatment_effect_subfunction():
+                with self._component_stream(dgp_index, "treatment_effect_normalization"):
+                    sampled_data = observed_covariate_data.sample(
+                        frac=SamplingConstants.NORMALIZATION_DATA_SAMPLE_FRACTION)
+                treatment_effect_multiplier_values = interaction_terms.evaluate(sampled_data)
+
+                return self.build_treatment_effect_subfunction(
+                    base_treatment_effect, interaction_terms,
+                    treatment_effect_multiplier_values)
+
+            treat_effect_subfunc = self._get_cached_component(
+                (dgp_index, "treatment_effect_subfunction", observed_data_key,
+                    _term_table_digest(interaction_terms), base_treatment_effect),
+                sample_treatment_effect_subfunction)
+        else:
+            treat_effect_subfunc = base_treatment_effect
+
+        return self.build_dgp(
+            observed_covariate_data,
+            outcome_covariate_transforms, treatment_covariate_transforms,
+            treatment_assignment_logit_func, treatment_assignment_function,
+            None, untreated_outcome_subfunc, treat_effect_subfunc)
+
+    def sample_dgps(self, n_dgps, n_jobs=1, chunk_size=None):
+        """Sample the DGPs with indices 0 to `n_dgps` - 1 using :meth:`~maccabee.data_generation.coupled_sampler.CoupledDGPSampler.sample_dgp`. The DGPs are always sampled in the current process so that the components in the component cache are available to all DGPs.
+
+        Args:
+            n_dgps (int): The number of DGPs to sample.
+            n_jobs (int): Unused. Accepted for compatibility with :meth:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler.sample_dgps`. Defaults to 1.
+            chunk_size (int): Unused. Defaults to None.
+
+        Returns:
+            list: A list of `n_dgps` :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess` instances.
+        """
+        return [self.sample_dgp(dgp_index) for dgp_index in range(n_dgps)]
@@ -8,11 +8,13 @@ The documentation below explains the :func:`~maccabee.data_generation.data_gener
 
 from ..constants import Constants
 from ..exceptions import DGPVariableMissingException, DGPInvalidSpecificationException
-from .generated_data_set import GeneratedDataSet
-from .utils import evaluate_expression, CompiledExpression
+from .generated_data_set import GeneratedDataSet, _freeze_data_frame
+from .utils import evaluate_expression, as_expression, CompiledExpression, seeded_random_state
+from .sampled_functions import TermTable
 import pandas as pd
 import numpy as np
 from functools import partial, update_wrapper
+import inspect
 import types
 import sympy as sp
 
@@ -22,6 +24,22 @@ logger = get_logger(__name__)
 GENERATED_DATA_DICT_NAME = "_generated_data"
 DGPVariables = Constants.DGPVariables
 
+# The names of the DGP variables generated by cached data generating
+# methods, by DGP class.
+_CACHED_DGP_VARIABLES = {}
+
+def _freeze_dgp_variable(value):
+    # Mark the array which backs a cached DGP variable as read-only. Cached
+    # values are shared, by reference, by all of the data sets sampled from
+    # a DGP so they must not be modified in place.
+    if isinstance(value, pd.DataFrame):
+        return _freeze_data_frame(value)
+
+    array = value.to_numpy(copy=False) if isinstance(value, pd.Series) else value
+    if isinstance(array, np.ndarray):
+        array.flags.writeable = False
+    return value
+
 class DataGeneratingMethodContainerClass(type):
     # This is a meta-class which is applied to the base DataGeneratingProcess
     # class and ensures that all _generate_* methods are properly decorated
@@ -83,6 +101,8 @@ class DataGeneratingMethodWrapper():
                 logger.debug("Executing wrapped data generating callable.")
                 # Run the stored function.
                 val = wrapper.func(dgp, required_var_vals, *args, **kwargs)
+                if wrapper.cache_result:
+                    val = _freeze_dgp_variable(val)
 
                 # Store the value in the data dict.
                 data_dict[wrapper.generated_var] = val
@@ -164,16 +184,47 @@ class DataGeneratingProcess(metaclass=DataGeneratingMethodContainerClass):
     def get_data_analysis_mode(self):
         return self.data_analysis_mode
 
+    @classmethod
+    def _get_cached_dgp_variables(cls):
+        # The DGP variables generated by the data generating methods with
+        # cache_result=True. Overriding methods replace the inherited ones
+        # so the methods are resolved by name.
+        if cls not in _CACHED_DGP_VARIABLES:
+            _CACHED_DGP_VARIABLES[cls] = frozenset(
+                method.generated_var
+                for method in (
+                    inspect.getattr_static(cls, method_name)
+                    for method_name in dir(cls)
+                    if method_name.startswith("_generate"))
+                if isinstance(method, DataGeneratingMethodWrapper) and method.cache_result)
+
+        return _CACHED_DGP_VARIABLES[cls]
+
     # DGP PROCESS
-    def generate_dataset(self):
+    def generate_dataset(self, seed=None):
         """This is the primary external API method of this class. It is used to sample a data set (in the form of a :class:`~maccabee.data_generation.generated_data_set.GeneratedDataSet` instance) from the DGP.
 
+        Args:
+            seed (int): An optional seed for the stochastic DGP variables. Data sets sampled with the same seed, from the same DGP in the same data analysis mode, are identical provided the data generating methods draw from the global NumPy random state. See :class:`~maccabee.data_generation.dataset_handle.DatasetHandle`. Defaults to None, in which case the global random state is used unchanged.
+
         Returns:
             :class:`~maccabee.data_generation.generated_data_set.GeneratedDataSet`: a sampled :class:`~maccabee.data_generation.generated_data_set.GeneratedDataSet` instance.
 
         Raises:
             DGPVariableMissingException: If the execution order of the data generating methods is in conflict with their specified requirements such that a method's dependencies haven't been generated when it is executed.
         """
+        with seeded_random_state(seed):
+            self._run_data_generating_methods()
+
+        # The data set holds references to the (read-only) cached DGP
+        # variables, which are shared by all samples from the DGP, and its
+        # own copy of the stochastic variables, which the next sample
+        # replaces in the DGP's data dictionary.
+        generated_data_dict = getattr(self, GENERATED_DATA_DICT_NAME)
+        return GeneratedDataSet(generated_data_dict,
+            shared_dgp_variables=type(self)._get_cached_dgp_variables())
+
+    def _run_data_generating_methods(self):
         # TODO-FUTURE: consider specifying execution order either via a list of
         # method names or ordering values in method meta-data. This would
         # improve flexibility and extensibility of this base class.
@@ -209,9 +260,6 @@ class DataGeneratingProcess(metaclass=DataGeneratingMethodContainerClass):
         logger.debug("Generating observed outcomes")
         self._generate_observed_outcomes()
 
-        generated_data_dict = getattr(self, GENERATED_DATA_DICT_NAME)
-        return GeneratedDataSet(generated_data_dict)
-
     # DGP DEFINITION
     @data_generating_method(DGPVariables.COVARIATES_NAME, [])
     def _generate_observed_covars(self, input_vars):
@@ -277,11 +325,11 @@ class DataGeneratingProcess(metaclass=DataGeneratingMethodContainerClass):
         [CONCRETE] Generate the treatment assignment for each observed unit (``DGPVariables.TREATMENT_ASSIGNMENT_NAME``). A concrete implementation is provided which assigns treatment based on the propensity scores generated by :meth:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess._generate_true_propensity_scores`. This function can be used to assign treatment even if propensity scores are never generated/known.
 
         Returns:
-            :class:`numpy.ndarray`: an array containing the treatment assignment as a integer. 1 for treatment and 0 for control. It must contain `n_observations` entries.
+            :class:`numpy.ndarray`: an array containing the treatment assignment as a compact (``int8``) integer. 1 for treatment and 0 for control. It must contain `n_observations` entries.
         """
         propensity_scores = input_vars[DGPVariables.PROPENSITY_SCORE_NAME]
         return (np.random.uniform(
-            size=len(propensity_scores)) < propensity_scores).astype(int)
+            size=len(propensity_scores)) < propensity_scores).astype(np.int8)
 
 
     @data_generating_method(DGPVariables.OUTCOME_NOISE_NAME, [])
@@ -399,11 +447,11 @@ class SampledDataGeneratingProcess(DataGeneratingProcess):
         if compile_functions:
             symbols = sp.symbols(list(observed_covariate_data.columns))
             treatment_effect_subfunction = \
-                CompiledExpression(treatment_effect_subfunction, symbols)
+                CompiledExpression(as_expression(treatment_effect_subfunction), symbols)
             untreated_outcome_subfunction = \
-                CompiledExpression(untreated_outcome_subfunction, symbols)
+                CompiledExpression(as_expression(untreated_outcome_subfunction), symbols)
             treatment_assignment_function = \
-                CompiledExpression(treatment_assignment_function, symbols)
+                CompiledExpression(as_expression(treatment_assignment_function), symbols)
 
 
         # SAMPLED SGP CONFIG
@@ -420,13 +468,25 @@ class SampledDataGeneratingProcess(DataGeneratingProcess):
         # Outcome function and subfunctions
         self.treatment_effect_subfunction = treatment_effect_subfunction
         self.untreated_outcome_subfunction = untreated_outcome_subfunction
-        self.outcome_function = outcome_function
+        self._outcome_function = outcome_function
 
         # DATA
         self.observed_covariate_data = observed_covariate_data
 
         self.data_source = data_source
 
+    @property
+    def outcome_function(self):
+        # The full outcome function is not used in data generation so,
+        # if it isn't supplied, it is built from the subfunctions on access.
+        if self._outcome_function is None:
+            self._outcome_function = as_expression(self.untreated_outcome_subfunction) + \
+                DGPVariables._OUTCOME_NOISE_SYMBOL + \
+                (DGPVariables._TREATMENT_ASSIGNMENT_SYMBOL *
+                    as_expression(self.treatment_effect_subfunction))
+
+        return self._outcome_function
+
     @data_generating_method(DGPVariables.COVARIATES_NAME, [], cache_result=True)
     def _generate_observed_covars(self, input_vars):
         return self.observed_covariate_data
@@ -443,6 +503,21 @@ class SampledDataGeneratingProcess(DataGeneratingProcess):
 
         observed_covariate_data = input_vars[DGPVariables.COVARIATES_NAME]
 
+        if isinstance(self.outcome_covariate_transforms, TermTable):
+            # Sampled transforms are evaluated together, directly from
+            # the unique terms in the term tables.
+            all_transforms = TermTable.concatenate([
+                self.outcome_covariate_transforms,
+                self.treatment_covariate_transforms]).unique()
+
+            transform_values = all_transforms.evaluate_terms(observed_covariate_data)
+            return pd.DataFrame(
+                transform_values,
+                columns=[
+                    f"{DGPVariables.TRANSFORMED_COVARIATES_NAME}{index}"
+                    for index in range(len(all_transforms))
+                ])
+
         all_transforms = list(set(self.outcome_covariate_transforms).union(
             self.treatment_covariate_transforms))
 
@@ -473,7 +548,7 @@ class SampledDataGeneratingProcess(DataGeneratingProcess):
 
         # Sample treatment assignment given pre-calculated propensity_scores
         T = (np.random.uniform(
-            size=self.n_observations) < propensity_scores).astype(int)
+            size=self.n_observations) < propensity_scores).astype(np.int8)
 
         # Only perform balance adjustment if there is some heterogeneity
         # in the propensity scores.
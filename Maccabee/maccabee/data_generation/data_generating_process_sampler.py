@@ -1,14 +1,15 @@
 """This module contains the :class:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess` class which is used to sample :term:`DGPs <DGP>` given sampling parameters which determine where in the :term:`distributional problem space` the :class:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess` targets for sampling.
 """
 
-from sympy.abc import x
-import sympy as sp
 import numpy as np
-import pandas as pd
-from itertools import combinations
+from functools import partial
+from multiprocessing import cpu_count
 from ..constants import Constants
-from .utils import select_objects_given_probability, evaluate_expression, initialize_expression_constants
+from .utils import select_objects_given_probability, select_combinations_given_probability, seeded_random_state
 from .data_generating_process import SampledDataGeneratingProcess
+from ..data_sources.data_sources import StaticDataSource
+from ..utilities.multiprocessing import robust_parallel_map
+from .sampled_functions import TermTable, SampledFunction, SUBFUNCTION_FORM_NAMES, MAX_TERM_COVARIATES, CONSTANT_TERM_CODE
 
 from ..logging import get_logger
 logger = get_logger(__name__)
@@ -28,20 +29,18 @@ class DataGeneratingProcessSampler():
         data_source (:class:`~maccabee.data_sources.data_sources.DataSource`): A :class:`~maccabee.data_sources.data_sources.DataSource` instance which provides observed covariates. See the :mod:`~maccabee.data_sources` module docs for more detail.
         dgp_class (:class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`): A class which inherits from :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`. Defaults to :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`. This is only necessary if you would like to customize some aspect of the sampled DGP which is not controllable through the sampling parameters provided in `parameters`.
         dgp_kwargs (dict): A dictionary of keyword arguments which is passed to the sampled DGP at instantiation. Defaults to {}.
+        dgp_cache (:class:`~maccabee.data_generation.dgp_cache.DGPCache`): A cache in which DGPs sampled with a seed are stored. DGPs which are already in the cache are loaded rather than sampled. Defaults to None.
     """
     def __init__(self, parameters, data_source,
-        dgp_class=SampledDataGeneratingProcess, dgp_kwargs={}):
+        dgp_class=SampledDataGeneratingProcess, dgp_kwargs={}, dgp_cache=None):
 
         self.dgp_class = dgp_class
         self.params = parameters
         self.data_source = data_source
         self.dgp_kwargs = dgp_kwargs
+        self.dgp_cache = dgp_cache
 
-        # Used to memoize calculation of covariate combinations
-        # for sampled tranforms.
-        self.covariate_combinations_store = {}
-
-    def sample_dgp(self):
+    def sample_dgp(self, seed=None):
         """This is the primary external method of this class. It is used to sample a new DGP. Internally, a number of steps are executed:
 
         * A set of observable covariates is sampled from the :class:`~maccabee.data_sources.data_sources.DataSource` supplied at instantiation.
@@ -51,9 +50,34 @@ class DataGeneratingProcessSampler():
         * The treatment and outcome functions are assembled and normalized to meet parameters for target propensity score and treatment effect heterogeneity.
         * The DGP instance is assembled using the class and kwargs supplied at instantiation time and the components produced by the steps above.
 
+        Args:
+            seed (int): A seed which determines the sampled DGP. If supplied, all random draws are made from the global random state seeded with `seed` and the state is restored afterwards. If the sampler has a DGP cache, seeded DGPs are loaded from and stored in the cache. Defaults to None, in which case the DGP is sampled using the current global random state.
+
         Returns:
             :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`: A :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess` instance representing a sampled DGP.
         """
+        cache_key = None
+        if seed is not None and self.dgp_cache is not None:
+            cache_key = self.dgp_cache.get_key(self, seed)
+
+        if cache_key is not None:
+            dgp = self.dgp_cache.load(
+                cache_key, self.data_source, self.dgp_class, self.dgp_kwargs)
+            if dgp is not None:
+                return dgp
+
+        with seeded_random_state(seed):
+            dgp = self._sample_dgp()
+
+        if cache_key is not None:
+            self.dgp_cache.store(cache_key, dgp)
+
+        return dgp
+
+    def _sample_dgp(self):
+        # Sample a DGP using the current global random state. The steps are
+        # described in the docstring of sample_dgp.
+
 
         # NOTE: for most customizing cases, this function can and should
         # remain unchanged as it only defines an execution order and passes
@@ -61,8 +85,12 @@ class DataGeneratingProcessSampler():
         # below.
 
         logger.info("Getting covariate data set from data source")
-        source_covariate_data = self.data_source.get_covar_df()
-        covariate_symbols = np.array(sp.symbols(self.data_source.get_covar_names()))
+        source_covariate_data = self.get_source_covariate_data()
+
+        # Covariates are referred to by their index in the list of
+        # covariate names throughout sampling. See the sampled_functions
+        # module for the term table representation which uses these indices.
+        covariate_indices = np.arange(len(self.data_source.get_covar_names()))
 
         # Sample the source data to generate the observed covariate data.
         logger.info("Sampling observed covariates from data set")
@@ -72,33 +100,187 @@ class DataGeneratingProcessSampler():
         # Select the observed variables which may appear in the assignment or
         # outcome functions. These are potential confounders.
         logger.info("Sampling potential confounder covariates")
-        potential_confounder_symbols = self.sample_potential_confounders(
-            covariate_symbols)
-        logger.debug(f"Sampled potential confounder covariates: {potential_confounder_symbols}")
+        potential_confounder_indices = self.sample_potential_confounders(
+            covariate_indices)
+        logger.debug("Sampled potential confounder covariates: %s",
+            potential_confounder_indices)
 
         # Sample the covariate transforms which make up the assignment and
         # outcome functions.
         logger.info("Sampling outcome and treatment covariate transforms")
         outcome_covariate_transforms, treatment_covariate_transforms = \
             self.sample_treatment_and_outcome_covariate_transforms(
-                potential_confounder_symbols)
-        logger.debug(f"Sampled outcome and treatment covariate transforms: {outcome_covariate_transforms} | {treatment_covariate_transforms}")
+                potential_confounder_indices)
+        logger.debug("Sampled outcome and treatment covariate transforms: %s | %s",
+            outcome_covariate_transforms, treatment_covariate_transforms)
 
         # Build the treatment assignment function.
         logger.info("Building treatment function from transforms")
         treatment_assignment_logit_func, treatment_assignment_function = \
             self.sample_treatment_assignment_function(
                 treatment_covariate_transforms, observed_covariate_data)
-        logger.debug(f"Treatment function: {treatment_assignment_function}")
+        logger.debug("Treatment function: %s", treatment_assignment_function)
 
         # Build the outcome and treatment effect functions.
         logger.info("Building outcome function from transforms")
         outcome_function, untreated_outcome_subfunc, treat_effect_subfunc = \
             self.sample_outcome_function(
                 outcome_covariate_transforms, observed_covariate_data)
-        logger.debug(f"Outcomr function: {outcome_function}")
+        logger.debug("Outcome subfunctions: %s | %s",
+            untreated_outcome_subfunc, treat_effect_subfunc)
 
         # Construct DGP
+        return self.build_dgp(
+            observed_covariate_data,
+            outcome_covariate_transforms, treatment_covariate_transforms,
+            treatment_assignment_logit_func, treatment_assignment_function,
+            outcome_function, untreated_outcome_subfunc, treat_effect_subfunc)
+
+    def sample_dgps(self, n_dgps, n_jobs=1, chunk_size=None):
+        """Sample `n_dgps` DGPs together. This is equivalent to calling :meth:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler.sample_dgp` `n_dgps` times but is much faster when sampling many DGPs. For static data sources, including the out-of-core data sources, the covariate data is fetched once and a single normalization data sample is shared by all DGPs in a batch. The sampled functions of all the DGPs are then normalized together, by evaluating all of their terms in one stacked pass over the normalization data. For stochastic data sources, like :class:`~maccabee.data_sources.data_sources.RandomNormalDataSource`, new covariate data is fetched for each DGP, as in :meth:`sample_dgp`, and the functions of each DGP are normalized together using a sample of the DGP's own observed covariate data.
+
+        Batches are built from the same steps as :meth:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler.sample_dgp` with the exception of the function sampling steps, which are replaced by the separate term sampling and function building steps used in those methods. Subclasses which override :meth:`sample_treatment_assignment_function`, :meth:`sample_treatment_effect_subfunction` or :meth:`sample_outcome_function` should use :meth:`sample_dgp`.
+
+        Args:
+            n_dgps (int): The number of DGPs to sample.
+            n_jobs (int): The number of processes over which to split the sampling. If greater than 1, the DGPs are sampled in chunks in worker processes using :func:`~maccabee.utilities.multiprocessing.robust_parallel_map`. Use -1 for one process per CPU. Defaults to 1.
+            chunk_size (int): The number of DGPs sampled in each chunk when sampling in parallel. Defaults to None, in which case the DGPs are split evenly across the `n_jobs` processes.
+
+        Returns:
+            list: A list of `n_dgps` :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess` instances.
+        """
+        if n_jobs == -1:
+            n_jobs = cpu_count()
+
+        if n_jobs <= 1 or n_dgps <= 1:
+            return self._sample_dgp_batch(n_dgps)
+
+        # Split the DGPs into chunks which are sampled in the worker processes.
+        if chunk_size is None:
+            chunk_size = int(np.ceil(n_dgps/n_jobs))
+        chunk_sizes = [chunk_size]*(n_dgps//chunk_size)
+        if n_dgps % chunk_size > 0:
+            chunk_sizes.append(n_dgps % chunk_size)
+
+        logger.info(f"Sampling {n_dgps} DGPs in {len(chunk_sizes)} chunks using {n_jobs} processes")
+        dgp_chunks = robust_parallel_map(
+            partial(_sample_dgp_chunk, self),
+            chunk_sizes,
+            n_jobs=min(n_jobs, len(chunk_sizes)))
+
+        return [dgp for dgp_chunk in dgp_chunks for dgp in dgp_chunk]
+
+    def _sample_dgp_batch(self, n_dgps):
+        # Sample a batch of DGPs in the current process. The structure of each
+        # DGP is sampled first and then all the functions are normalized together.
+        # The covariate data of static data sources is fetched once and
+        # shared by all DGPs in the batch. Other data sources sample new
+        # covariate data on each fetch, so it is fetched for each DGP in order
+        # to preserve the variability of the covariates between DGPs.
+        shared_source_data = isinstance(self.data_source, StaticDataSource) or \
+            self.data_source.out_of_core
+
+        covariate_indices = np.arange(len(self.data_source.get_covar_names()))
+        if shared_source_data:
+            logger.info("Getting covariate data set from data source")
+            source_covariate_data = self.get_source_covariate_data()
+
+            # The normalization data sample is shared by all DGPs in the
+            # batch. It has the same expected size as the sample drawn from
+            # the observed data of each individual DGP in sample_dgp.
+            normalization_data_fraction = \
+                SamplingConstants.NORMALIZATION_DATA_SAMPLE_FRACTION*self.params.OBSERVATION_PROBABILITY
+            if source_covariate_data is None:
+                normalization_data = self.data_source.sample_covar_df(
+                    frac=normalization_data_fraction)
+            else:
+                normalization_data = source_covariate_data.sample(
+                    frac=normalization_data_fraction)
+
+        logger.info(f"Sampling covariate transforms for {n_dgps} DGPs")
+        dgp_components = []
+        for _ in range(n_dgps):
+            if not shared_source_data:
+                source_covariate_data = self.get_source_covariate_data()
+
+            observed_covariate_data = self.sample_observed_covariate_data(
+                source_covariate_data)
+            potential_confounder_indices = self.sample_potential_confounders(
+                covariate_indices)
+            outcome_covariate_transforms, treatment_covariate_transforms = \
+                self.sample_treatment_and_outcome_covariate_transforms(
+                    potential_confounder_indices)
+            base_treatment_effect, interaction_terms = \
+                self.sample_treatment_effect_interaction_terms(
+                    outcome_covariate_transforms)
+
+            dgp_components.append((
+                observed_covariate_data,
+                outcome_covariate_transforms, treatment_covariate_transforms,
+                base_treatment_effect, interaction_terms))
+
+        # Evaluate the base treatment logit, outcome and treatment effect
+        # multiplier functions of every DGP in stacked passes. All of the
+        # functions are evaluated together on the shared normalization data
+        # if there is one. Otherwise, the functions of each DGP are evaluated
+        # together on a sample of the DGP's own observed data.
+        logger.info(f"Normalizing functions for {n_dgps} DGPs")
+        function_term_tables = []
+        for observed_covariate_data, outcome_transforms, treatment_transforms, _, interaction_terms in dgp_components:
+            dgp_term_tables = [treatment_transforms, outcome_transforms]
+            if interaction_terms is not None:
+                dgp_term_tables.append(interaction_terms)
+
+            if shared_source_data:
+                function_term_tables.extend(dgp_term_tables)
+            else:
+                function_term_tables.append((dgp_term_tables, observed_covariate_data.sample(
+                    frac=SamplingConstants.NORMALIZATION_DATA_SAMPLE_FRACTION)))
+
+        if shared_source_data:
+            function_values = iter(_evaluate_stacked_functions(
+                function_term_tables, normalization_data))
+        else:
+            function_values = iter([
+                values
+                for dgp_term_tables, dgp_normalization_data in function_term_tables
+                for values in _evaluate_stacked_functions(
+                    dgp_term_tables, dgp_normalization_data)
+            ])
+
+        dgps = []
+        for components in dgp_components:
+            (observed_covariate_data,
+                outcome_covariate_transforms, treatment_covariate_transforms,
+                base_treatment_effect, interaction_terms) = components
+
+            treatment_assignment_logit_func, treatment_assignment_function = \
+                self.build_treatment_assignment_function(
+                    treatment_covariate_transforms, next(function_values))
+
+            untreated_outcome_subfunc = self.build_untreated_outcome_subfunction(
+                outcome_covariate_transforms, next(function_values))
+
+            if interaction_terms is not None:
+                treat_effect_subfunc = self.build_treatment_effect_subfunction(
+                    base_treatment_effect, interaction_terms, next(function_values))
+            else:
+                treat_effect_subfunc = base_treatment_effect
+
+            dgps.append(self.build_dgp(
+                observed_covariate_data,
+                outcome_covariate_transforms, treatment_covariate_transforms,
+                treatment_assignment_logit_func, treatment_assignment_function,
+                None, untreated_outcome_subfunc, treat_effect_subfunc))
+
+        return dgps
+
+    def build_dgp(self, observed_covariate_data,
+        outcome_covariate_transforms, treatment_covariate_transforms,
+        treatment_assignment_logit_func, treatment_assignment_function,
+        outcome_function, untreated_outcome_subfunc, treat_effect_subfunc):
+        # 6. Instantiate the DGP using the class and kwargs supplied at
+        # instantiation time and the sampled components.
         logger.info(f"Instantiating DGP using class: {self.dgp_class}")
         dgp = self.dgp_class(
             params=self.params,
@@ -115,6 +297,14 @@ class DataGeneratingProcessSampler():
 
         return dgp
 
+    def get_source_covariate_data(self):
+        # The full covariate data of the data source, from which the observed
+        # covariates are sampled. Out-of-core data sources sample their own
+        # rows so their full data is never loaded and None is returned.
+        if self.data_source.out_of_core:
+            return None
+        return self.data_source.get_covar_df()
+
     def sample_observed_covariate_data(self, source_covariate_data):
         # 1. Sample a subset of the observable covariates.
         # For now, we support simple uniform sampling. In future, we may
@@ -124,34 +314,39 @@ class DataGeneratingProcessSampler():
         # NOTE: to reduce variance in the DGP and Data sampling,
         # observed covariates are selected once, globally. All data sets
         # are then sampled based on this sample of covariates.
+        if source_covariate_data is None:
+            # Only the sampled rows are read from out-of-core data sources.
+            return self.data_source.sample_covar_df(
+                frac=self.params.OBSERVATION_PROBABILITY)
+
         observed_covariate_data = source_covariate_data.sample(
             frac=self.params.OBSERVATION_PROBABILITY)
 
         return observed_covariate_data
 
-    def sample_potential_confounders(self, covariate_symbols):
+    def sample_potential_confounders(self, covariate_indices):
         # 2. Sample potential confounders. These are the covariates which could
         # enter the treatment and/or outcome functions. All covariates not
         # selected here are non-predictive/nuisance covariates which can
         # make the causal model process harder.
-        potential_confounder_symbols = select_objects_given_probability(
-            objects_to_sample=covariate_symbols,
+        potential_confounder_indices = select_objects_given_probability(
+            objects_to_sample=covariate_indices,
             selection_probability=self.params.POTENTIAL_CONFOUNDER_SELECTION_PROBABILITY)
 
-        if len(potential_confounder_symbols) == 0:
-            potential_confounder_symbols = [np.random.choice(covariate_symbols)]
+        if len(potential_confounder_indices) == 0:
+            potential_confounder_indices = np.array([np.random.choice(covariate_indices)])
 
-        return potential_confounder_symbols
+        return potential_confounder_indices
 
-    def sample_covariate_transforms(self, covariate_symbols,
+    def sample_covariate_transforms(self, covariate_indices,
         transform_probabilities, empty_allowed=False):
         # 3A. Sample a set of transforms which will be applied to the covariates
-        # supplied in covariate_symbols based on the transform probabilities in
-        # transform_probabilities
+        # with the indices in covariate_indices based on the transform
+        # probabilities in transform_probabilities
 
         # The set of transforms is governed by the specific probabilities for
         # each possible transform type. Each transform is parameterized by
-        # a set of constants which are then initialized randomly.
+        # a set of constants which are initialized randomly in the next step.
 
         # These transforms are used in the finalized functional form of the
         # treat/outcome functions. Each of these functions
@@ -159,66 +354,65 @@ class DataGeneratingProcessSampler():
         # function). The subfunction form probabilities and the combination form
         # is different for the treat and outcome function.
 
+        # The selected transforms are returned as an (uninitialized) TermTable
+        # in which each term is identified by its form code and covariate indices.
+
         # TODO-FUTURE: Post-process the output of this function to group terms
         # based on the same covariates and produce new multiplicative
         # combinations of different covariates as in Dorie et al (2019)
-        selected_covariate_transforms = []
+        covariate_names = self.data_source.get_covar_names()
+        selected_transform_keys = []
 
         # Find continuous covariates for use in non-discrete transforms.
-        continuous_covariate_symbols = list(filter(
-            lambda sym: str(sym) not in self.data_source.get_discrete_covar_names(),
-                covariate_symbols))
+        discrete_covariate_names = set(self.data_source.get_discrete_covar_names())
+        continuous_covariate_indices = np.array([
+            index for index in covariate_indices
+            if covariate_names[index] not in discrete_covariate_names
+        ], dtype=int)
 
         # Loop over the transformation forms in SUBFUNCTION_FORMS.
-        for transform_name, transform_spec in SamplingConstants.SUBFUNCTION_FORMS.items():
+        for form_code, transform_name in enumerate(SUBFUNCTION_FORM_NAMES):
+            transform_spec = SamplingConstants.SUBFUNCTION_FORMS[transform_name]
 
             # Extract the subfunction form information.
-            transform_expression = transform_spec[SamplingConstants.EXPRESSION_KEY]
             transform_covariate_symbols = transform_spec[SamplingConstants.COVARIATE_SYMBOLS_KEY]
             transform_discrete_allowed = transform_spec[SamplingConstants.DISCRETE_ALLOWED_KEY]
 
-            # Access/generate possible combinations of covariates for the given transform.
-            # This is the set of all possible covar instantiations of this subfunction.
-            num_covars_in_transform = len(transform_covariate_symbols)
-            covar_combination_key = (transform_discrete_allowed, num_covars_in_transform)
-
-            # Check if combinations previously generated. If not, generate.
-            if covar_combination_key in self.covariate_combinations_store:
-                covariate_combinations = self.covariate_combinations_store[
-                    covar_combination_key]
+            if not transform_discrete_allowed:
+                usable_covariate_indices = continuous_covariate_indices
             else:
-                if not transform_discrete_allowed:
-                    usable_covariate_symbols = continuous_covariate_symbols
-                else:
-                    usable_covariate_symbols = covariate_symbols
-
-                covariate_combinations = np.array(
-                    list(combinations(
-                        usable_covariate_symbols,
-                        num_covars_in_transform)))
-
-                self.covariate_combinations_store[covar_combination_key] = \
-                    covariate_combinations
-
-            # Sample from the set of all possible combinations.
-            selected_covar_combinations = select_objects_given_probability(
-                objects_to_sample=covariate_combinations,
+                usable_covariate_indices = covariate_indices
+
+            # Sample from the set of all possible combinations of covariates for
+            # the given transform. This is the set of all possible covar
+            # instantiations of this subfunction. The set grows factorially with
+            # the number of covariates so combinations are sampled without
+            # materializing it.
+            num_covars_in_transform = len(transform_covariate_symbols)
+            selected_covar_combinations = select_combinations_given_probability(
+                objects_to_sample=usable_covariate_indices,
+                combination_size=num_covars_in_transform,
                 selection_probability=transform_probabilities[transform_name])
 
-            # Instantiate the subfunction with the sampled covariates.
-            selected_covariate_transforms.extend([transform_expression.subs(
-                                    zip(transform_covariate_symbols, covar_comb))
-                                    for covar_comb in selected_covar_combinations
-                                ])
+            # Record the subfunction key for each of the sampled combinations.
+            # Keys are padded to the maximum number of covariates in a term.
+            selected_transform_keys.extend([
+                (form_code, *covar_comb,
+                    *([-1]*(MAX_TERM_COVARIATES - num_covars_in_transform)))
+                for covar_comb in selected_covar_combinations
+            ])
 
         # Add at least one transform if empty_allowed is False
         # and no transforms selected above. This term is a simple constant
         # which represents the least complex/most linear non-empty transform.
         # This aligns with the intent of parameterizations which would result in
         # no transforms being selected.
-        if len(selected_covariate_transforms) == 0 and not empty_allowed:
-            selected_covariate_transforms.append(
-                list(SamplingConstants.SUBFUNCTION_CONSTANT_SYMBOLS)[0])
+        if len(selected_transform_keys) == 0 and not empty_allowed:
+            selected_transform_keys.append(
+                (CONSTANT_TERM_CODE, *([-1]*MAX_TERM_COVARIATES)))
+
+        selected_covariate_transforms = TermTable.from_keys(
+            covariate_names, selected_transform_keys)
 
         # The number of possible transform instantiations grows factorially
         # with the number of covariates in the data. To avoid complexity blow up,
@@ -229,21 +423,24 @@ class DataGeneratingProcessSampler():
         #such that the expected number selected is equal to the max.
         max_transform_count = \
             SamplingConstants.MAX_MULTIPLE_TRANSFORMED_TO_ORIGINAL_TERMS*len(
-                covariate_symbols)
+                covariate_indices)
 
         if len(selected_covariate_transforms) > max_transform_count:
             selection_p = max_transform_count/len(selected_covariate_transforms)
 
-            logger.debug(f"Running covariate transform term limiter with selection probability of {selection_p} for {len(selected_covariate_transforms)} transforms")
-            selected_covariate_transforms = select_objects_given_probability(
-                objects_to_sample=selected_covariate_transforms,
+            logger.debug("Running covariate transform term limiter with selection probability of %s for %s transforms",
+                selection_p, len(selected_covariate_transforms))
+            selected_transform_positions = select_objects_given_probability(
+                objects_to_sample=np.arange(len(selected_covariate_transforms)),
                 selection_probability=selection_p)
 
-            selected_covariate_transforms = list(selected_covariate_transforms)
-            logger.debug(f"{len(selected_covariate_transforms)} transforms selected")
+            selected_covariate_transforms = selected_covariate_transforms.take(
+                np.sort(selected_transform_positions))
+            logger.debug("%s transforms selected", len(selected_covariate_transforms))
+
         return selected_covariate_transforms
 
-    def sample_treatment_and_outcome_covariate_transforms(self, potential_confounder_symbols):
+    def sample_treatment_and_outcome_covariate_transforms(self, potential_confounder_indices):
         # 3B. Sample covariate transforms for the treatment and outcome function
         # and then modify the sampled transforms to generate desired alignment.
         # IE, adjust so that there is the desired amount of overlap in transformed
@@ -251,15 +448,37 @@ class DataGeneratingProcessSampler():
         # between the two functions.
 
         outcome_covariate_transforms = self.sample_covariate_transforms(
-                potential_confounder_symbols,
+                potential_confounder_indices,
                 self.params.OUTCOME_MECHANISM_COVARIATE_SELECTION_PROBABILITY)
 
         treatment_covariate_transforms = self.sample_covariate_transforms(
-                potential_confounder_symbols,
+                potential_confounder_indices,
                 self.params.TREAT_MECHANISM_COVARIATE_SELECTION_PROBABILITY)
 
-        set_outcome_covariate_transforms = set(outcome_covariate_transforms)
-        set_treatment_covariate_transforms = set(treatment_covariate_transforms)
+        outcome_covariate_transforms, treatment_covariate_transforms = \
+            self.align_covariate_transforms(
+                outcome_covariate_transforms, treatment_covariate_transforms)
+
+        # Initialize the constants in each set of transforms separately.
+        outcome_covariate_transforms = outcome_covariate_transforms.initialize_constants(
+            self.params.sample_subfunction_constants)
+
+        treatment_covariate_transforms = treatment_covariate_transforms.initialize_constants(
+            self.params.sample_subfunction_constants)
+
+        return outcome_covariate_transforms, treatment_covariate_transforms
+
+    def align_covariate_transforms(self,
+        outcome_covariate_transforms, treatment_covariate_transforms):
+        # 3C. Adjust the (uninitialized) outcome and treatment transforms
+        # to produce the desired alignment.
+
+        # Alignment is performed on the keys of the (uninitialized) transforms,
+        # which identify each transform by its form and covariates.
+        covariate_names = self.data_source.get_covar_names()
+
+        set_outcome_covariate_transforms = set(outcome_covariate_transforms.keys())
+        set_treatment_covariate_transforms = set(treatment_covariate_transforms.keys())
 
         # Unique set of all covariate transforms
         all_transforms = set_outcome_covariate_transforms.union(
@@ -277,21 +496,27 @@ class DataGeneratingProcessSampler():
             current_alignment_proportion = len(already_aligned_transforms)/len(alignment_base)
             alignment_diff = current_alignment_proportion - self.params.ACTUAL_CONFOUNDER_ALIGNMENT
 
-            logger.debug(f"Running alignment adjustment with alignment diff {alignment_diff}")
+            logger.debug("Running alignment adjustment with alignment diff %s", alignment_diff)
 
             # Alignment diff positive => too much alignment between functions.
             if alignment_diff > 0.01:
 
-                # Randomly select covariates to unalign.
+                # Randomly select covariates to unalign. Keys are sorted
+                # so that selection is reproducible given the random state.
                 expected_num_to_unalign = alignment_diff*len(alignment_base)
                 unalign_probability = \
                     expected_num_to_unalign/len(already_aligned_transforms)
 
-                transforms_to_unalign = select_objects_given_probability(
-                        list(already_aligned_transforms),
+                sorted_aligned_transforms = sorted(already_aligned_transforms)
+                transforms_to_unalign = [
+                    sorted_aligned_transforms[index]
+                    for index in select_objects_given_probability(
+                        np.arange(len(sorted_aligned_transforms)),
                         selection_probability=unalign_probability)
+                ]
 
-                logger.debug(f"Reduced alignment. Unalign target {expected_num_to_unalign}. Unalign actual {len(transforms_to_unalign)}")
+                logger.debug("Reduced alignment. Unalign target %s. Unalign actual %s",
+                    expected_num_to_unalign, len(transforms_to_unalign))
 
                 # Remove aligned terms proportional to the size of each of the
                 # functions to preserve non-linearity targets.
@@ -305,45 +530,42 @@ class DataGeneratingProcessSampler():
                     else:
                         set_treatment_covariate_transforms.remove(transform)
 
-                aligned_transforms = list(already_aligned_transforms)
+                aligned_transforms = sorted(already_aligned_transforms)
 
             # Alignment diff negative => not enough alignment between functions.
             elif alignment_diff < -0.01:
-                new_aligned_transforms = select_objects_given_probability(
-                        list(alignment_base - already_aligned_transforms),
+                unaligned_transforms = sorted(
+                    alignment_base - already_aligned_transforms)
+                new_aligned_transforms = [
+                    unaligned_transforms[index]
+                    for index in select_objects_given_probability(
+                        np.arange(len(unaligned_transforms)),
                         selection_probability=abs(alignment_diff))
+                ]
 
-                logger.debug(f"Increasing alignment. New aligned terms: {len(new_aligned_transforms)}")
+                logger.debug("Increasing alignment. New aligned terms: %s",
+                    len(new_aligned_transforms))
 
                 aligned_transforms = \
-                    list(new_aligned_transforms) + list(already_aligned_transforms)
+                    new_aligned_transforms + sorted(already_aligned_transforms)
             else:
-                aligned_transforms = list(already_aligned_transforms)
+                aligned_transforms = sorted(already_aligned_transforms)
         else:
-            logger.debug(f"Skipping alignment adjustment")
-            aligned_transforms = list(already_aligned_transforms)
+            logger.debug("Skipping alignment adjustment")
+            aligned_transforms = sorted(already_aligned_transforms)
 
         # Extract treat and outcome exclusive transforms.
-        treat_only_transforms = list(set_treatment_covariate_transforms.difference(
+        treat_only_transforms = sorted(set_treatment_covariate_transforms.difference(
             aligned_transforms))
-        outcome_only_transforms = list(set_outcome_covariate_transforms.difference(
+        outcome_only_transforms = sorted(set_outcome_covariate_transforms.difference(
             aligned_transforms))
 
         # Build the set of transforms for each function by
         # taking the union of the aligned transforms with unaligned transforms.
-        outcome_covariate_transforms = np.hstack(
-            [aligned_transforms, outcome_only_transforms])
-        treatment_covariate_transforms = np.hstack(
-            [aligned_transforms, treat_only_transforms])
-
-        # Initialize the constants in each set of transforms separately.
-        outcome_covariate_transforms= initialize_expression_constants(
-            self.params.sample_subfunction_constants,
-            outcome_covariate_transforms)
-
-        treatment_covariate_transforms= initialize_expression_constants(
-            self.params.sample_subfunction_constants,
-            treatment_covariate_transforms)
+        outcome_covariate_transforms = TermTable.from_keys(
+            covariate_names, aligned_transforms + outcome_only_transforms)
+        treatment_covariate_transforms = TermTable.from_keys(
+            covariate_names, aligned_transforms + treat_only_transforms)
 
         return outcome_covariate_transforms, treatment_covariate_transforms
 
@@ -358,20 +580,27 @@ class DataGeneratingProcessSampler():
         # TODO-FUTURE: add non-linear activation function
         # TODO-FUTURE: enable overlap adjustment
 
-        # Build base treatment logit function. Additive combination of the true covariates.
-        base_treatment_logit_expression = np.sum(
-            treatment_covariate_transforms)
-
-        # Normalize if config specifies.
+        # Evaluate the base logit function, an additive combination
+        # of the transformed covariates, if normalization is required.
+        logit_values = None
         if SamplingConstants.NORMALIZE_SAMPLED_TREATMENT_FUNCTION:
-            logger.debug("Normalizing treatment function using mean centering and std scaling.")
             # Sample data to evaluate distribution.
             sampled_data = observed_covariate_data.sample(
                 frac=SamplingConstants.NORMALIZATION_DATA_SAMPLE_FRACTION)
+            logit_values = treatment_covariate_transforms.evaluate(sampled_data)
+
+        return self.build_treatment_assignment_function(
+            treatment_covariate_transforms, logit_values)
 
-            # Adjust logit
-            logit_values = evaluate_expression(
-                base_treatment_logit_expression, sampled_data)
+    def build_treatment_assignment_function(self,
+        treatment_covariate_transforms, logit_values):
+        # 4A. Build the (normalized) treatment assignment function from the
+        # treatment transforms and the values of their sum on the
+        # normalization data. The values are None if normalization is off.
+
+        # Normalize if config specifies.
+        if SamplingConstants.NORMALIZE_SAMPLED_TREATMENT_FUNCTION:
+            logger.debug("Normalizing treatment function using mean centering and std scaling.")
 
             max_logit = np.max(logit_values)
             min_logit = np.min(logit_values)
@@ -382,25 +611,25 @@ class DataGeneratingProcessSampler():
             # then return the target logit. If not normalize to meet target.
             if np.isclose(max_logit, min_logit):
                 logger.debug("Detected homogenous treatment probability, rewriting treatment function as constant.")
-                treatment_assignment_logit_function = self.params.TARGET_MEAN_LOGIT
+                treatment_assignment_logit_function = SampledFunction(
+                    TermTable.empty(treatment_covariate_transforms.covariate_names),
+                    offset=self.params.TARGET_MEAN_LOGIT)
             else:
                 # This is only an approximate normalization. It will shift the mean to zero
                 # but the exact effect on std will depend on the distribution.
-                normalized_treatment_logit_expression = \
-                    (base_treatment_logit_expression - mean_logit)/std_logit
-
-                targeted_treatment_logit_expression = \
-                    normalized_treatment_logit_expression + self.params.TARGET_MEAN_LOGIT
-
-                treatment_assignment_logit_function = targeted_treatment_logit_expression
+                # The normalized logit is (base - mean)/std + target.
+                treatment_assignment_logit_function = SampledFunction(
+                    treatment_covariate_transforms,
+                    scale=1/std_logit,
+                    offset=self.params.TARGET_MEAN_LOGIT - mean_logit/std_logit)
         else:
             # Shortcircuiting all normalization.
-            treatment_assignment_logit_function = base_treatment_logit_expression
+            treatment_assignment_logit_function = SampledFunction(
+                treatment_covariate_transforms)
 
         # Build the logistic propensity function.
-        exponentiated_neg_logit = sp.functions.exp(-1*treatment_assignment_logit_function)
-
-        treatment_assignment_function = 1/(1 + exponentiated_neg_logit)
+        treatment_assignment_function = treatment_assignment_logit_function.with_link(
+            SampledFunction.LOGISTIC_LINK)
 
         return (treatment_assignment_logit_function,
             treatment_assignment_function)
@@ -412,48 +641,62 @@ class DataGeneratingProcessSampler():
         # outcome function. The more transformed covariates appear
         # in the treatment function, the more heterogenous the treatment
         # effect.
-
-        # Sample a base effect from the distribution in the parameters.
-        base_treatment_effect = self.params.sample_treatment_effect()[0]
-
-        # Sample outcome subfunctions to interact with base treatment effect.
-        selected_interaction_terms = select_objects_given_probability(
-                objects_to_sample=outcome_covariate_transforms,
-                selection_probability=self.params.TREATMENT_EFFECT_HETEROGENEITY)
+        base_treatment_effect, interaction_terms = \
+            self.sample_treatment_effect_interaction_terms(
+                outcome_covariate_transforms)
 
         # Process interaction terms into treatment subfunction.
-        if len(selected_interaction_terms) > 0:
-            # Initialize constants.
-            initialized_interaction_terms = initialize_expression_constants(
-                self.params.sample_subfunction_constants,
-                selected_interaction_terms)
-
-            # Build the covariate multiplier which will interact with the treat effect.
-            treatment_effect_multiplier_expr = np.sum(initialized_interaction_terms)
-
+        if interaction_terms is not None:
             # Normalize multiplier size.
             sampled_data = observed_covariate_data.sample(
                 frac=SamplingConstants.NORMALIZATION_DATA_SAMPLE_FRACTION)
 
-            treatment_effect_multiplier_values = evaluate_expression(
-                treatment_effect_multiplier_expr, sampled_data)
-
-            multiplier_std = np.std(treatment_effect_multiplier_values)
-            multiplier_mean = np.mean(treatment_effect_multiplier_values)
+            # Evaluate the covariate multiplier which will interact with the treat effect.
+            treatment_effect_multiplier_values = interaction_terms.evaluate(sampled_data)
 
-            normalized_treatment_effect_multiplier_expr = \
-                (treatment_effect_multiplier_expr - multiplier_mean)/multiplier_std
-
-            treatment_effect_subfunction = base_treatment_effect * \
-                (1+normalized_treatment_effect_multiplier_expr)
-
-            return treatment_effect_subfunction
+            return self.build_treatment_effect_subfunction(
+                base_treatment_effect, interaction_terms,
+                treatment_effect_multiplier_values)
 
         # No interaction terms. Return base treatment effect as the
         # treatment effect subfunction.
         else:
             return base_treatment_effect
 
+    def sample_treatment_effect_interaction_terms(self, outcome_covariate_transforms):
+        # 5A-i. Sample the base treatment effect and the outcome terms which
+        # interact with it. The interaction terms are None if no terms
+        # are selected.
+
+        # Sample a base effect from the distribution in the parameters.
+        base_treatment_effect = self.params.sample_treatment_effect()[0]
+
+        # Sample outcome subfunctions to interact with base treatment effect.
+        # The selected terms keep the constants sampled for the outcome function.
+        selected_interaction_positions = select_objects_given_probability(
+                objects_to_sample=np.arange(len(outcome_covariate_transforms)),
+                selection_probability=self.params.TREATMENT_EFFECT_HETEROGENEITY)
+
+        if len(selected_interaction_positions) > 0:
+            interaction_terms = outcome_covariate_transforms.take(
+                np.sort(selected_interaction_positions))
+        else:
+            interaction_terms = None
+
+        return base_treatment_effect, interaction_terms
+
+    def build_treatment_effect_subfunction(self,
+        base_treatment_effect, interaction_terms, treatment_effect_multiplier_values):
+        # 5A-ii. Build the treatment effect subfunction from the interaction
+        # terms and the values of their sum on the normalization data.
+        multiplier_std = np.std(treatment_effect_multiplier_values)
+        multiplier_mean = np.mean(treatment_effect_multiplier_values)
+
+        # The subfunction is base*(1 + (multiplier - mean)/std).
+        return SampledFunction(
+            interaction_terms,
+            scale=base_treatment_effect/multiplier_std,
+            offset=base_treatment_effect*(1 - multiplier_mean/multiplier_std))
 
     def sample_outcome_function(self,
         outcome_covariate_transforms, observed_covariate_data):
@@ -464,41 +707,98 @@ class DataGeneratingProcessSampler():
         # to produce "deep" functions.
         # TODO-FUTURE: add non-linear activation function.
 
-        # Build base outcome function. Additive combination of the true covariates.
-        base_untreated_outcome_expression = np.sum(outcome_covariate_transforms)
-
-        # Normalize if config set to do so.
+        # Evaluate the base outcome function, an additive combination
+        # of the transformed covariates, if normalization is required.
+        outcome_values = None
         if SamplingConstants.NORMALIZE_SAMPLED_OUTCOME_FUNCTION:
-            logger.debug("Normalizing outcome function using mean centering and std scaling.")
             # Sample data to evaluate distribution.
             sampled_data = observed_covariate_data.sample(
                 frac=SamplingConstants.NORMALIZATION_DATA_SAMPLE_FRACTION)
+            outcome_values = outcome_covariate_transforms.evaluate(sampled_data)
+
+        untreated_outcome_subfunction = self.build_untreated_outcome_subfunction(
+            outcome_covariate_transforms, outcome_values)
+
+        # Create the treatment effect subfunction.
+        treat_effect_subfunction = self.sample_treatment_effect_subfunction(
+            outcome_covariate_transforms, observed_covariate_data)
+
+        # The full outcome function, which combines the subfunctions
+        # with the noise and treatment symbols, is only used for display
+        # and is built lazily by the DGP from the subfunctions.
+        outcome_function = None
+
+        return outcome_function, untreated_outcome_subfunction, treat_effect_subfunction
+
+    def build_untreated_outcome_subfunction(self,
+        outcome_covariate_transforms, outcome_values):
+        # 5B-i. Build the (normalized) untreated outcome subfunction from the
+        # outcome transforms and the values of their sum on the normalization
+        # data. The values are None if normalization is off.
+
+        # Normalize if config set to do so.
+        if SamplingConstants.NORMALIZE_SAMPLED_OUTCOME_FUNCTION:
+            logger.debug("Normalizing outcome function using mean centering and std scaling.")
 
             # Normalized outcome values to have approximate mean=0 and std=1.
             # This prevents situations where large outcome values drown out
             # the treatment effect or the treatment effect dominates small average outcomes.
-            outcome_values = evaluate_expression(base_untreated_outcome_expression, sampled_data)
             outcome_mean = np.mean(outcome_values)
             outcome_std = np.std(outcome_values)
 
             # This is only an approximate normalization. It will shift the mean to zero
             # but the exact effect on std will depend on the distribution.
-            normalized_outcome_expression = base_untreated_outcome_expression/outcome_std
+            outcome_offset = 0
             if SamplingConstants.CENTER_SAMPLED_OUTCOME_FUNCTION:
-                normalized_outcome_expression = normalized_outcome_expression - \
-                    (outcome_mean/outcome_std)
+                outcome_offset = -1*outcome_mean/outcome_std
 
-            untreated_outcome_subfunction = normalized_outcome_expression
+            return SampledFunction(
+                outcome_covariate_transforms,
+                scale=1/outcome_std,
+                offset=outcome_offset)
         else:
-            untreated_outcome_subfunction = base_untreated_outcome_expression
-
-        # Create the treatment effect subfunction.
-        treat_effect_subfunction = self.sample_treatment_effect_subfunction(
-            outcome_covariate_transforms, observed_covariate_data)
-
-        outcome_function = untreated_outcome_subfunction + \
-            ComponentConstants._OUTCOME_NOISE_SYMBOL + \
-            (ComponentConstants._TREATMENT_ASSIGNMENT_SYMBOL *
-                treat_effect_subfunction)
-
-        return outcome_function, untreated_outcome_subfunction, treat_effect_subfunction
+            return SampledFunction(outcome_covariate_transforms)
+
+def _evaluate_stacked_functions(term_tables, data):
+    # Evaluate the sum of the terms in each of the term tables in
+    # `term_tables` on `data`. The tables are stacked and evaluated together
+    # in blocks which are limited in size by MAX_STACKED_NORMALIZATION_VALUES.
+    max_block_terms = max(1,
+        SamplingConstants.MAX_STACKED_NORMALIZATION_VALUES//max(1, data.shape[0]))
+
+    function_values = []
+    block_start = 0
+    while block_start < len(term_tables):
+        # Extend the block until it reaches the term limit. Blocks always
+        # contain at least one table.
+        block_end = block_start + 1
+        block_terms = len(term_tables[block_start])
+        while (block_end < len(term_tables) and
+            block_terms + len(term_tables[block_end]) <= max_block_terms):
+            block_terms += len(term_tables[block_end])
+            block_end += 1
+
+        block_tables = term_tables[block_start:block_end]
+        term_values = TermTable.concatenate(block_tables).evaluate_terms(data)
+
+        # Sum the term values in each table's segment of the stacked columns.
+        # Empty tables have no segment and sum to zero.
+        table_sizes = np.array([len(table) for table in block_tables])
+        table_starts = np.cumsum(table_sizes) - table_sizes
+        non_empty_tables = table_sizes > 0
+
+        block_function_values = np.zeros((len(block_tables), term_values.shape[0]))
+        if np.any(non_empty_tables):
+            block_function_values[non_empty_tables] = np.add.reduceat(
+                term_values, table_starts[non_empty_tables], axis=1).T
+        function_values.extend(block_function_values)
+
+        block_start = block_end
+
+    return function_values
+
+def _sample_dgp_chunk(dgp_sampler, n_dgps):
+    # Helper used to sample a chunk of DGPs in a worker process. The random
+    # state is reseeded so each worker samples different DGPs.
+    np.random.seed()
+    return dgp_sampler._sample_dgp_batch(n_dgps)
@@ -0,0 +1,124 @@
+"""This submodule contains the :class:`~maccabee.data_generation.dataset_handle.DatasetHandle` class, a lightweight reference to a data set sampled from a DGP. A handle records only the DGP, the seed with which the data set was sampled and the data analysis mode of the DGP. The data set itself is regenerated from the DGP on demand, using :meth:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess.generate_dataset` with the recorded seed, which produces the exact data set which was originally sampled.
+
+Handles allow the results of benchmarks to reference every sampled data set, for later drill-down, without keeping the data sets in memory. The most recently materialized data sets are kept in a small, module-level least recently used cache so that repeated access to the same handles does not repeatedly regenerate their data sets. The size of the cache is controlled by :data:`~maccabee.data_generation.dataset_handle.DATASET_CACHE_SIZE`.
+
+.. warning::
+    Data sets can only be regenerated exactly if the data generating methods of the DGP draw from the global NumPy random state, which is the case for all sampled DGPs, and if the DGP is not modified after the handle is created.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from ..logging import get_logger
+logger = get_logger(__name__)
+
+#: The maximum number of materialized data sets kept in the cache.
+DATASET_CACHE_SIZE = 8
+
+# The cache of materialized data sets. The keys contain the id of the DGP
+# and the values hold a reference to the DGP so that the id is not reused
+# while the entry exists.
+_DATASET_CACHE = OrderedDict()
+
+def clear_dataset_cache():
+    """Remove all materialized data sets from the cache of :class:`~maccabee.data_generation.dataset_handle.DatasetHandle` data sets."""
+    _DATASET_CACHE.clear()
+
+class DatasetHandle():
+    """DatasetHandle(...)
+
+    A reference to the data set sampled from `dgp` with the seed `seed`. See the module docs for a description of handles. Handles are usually created using :meth:`~maccabee.data_generation.dataset_handle.DatasetHandle.sample`, which samples a new seed, or by the benchmarking functions.
+
+    Args:
+        dgp (:class:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess`): The DGP from which the data set is sampled.
+        seed (int): The seed with which the data set is sampled.
+        data_analysis_mode (bool): The data analysis mode of the DGP when the data set is sampled. Defaults to None, in which case the current mode of the DGP is used.
+
+    Attributes:
+        dgp
+        seed
+        data_analysis_mode
+    """
+
+    __slots__ = ("dgp", "seed", "data_analysis_mode")
+
+    def __init__(self, dgp, seed, data_analysis_mode=None):
+        if data_analysis_mode is None:
+            data_analysis_mode = dgp.get_data_analysis_mode()
+
+        self.dgp = dgp
+        self.seed = int(seed)
+        self.data_analysis_mode = bool(data_analysis_mode)
+
+    @classmethod
+    def sample(cls, dgp, n_handles=None, seed_sequence=None):
+        """Create handles for new data sets sampled from `dgp`. The seeds of the data sets are drawn from `seed_sequence`. No data is generated until the data sets are accessed.
+
+        Args:
+            dgp (:class:`~maccabee.data_generation.data_generating_process.DataGeneratingProcess`): The DGP.
+            n_handles (int): The number of handles to create. Defaults to None, in which case a single handle is returned rather than a list.
+            seed_sequence (:class:`numpy.random.SeedSequence`): The source of the seeds. Defaults to None, in which case a new sequence is created using fresh entropy.
+
+        Returns:
+            list: A list of `n_handles` :class:`~maccabee.data_generation.dataset_handle.DatasetHandle` instances, or a single instance if `n_handles` is None.
+        """
+        if seed_sequence is None:
+            seed_sequence = np.random.SeedSequence()
+
+        seeds = seed_sequence.generate_state(1 if n_handles is None else n_handles)
+        handles = [cls(dgp, seed) for seed in seeds]
+        return handles[0] if n_handles is None else handles
+
+    def _get_cache_key(self):
+        return (id(self.dgp), self.seed, self.data_analysis_mode)
+
+    def get_dataset(self):
+        """Return the data set referenced by this handle, regenerating it from the DGP if it is not in the cache.
+
+        Returns:
+            :class:`~maccabee.data_generation.generated_data_set.GeneratedDataSet`: The data set.
+        """
+        cache_key = self._get_cache_key()
+        if cache_key in _DATASET_CACHE:
+            _DATASET_CACHE.move_to_end(cache_key)
+            return _DATASET_CACHE[cache_key][1]
+
+        # Generate the data set in the recorded data analysis mode and then
+        # restore the mode of the DGP.
+        dgp_data_analysis_mode = self.dgp.get_data_analysis_mode()
+        self.dgp.set_data_analysis_mode(self.data_analysis_mode)
+        try:
+            dataset = self.dgp.generate_dataset(seed=self.seed)
+        finally:
+            self.dgp.set_data_analysis_mode(dgp_data_analysis_mode)
+
+        self._cache_dataset(dataset)
+        return dataset
+
+    def _cache_dataset(self, dataset):
+        # Store a data set generated with this handle's seed, evicting the
+        # least recently used data sets if the cache is full.
+        if DATASET_CACHE_SIZE <= 0:
+            return
+
+        _DATASET_CACHE[self._get_cache_key()] = (self.dgp, dataset)
+        _DATASET_CACHE.move_to_end(self._get_cache_key())
+        while len(_DATASET_CACHE) > DATASET_CACHE_SIZE:
+            _DATASET_CACHE.popitem(last=False)
+
+    @property
+    def dataset(self):
+        """The data set referenced by this handle. See :meth:`~maccabee.data_generation.dataset_handle.DatasetHandle.get_dataset`."""
+        return self.get_dataset()
+
+    def __eq__(self, other):
+        if not isinstance(other, DatasetHandle):
+            return NotImplemented
+        return self._get_cache_key() == other._get_cache_key()
+
+    def __hash__(self):
+        return hash(self._get_cache_key())
+
+    def __repr__(self):
+        return f"DatasetHandle(dgp={type(self.dgp).__name__}, seed={self.seed})"
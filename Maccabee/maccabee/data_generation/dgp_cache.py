@@ -0,0 +1,189 @@
+"""This submodule contains the :class:`~maccabee.data_generation.dgp_cache.DGPCache` class, a content-addressed on-disk cache of sampled DGPs. A :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler` with a cache stores every DGP it samples with a seed and returns the stored DGP, rather than resampling it, when the same DGP is requested again. This allows re-runs of notebooks, scripts and failed jobs to skip DGP sampling and proceed directly to data set generation.
+
+The cache key of a DGP is a hash of everything that determines it:
+
+* The fingerprint of the sampling parameters. See :meth:`~maccabee.parameters.parameter_store.ParameterStore.get_fingerprint`.
+* The fingerprint of the data source contents. See :func:`~maccabee.data_generation.serialization.get_data_source_fingerprint`.
+* The DGP sampling constants in :class:`~maccabee.constants.Constants.DGPSampling`.
+* The class of the sampler, the version of the serialization format and the seed.
+
+DGPs are stored in the compact format of the :mod:`~maccabee.data_generation.serialization` module alongside a hash of the stored file. The hash is verified when the DGP is loaded and entries which fail verification are discarded and resampled. The total size of the cache is bounded. When the bound is exceeded, the least recently used entries are evicted.
+
+Only DGPs sampled from a :class:`~maccabee.data_sources.data_sources.StaticDataSource` are cached. The covariate data of other data sources changes between calls so it can't be part of a cache key.
+"""
+
+import hashlib
+import io
+import json
+import os
+import uuid
+
+from ..constants import Constants
+from ..data_sources.data_sources import StaticDataSource
+from .serialization import save_dgps, load_dgps, get_data_source_fingerprint, SERIALIZATION_FORMAT_VERSION
+
+from ..logging import get_logger
+logger = get_logger(__name__)
+
+# The extensions of the stored DGP files and their hash files.
+_DGP_FILE_EXTENSION = ".npz"
+_HASH_FILE_EXTENSION = ".sha256"
+
+class DGPCache():
+    """DGPCache(...)
+
+    An on-disk cache of sampled DGPs. See the module docs for a description of the cache. A cache is used by supplying it to a :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler` and sampling DGPs with a seed. Caches can be shared by many samplers and processes.
+
+    Args:
+        path (str): The directory in which cached DGPs are stored. It is created if it doesn't exist.
+        max_size_bytes (int): The maximum total size of the cached DGP files. Defaults to 1 GiB.
+
+    Attributes:
+        n_hits: The number of DGPs loaded from the cache by this instance.
+        n_misses: The number of requested DGPs which were not in the cache.
+    """
+
+    def __init__(self, path, max_size_bytes=2**30):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.n_hits = 0
+        self.n_misses = 0
+
+        os.makedirs(path, exist_ok=True)
+
+    def get_key(self, dgp_sampler, seed):
+        """Calculate the cache key of the DGP sampled by `dgp_sampler` with the seed `seed`.
+
+        Args:
+            dgp_sampler (:class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler`): The sampler.
+            seed (int): The seed.
+
+        Returns:
+            str: The key, or None if DGPs sampled by `dgp_sampler` can't be cached.
+        """
+        if not isinstance(dgp_sampler.data_source, StaticDataSource):
+            return None
+
+        sampler_class = type(dgp_sampler)
+        key_record = json.dumps({
+            "format_version": SERIALIZATION_FORMAT_VERSION,
+            "sampler": f"{sampler_class.__module__}.{sampler_class.__qualname__}",
+            "parameters": dgp_sampler.params.get_fingerprint(),
+            "data_source": get_data_source_fingerprint(dgp_sampler.data_source),
+            "sampling_constants": Constants.DGPSampling.all(),
+            "seed": int(seed)
+        }, sort_keys=True, default=str)
+
+        return hashlib.sha256(key_record.encode()).hexdigest()
+
+    def _get_paths(self, key):
+        base_path = os.path.join(self.path, key)
+        return base_path + _DGP_FILE_EXTENSION, base_path + _HASH_FILE_EXTENSION
+
+    def _discard(self, key):
+        for path in self._get_paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def load(self, key, data_source, dgp_class, dgp_kwargs={}):
+        """Load the DGP stored under `key`.
+
+        Args:
+            key (str): The cache key. See :meth:`~maccabee.data_generation.dgp_cache.DGPCache.get_key`.
+            data_source (:class:`~maccabee.data_sources.data_sources.DataSource`): The data source of the DGP.
+            dgp_class (:class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`): The class of the loaded DGP.
+            dgp_kwargs (dict): A dictionary of keyword arguments which is passed to the loaded DGP at instantiation. Defaults to {}.
+
+        Returns:
+            :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`: The cached DGP or None if there is no valid DGP stored under `key`.
+        """
+        dgp_path, hash_path = self._get_paths(key)
+
+        try:
+            with open(dgp_path, "rb") as dgp_file:
+                dgp_bytes = dgp_file.read()
+            with open(hash_path, "r") as hash_file:
+                stored_hash = hash_file.read().strip()
+        except FileNotFoundError:
+            self.n_misses += 1
+            return None
+
+        if hashlib.sha256(dgp_bytes).hexdigest() != stored_hash:
+            logger.warning(f"Discarding cached DGP {key} which failed its integrity check.")
+            self._discard(key)
+            self.n_misses += 1
+            return None
+
+        try:
+            dgp, = load_dgps(io.BytesIO(dgp_bytes), data_source,
+                dgp_class=dgp_class, dgp_kwargs=dgp_kwargs)
+        except Exception:
+            logger.warning(f"Discarding cached DGP {key} which could not be loaded.", exc_info=True)
+            self._discard(key)
+            self.n_misses += 1
+            return None
+
+        # Mark the entry as recently used.
+        try:
+            os.utime(dgp_path)
+        except FileNotFoundError:
+            pass
+
+        self.n_hits += 1
+        logger.debug("Loaded DGP %s from the DGP cache", key)
+        return dgp
+
+    def store(self, key, dgp):
+        """Store `dgp` under `key` and evict the least recently used entries if the cache exceeds its maximum size.
+
+        Args:
+            key (str): The cache key. See :meth:`~maccabee.data_generation.dgp_cache.DGPCache.get_key`.
+            dgp (:class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`): The DGP.
+        """
+        dgp_buffer = io.BytesIO()
+        save_dgps(dgp_buffer, [dgp])
+        dgp_bytes = dgp_buffer.getvalue()
+
+        # Files are written to temporary paths and then moved into place so
+        # that concurrent readers never see partially written entries. The
+        # hash file is moved last, which completes the entry.
+        dgp_path, hash_path = self._get_paths(key)
+        for path, content in [
+            (dgp_path, dgp_bytes),
+            (hash_path, hashlib.sha256(dgp_bytes).hexdigest().encode())]:
+
+            temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, "wb") as temp_file:
+                temp_file.write(content)
+            os.replace(temp_path, path)
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the total size of the cached DGP files is at most `max_size_bytes`."""
+        entries = []
+        for file_name in os.listdir(self.path):
+            if file_name.endswith(_DGP_FILE_EXTENSION):
+                try:
+                    file_stat = os.stat(os.path.join(self.path, file_name))
+                except FileNotFoundError:
+                    continue
+                entries.append((file_stat.st_mtime, file_stat.st_size,
+                    file_name[:-len(_DGP_FILE_EXTENSION)]))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+
+            logger.debug("Evicting DGP %s from the DGP cache", key)
+            self._discard(key)
+            total_size -= size
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        for file_name in os.listdir(self.path):
+            if file_name.endswith(_DGP_FILE_EXTENSION):
+                self._discard(file_name[:-len(_DGP_FILE_EXTENSION)])
@@ -9,6 +9,27 @@ from functools import partial
 
 DGPVariables = Constants.DGPVariables
 
+def _freeze_data_frame(data_frame):
+    # Rebuild a DataFrame over read-only copies of its columns, so that
+    # writes to the frame raise an error. Frames with a single dtype are
+    # backed by a single 2D array and mixed frames, like covariates with
+    # compact discrete columns, by one array per column.
+    if data_frame.dtypes.nunique() <= 1:
+        array = data_frame.to_numpy(copy=True)
+        array.flags.writeable = False
+        return pd.DataFrame(array,
+            index=data_frame.index, columns=data_frame.columns, copy=False)
+
+    column_arrays = {}
+    for position in range(data_frame.shape[1]):
+        column_array = data_frame.iloc[:, position].to_numpy(copy=True)
+        column_array.flags.writeable = False
+        column_arrays[position] = column_array
+
+    frozen_data_frame = pd.DataFrame(column_arrays, index=data_frame.index, copy=False)
+    frozen_data_frame.columns = data_frame.columns
+    return frozen_data_frame
+
 class DGPVariableAccessor(type):
     DGP_VARIABLE_DICT_NAME = "DGP_VARIABLE_DICT"
 
@@ -36,11 +57,18 @@ class DGPVariableAccessor(type):
         if dgp_var_name not in DGPVariables.all().values():
             raise UnknownDGPVariableException()
 
-        dgp_var_dict = getattr(instance, DGPVariableAccessor.DGP_VARIABLE_DICT_NAME, None)
-        if dgp_var_dict is None:
-            raise DGPVariableMissingException(f"{instance} has no dgp variable data.")
+        # Classes which don't store their DGP variables in a dictionary
+        # provide a method which returns the value of a variable or None.
+        value_getter = getattr(instance, "_get_dgp_variable_value", None)
+        if value_getter is not None:
+            dgp_var_value = value_getter(dgp_var_name)
+        else:
+            dgp_var_dict = getattr(instance, DGPVariableAccessor.DGP_VARIABLE_DICT_NAME, None)
+            if dgp_var_dict is None:
+                raise DGPVariableMissingException(f"{instance} has no dgp variable data.")
+
+            dgp_var_value = dgp_var_dict.get(dgp_var_name, None)
 
-        dgp_var_value = dgp_var_dict.get(dgp_var_name, None)
         if dgp_var_value is not None:
             return dgp_var_value
         else:
@@ -70,6 +98,8 @@ class GeneratedDataSet(metaclass=DGPVariableAccessor):
 
     * Second, it defines attributes which return ground-truth estimand values. These attributes are backed by functions which calculate the ground-truth values from the generated data. These properties are marked with **[ESTIMAND]** below.
 
+    The stochastic DGP variables with one value per observation are copied into the rows of a single contiguous floating point buffer (``float64`` by default, ``float32`` if supplied as `dtype`) which is owned by the data set. The DGP variables named in `shared_dgp_variables` - the deterministic variables which a DGP caches and shares between all of its samples - are held by reference, without copying, and are read-only. Data sets are therefore independent snapshots of the DGP's state at the time of sampling. The pandas objects returned by the DGP variable attributes are built from this buffer on first access and cached, as are the groups of variables marked with **[DGP VARIABLE GROUP]** below. Use :meth:`~maccabee.data_generation.generated_data_set.GeneratedDataSet.get_dgp_variable_array` and the array-valued groups to access the data without building pandas objects.
+
     .. note::
 
       Behind the scenes, the DGP variable attributes are actually accessor functions which access the internal data structure to return the correct value for each DGP variable in :class:`~maccabee.constants.Constants.DGPVariables`. These functions are injected into the :class:`~maccabee.data_generation.generated_data_set.GeneratedDataSet` class through the ``DGPVariableAccessor(type)`` class which is used as type/metaclass for  :class:`~maccabee.data_generation.generated_data_set.GeneratedDataSet`. Users who plan to add their own DGP variables should see the source code and in line comments for the :class:`~maccabee.data_generation.data_generating_process.GeneratedDataSet` to ensure they understand this mechanism.
@@ -82,36 +112,219 @@ class GeneratedDataSet(metaclass=DGPVariableAccessor):
     # GeneratedDataSet objects from standard data frames. These could be
     # used to test/develop CausalModels prior to full benchmarking.
 
-    def __init__(self, dgp_variable_dict):
-         setattr(self, self.DGP_VARIABLE_DICT_NAME, dgp_variable_dict)
+    __slots__ = (
+        "_index", "_vector_names", "_vector_dtypes", "_vector_buffer",
+        "_shared_vectors", "_matrices", "_scalars", "_materialized",
+        "_design_cache")
+
+    # The observable outcome variables are stored first, and adjacent, in
+    # the vector buffer so that the observed outcome block is a view.
+    _OBSERVED_OUTCOME_VARIABLES = [
+        DGPVariables.TREATMENT_ASSIGNMENT_NAME,
+        DGPVariables.OBSERVED_OUTCOME_NAME
+    ]
+
+    def __init__(self, dgp_variable_dict, dtype=np.float64, shared_dgp_variables=()):
+        # DGP variables are stored in four groups. Variables with one value
+        # per observation are copied into the rows of a single contiguous
+        # buffer unless they are shared, in which case they are stored by
+        # reference. Matrix variables, like the covariates, are stored as
+        # supplied without copying. Scalar variables are stored as is.
+        covariates = dgp_variable_dict.get(DGPVariables.COVARIATES_NAME, None)
+        if isinstance(covariates, (pd.DataFrame, pd.Series)):
+            self._index = covariates.index
+            n_observations = len(covariates)
+        else:
+            n_observations = None
+            self._index = None
+
+        vectors = {}
+        self._shared_vectors = {}
+        self._matrices = {}
+        self._scalars = {}
+        for dgp_var_name, dgp_var_value in dgp_variable_dict.items():
+            if dgp_var_value is None:
+                continue
+
+            if isinstance(dgp_var_value, pd.DataFrame) or np.ndim(dgp_var_value) == 2:
+                self._matrices[dgp_var_name] = dgp_var_value
+            elif np.ndim(dgp_var_value) == 1:
+                if dgp_var_name in shared_dgp_variables:
+                    self._shared_vectors[dgp_var_name] = dgp_var_value
+                else:
+                    vectors[dgp_var_name] = dgp_var_value
+            else:
+                self._scalars[dgp_var_name] = dgp_var_value
+
+        if n_observations is None:
+            all_vectors = list(vectors.values()) + list(self._shared_vectors.values())
+            n_observations = len(all_vectors[0]) if all_vectors else 0
+        if self._index is None:
+            self._index = pd.RangeIndex(n_observations)
+
+        self._vector_names = sorted(vectors, key=lambda dgp_var_name: (
+            dgp_var_name not in self._OBSERVED_OUTCOME_VARIABLES,
+            self._OBSERVED_OUTCOME_VARIABLES.index(dgp_var_name)
+                if dgp_var_name in self._OBSERVED_OUTCOME_VARIABLES else 0))
+        self._vector_dtypes = {}
+        self._vector_buffer = np.empty((len(vectors), n_observations), dtype=dtype)
+        for row, dgp_var_name in enumerate(self._vector_names):
+            values = np.asarray(vectors[dgp_var_name])
+            self._vector_dtypes[dgp_var_name] = values.dtype
+            self._vector_buffer[row] = values
+
+        self._materialized = {}
+        self._design_cache = {}
+
+    def __getstate__(self):
+        # The materialized pandas objects and design matrices are rebuilt
+        # on demand so they are not pickled.
+        return {
+            slot_name: getattr(self, slot_name)
+            for slot_name in self.__slots__
+            if slot_name not in ("_materialized", "_design_cache")
+        }
+
+    def __setstate__(self, state):
+        for slot_name, value in state.items():
+            setattr(self, slot_name, value)
+        self._materialized = {}
+        self._design_cache = {}
+
+    def _get_dgp_variable_value(self, dgp_var_name):
+        # Return the (pandas) value of a DGP variable, or None if it is
+        # missing. Vector variables are materialized as Series on the first
+        # access. Floating point variables are views of the buffer. Shared
+        # pandas values get a shallow copy per data set: the copy is backed
+        # by the shared read-only arrays, so writes to its values raise (or
+        # copy, under pandas copy-on-write) and added or replaced columns
+        # stay local to the data set.
+        if dgp_var_name in self._materialized:
+            return self._materialized[dgp_var_name]
+
+        shared_value = self._shared_vectors.get(
+            dgp_var_name, self._matrices.get(dgp_var_name, None))
+        if isinstance(shared_value, (pd.Series, pd.DataFrame)):
+            shared_value = shared_value.copy(deep=False)
+            self._materialized[dgp_var_name] = shared_value
+            return shared_value
+        elif dgp_var_name in self._matrices:
+            return self._matrices[dgp_var_name]
+        elif dgp_var_name in self._scalars:
+            return self._scalars[dgp_var_name]
+        elif dgp_var_name in self._shared_vectors:
+            values = self.get_dgp_variable_array(dgp_var_name)
+        elif dgp_var_name in self._vector_dtypes:
+            values = self.get_dgp_variable_array(dgp_var_name)
+            original_dtype = self._vector_dtypes[dgp_var_name]
+            if original_dtype != values.dtype and original_dtype.kind in "iub":
+                values = values.astype(original_dtype)
+        else:
+            return None
 
-    def _build_dataframe_for_vars(self, dgp_var_names):
-        # Build a dataframe for the DGP variables listed in dgp_var_names.
-        df = pd.DataFrame()
-        for name in dgp_var_names:
-            df[name] = self.get_dgp_variable(name)
+        series = pd.Series(values, index=self._index, copy=False)
+        self._materialized[dgp_var_name] = series
+        return series
 
-        return df
+    def get_dgp_variable_array(self, dgp_var_name):
+        """Returns the DGP variable given as `dgp_var_name` as a NumPy array without building a pandas object. Variables with one value per observation are returned as read-only views of the data set's buffer, which has the data set's floating point dtype, or, for shared variables, as read-only views of the shared values in their original dtype. Matrix and scalar variables are returned as supplied by the DGP.
+
+        Args:
+            dgp_var_name (string): The name of a DGP variable from :class:`~maccabee.constants.Constants.DGPVariables`.
+
+        Returns:
+            :class:`numpy.ndarray`: The values of the DGP variable.
+
+        Raises:
+            UnknownDGPVariableException: if an unknown DGP variable is requested.
+            DGPVariableMissingException: if the DGP variable was not generated by the DGP.
+        """
+        if dgp_var_name in self._vector_dtypes:
+            values = self._vector_buffer[self._vector_names.index(dgp_var_name)]
+            values.flags.writeable = False
+            return values
+        elif dgp_var_name in self._shared_vectors:
+            values = np.asarray(self._shared_vectors[dgp_var_name]).view()
+            values.flags.writeable = False
+            return values
+        elif dgp_var_name in self._matrices:
+            matrix = self._matrices[dgp_var_name]
+            return matrix.to_numpy() if isinstance(matrix, pd.DataFrame) else matrix
+        else:
+            return self.get_dgp_variable(dgp_var_name)
+
+    def _get_cached_design(self, design_name, build_design):
+        # Cached designs are read-only. DataFrames are returned as shallow
+        # copies of the cached frame so that writes to a returned frame, or
+        # the columns added to it, never reach the cache.
+        if design_name not in self._design_cache:
+            design = build_design()
+            if isinstance(design, pd.DataFrame):
+                design = _freeze_data_frame(design)
+            elif isinstance(design, np.ndarray):
+                design = design.view()
+                design.flags.writeable = False
+            self._design_cache[design_name] = design
+
+        design = self._design_cache[design_name]
+        if isinstance(design, pd.DataFrame):
+            return design.copy(deep=False)
+        return design
+
+    @property
+    def covariate_matrix(self):
+        """
+        **[DGP VARIABLE GROUP]**\n\n This property returns the observable covariates as a 2D floating point :class:`numpy.ndarray`. The array is built once, cached and read-only.
+        """
+        return self._get_cached_design("covariate_matrix", lambda: np.asarray(
+            self.get_dgp_variable_array(DGPVariables.COVARIATES_NAME), dtype=float))
+
+    @property
+    def covariate_treatment_matrix(self):
+        """
+        **[DGP VARIABLE GROUP]**\n\n This property returns the observable covariates with the treatment assignment as the final column as a 2D floating point :class:`numpy.ndarray`. This is the design matrix of regression-based estimators. The array is built once, cached and read-only.
+        """
+        return self._get_cached_design("covariate_treatment_matrix", lambda: np.column_stack([
+            self.covariate_matrix,
+            self.get_dgp_variable_array(DGPVariables.TREATMENT_ASSIGNMENT_NAME)]))
+
+    @property
+    def observed_outcome_matrix(self):
+        """
+        **[DGP VARIABLE GROUP]**\n\n This property returns the treatment assignment and observed outcome as the columns of a 2D :class:`numpy.ndarray`. The array is a read-only view of the data set's buffer.
+        """
+        # The two variables are the first rows of the buffer unless one of
+        # them is missing or shared.
+        for dgp_var_name in self._OBSERVED_OUTCOME_VARIABLES:
+            if dgp_var_name not in self._vector_dtypes:
+                return self._get_cached_design("observed_outcome_matrix",
+                    lambda: np.column_stack([
+                        self.get_dgp_variable_array(dgp_var_name)
+                        for dgp_var_name in self._OBSERVED_OUTCOME_VARIABLES]))
+
+        outcome_block = self._vector_buffer[:len(self._OBSERVED_OUTCOME_VARIABLES)].T
+        outcome_block.flags.writeable = False
+        return outcome_block
 
     @property
     def observed_outcome_data(self):
         """
-        **[DGP VARIABLE GROUP]**\n\n This property returns a DataFrame containing the observable outcome data: the treatment assignment and the observed outcome.
+        **[DGP VARIABLE GROUP]**\n\n This property returns a DataFrame containing the observable outcome data: the treatment assignment and the observed outcome. The DataFrame is built once and cached; each access returns a shallow copy of the cached, read-only frame.
         """
-        return self._build_dataframe_for_vars([
-            DGPVariables.TREATMENT_ASSIGNMENT_NAME,
-            DGPVariables.OBSERVED_OUTCOME_NAME
-        ])
+        return self._get_cached_design("observed_outcome_data", lambda: pd.DataFrame({
+            dgp_var_name: self.get_dgp_variable(dgp_var_name).to_numpy()
+            for dgp_var_name in self._OBSERVED_OUTCOME_VARIABLES
+        }))
 
     @property
     def observed_data(self):
         """
-        **[DGP VARIABLE GROUP]**\n\n This property returns a DataFrame containing all of the observable data: the observable covariates, the treatment assignment and the observed outcome. This is the data on which causal inference will be performed.
+        **[DGP VARIABLE GROUP]**\n\n This property returns a DataFrame containing all of the observable data: the observable covariates, the treatment assignment and the observed outcome. This is the data on which causal inference will be performed. The DataFrame is built once and cached; each access returns a shallow copy of the cached, read-only frame.
         """
-        return pd.concat([
+        return self._get_cached_design("observed_data", lambda: pd.concat([
             self.X.reset_index(drop=True),
             self.observed_outcome_data],
-            axis=1)
+            axis=1))
 
     # Estimand accessors
     @property
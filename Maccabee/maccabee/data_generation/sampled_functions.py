@@ -0,0 +1,417 @@
+"""This submodule contains the compact, structured, representation of the sampled treatment and outcome functions which is used by the :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler` and :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess` classes.
+
+Each sampled function is an (affine transformation of) an additive combination of subfunction terms. Each term is an instance of one of the subfunction forms in ``Constants.DGPSampling.SUBFUNCTION_FORMS`` applied to one or more covariates, with the constants in the form initialized to sampled values. Rather than building these terms as Sympy expressions, which is slow, the terms are stored in a :class:`~maccabee.data_generation.sampled_functions.TermTable`: a set of numpy arrays which record the form, covariate indices and constants of each term. A :class:`~maccabee.data_generation.sampled_functions.SampledFunction` combines a term table with the scale, offset and link function which normalize the function.
+
+Both classes evaluate numerically, directly from the arrays. Each subfunction form is converted to a vectorized numpy function once and applied to all the terms of that form at the same time. Sympy expressions are only built, lazily, when requested for display or export through the ``to_expression()`` methods. Both classes can also be used wherever a Sympy expression (or list of expressions) was previously expected: they can be iterated over to produce the expressions of their terms and are converted to expressions by :func:`sympy.sympify`.
+"""
+
+import numpy as np
+import pandas as pd
+import sympy as sp
+
+from ..constants import Constants
+
+SamplingConstants = Constants.DGPSampling
+
+#: The (ordered) subfunction form names. A term's form code is the index of
+#: its form in this list.
+SUBFUNCTION_FORM_NAMES = list(SamplingConstants.SUBFUNCTION_FORMS.keys())
+
+#: The form code of constant terms. These terms have no covariates and
+#: their value is their coefficient.
+CONSTANT_TERM_CODE = -1
+
+#: The maximum number of covariates in any subfunction form. This is the
+#: width of the covariate index array in a term table.
+MAX_TERM_COVARIATES = max(
+    len(form[SamplingConstants.COVARIATE_SYMBOLS_KEY])
+    for form in SamplingConstants.SUBFUNCTION_FORMS.values())
+
+# The constant symbols which appear in the subfunction forms.
+_COEFFICIENT_SYMBOL = sp.abc.c
+_THRESHOLD_SYMBOL = sp.abc.a
+
+# Cache of vectorized numpy functions for each subfunction form.
+_FORM_FUNCTIONS = {}
+
+def _get_form_function(form_code):
+    # Build (once) a numpy function which evaluates the subfunction form
+    # with the covariate and constant values as arguments. The arguments
+    # are broadcast so all the terms of a form are evaluated at once.
+    if form_code not in _FORM_FUNCTIONS:
+        form = SamplingConstants.SUBFUNCTION_FORMS[SUBFUNCTION_FORM_NAMES[form_code]]
+        _FORM_FUNCTIONS[form_code] = sp.lambdify(
+            list(form[SamplingConstants.COVARIATE_SYMBOLS_KEY]) +
+                [_THRESHOLD_SYMBOL, _COEFFICIENT_SYMBOL],
+            form[SamplingConstants.EXPRESSION_KEY],
+            modules="numpy")
+
+    return _FORM_FUNCTIONS[form_code]
+
+def _get_form_covariate_count(form_code):
+    if form_code == CONSTANT_TERM_CODE:
+        return 0
+
+    form = SamplingConstants.SUBFUNCTION_FORMS[SUBFUNCTION_FORM_NAMES[form_code]]
+    return len(form[SamplingConstants.COVARIATE_SYMBOLS_KEY])
+
+def _get_data_array(data, covariate_names, column_indices):
+    # Extract the values of the covariates with the given indices from a
+    # DataFrame (or array) as a float array. Only these columns are
+    # converted, so compact integer covariates which are not used by any
+    # term are never upcast.
+    if isinstance(data, pd.DataFrame):
+        if list(data.columns) == list(covariate_names):
+            data = data.iloc[:, column_indices]
+        else:
+            data = data[[covariate_names[index] for index in column_indices]]
+        return data.to_numpy(dtype=float)
+    else:
+        return np.asarray(np.asarray(data)[:, column_indices], dtype=float)
+
+class TermTable():
+    """This class stores a list of sampled subfunction terms as numpy arrays. Terms are identified by their form and covariates (their key) and parameterized by a coefficient (the ``c`` constant in the forms) and a threshold (the ``a`` constant in the step forms). Uninitialized terms have NaN constants.
+
+    Args:
+        covariate_names (list): The names of the covariates, in the order of the columns of the covariate data. The covariate indices of each term refer to this list.
+        forms (:class:`numpy.ndarray`): An integer array with the form code of each term.
+        covariate_indices (:class:`numpy.ndarray`): An integer array with one row per term and ``MAX_TERM_COVARIATES`` columns. Each row contains the indices of the covariates in the term, padded with -1.
+        coefficients (:class:`numpy.ndarray`): The coefficient of each term. Defaults to None, in which case the terms are uninitialized.
+        thresholds (:class:`numpy.ndarray`): The threshold of each term. Defaults to None, in which case the terms are uninitialized.
+
+    Attributes:
+        covariate_names
+        forms
+        covariate_indices
+        coefficients
+        thresholds
+    """
+
+    def __init__(self, covariate_names, forms, covariate_indices,
+        coefficients=None, thresholds=None):
+        self.covariate_names = list(covariate_names)
+        self.forms = np.asarray(forms, dtype=np.int8).reshape(-1)
+        self.covariate_indices = np.asarray(
+            covariate_indices, dtype=np.int32).reshape((-1, MAX_TERM_COVARIATES))
+
+        n_terms = len(self.forms)
+        if coefficients is None:
+            coefficients = np.full(n_terms, np.nan)
+        if thresholds is None:
+            thresholds = np.full(n_terms, np.nan)
+
+        self.coefficients = np.asarray(coefficients, dtype=float).reshape(-1)
+        self.thresholds = np.asarray(thresholds, dtype=float).reshape(-1)
+
+        self._expressions = None
+
+    @classmethod
+    def empty(cls, covariate_names):
+        """Build a term table with no terms.
+
+        Args:
+            covariate_names (list): See the class docs.
+
+        Returns:
+            :class:`~maccabee.data_generation.sampled_functions.TermTable`: An empty term table.
+        """
+        return cls(covariate_names, [], np.empty((0, MAX_TERM_COVARIATES)))
+
+    @classmethod
+    def from_keys(cls, covariate_names, keys):
+        """Build an uninitialized term table from a list of term keys.
+
+        Args:
+            covariate_names (list): See the class docs.
+            keys (list): A list of term keys as produced by :meth:`~maccabee.data_generation.sampled_functions.TermTable.keys`.
+
+        Returns:
+            :class:`~maccabee.data_generation.sampled_functions.TermTable`: The term table.
+        """
+        keys = np.asarray(keys, dtype=np.int32).reshape((-1, 1 + MAX_TERM_COVARIATES))
+        return cls(covariate_names, keys[:, 0], keys[:, 1:])
+
+    @classmethod
+    def concatenate(cls, tables):
+        """Concatenate the terms of term tables which share the same covariates.
+
+        Args:
+            tables (list): A non-empty list of :class:`~maccabee.data_generation.sampled_functions.TermTable` instances.
+
+        Returns:
+            :class:`~maccabee.data_generation.sampled_functions.TermTable`: A table with the terms of all the tables, in order.
+        """
+        return cls(
+            tables[0].covariate_names,
+            np.concatenate([table.forms for table in tables]),
+            np.concatenate([table.covariate_indices for table in tables]),
+            np.concatenate([table.coefficients for table in tables]),
+            np.concatenate([table.thresholds for table in tables]))
+
+    def __len__(self):
+        return len(self.forms)
+
+    def keys(self):
+        """Returns the key of each term: a tuple of the form code and the (padded) covariate indices. Terms with the same key differ only in their constants.
+
+        Returns:
+            list: A list of key tuples.
+        """
+        return [
+            (int(form), *map(int, indices))
+            for form, indices in zip(self.forms, self.covariate_indices)
+        ]
+
+    def take(self, indices):
+        """Select terms by position.
+
+        Args:
+            indices (list or :class:`numpy.ndarray`): The positions of the terms to select.
+
+        Returns:
+            :class:`~maccabee.data_generation.sampled_functions.TermTable`: A table with the selected terms.
+        """
+        indices = np.asarray(indices, dtype=int)
+        return TermTable(
+            self.covariate_names,
+            self.forms[indices],
+            self.covariate_indices[indices],
+            self.coefficients[indices],
+            self.thresholds[indices])
+
+    def unique(self):
+        """Remove duplicate terms, which have the same key and constants. Terms without a threshold have a NaN threshold, and these compare equal when finding duplicates.
+
+        Returns:
+            :class:`~maccabee.data_generation.sampled_functions.TermTable`: A table with the unique terms, in order of first appearance.
+        """
+        # NaN never compares equal to NaN, so missing thresholds are replaced
+        # by an infinite sentinel, which is never a sampled threshold value.
+        thresholds = np.where(np.isnan(self.thresholds), np.inf, self.thresholds)
+        rows = np.column_stack([
+            self.forms, self.covariate_indices,
+            self.coefficients, thresholds])
+        _, first_indices = np.unique(rows, axis=0, return_index=True)
+        return self.take(np.sort(first_indices))
+
+    def initialize_constants(self, constants_sampling_distro):
+        """Initialize the constants of all terms by sampling from `constants_sampling_distro`. This is the term table equivalent of :func:`~maccabee.data_generation.utils.initialize_expression_constants`: all coefficients are sampled and thresholds are sampled for the forms which have a threshold.
+
+        Args:
+            constants_sampling_distro (function): A function which produces `n` samples when called as ``constants_sampling_distro(size=n)``.
+
+        Returns:
+            :class:`~maccabee.data_generation.sampled_functions.TermTable`: A new table with initialized constants.
+        """
+        n_terms = len(self)
+        has_threshold = np.array([
+            (form != CONSTANT_TERM_CODE) and (_THRESHOLD_SYMBOL in
+                SamplingConstants.SUBFUNCTION_FORMS[
+                    SUBFUNCTION_FORM_NAMES[form]][SamplingConstants.EXPRESSION_KEY].free_symbols)
+            for form in self.forms
+        ], dtype=bool)
+
+        constants = constants_sampling_distro(size=n_terms + np.sum(has_threshold))
+
+        thresholds = np.full(n_terms, np.nan)
+        thresholds[has_threshold] = constants[n_terms:]
+
+        return TermTable(
+            self.covariate_names, self.forms, self.covariate_indices,
+            constants[:n_terms], thresholds)
+
+    def evaluate_terms(self, data):
+        """Evaluate each term for each observation in `data`.
+
+        Args:
+            data (:class:`~pandas.DataFrame`): The covariate data. The columns must include the covariate names of the table.
+
+        Returns:
+            :class:`numpy.ndarray`: An array with one row per observation and one column per term.
+        """
+        # The covariate indices of the terms are mapped to the columns of
+        # the array of used covariates.
+        used_covariate_indices = np.unique(self.covariate_indices[self.covariate_indices >= 0])
+        term_covariate_columns = np.searchsorted(used_covariate_indices, self.covariate_indices)
+
+        data = _get_data_array(data, self.covariate_names, used_covariate_indices)
+        values = np.empty((data.shape[0], len(self)))
+
+        for form_code in np.unique(self.forms):
+            term_positions = np.flatnonzero(self.forms == form_code)
+
+            if form_code == CONSTANT_TERM_CODE:
+                values[:, term_positions] = self.coefficients[term_positions]
+                continue
+
+            n_form_covariates = _get_form_covariate_count(form_code)
+            covariate_values = [
+                data[:, term_covariate_columns[term_positions, i]]
+                for i in range(n_form_covariates)
+            ]
+
+            values[:, term_positions] = _get_form_function(form_code)(
+                *covariate_values,
+                self.thresholds[term_positions],
+                self.coefficients[term_positions])
+
+        return values
+
+    def evaluate(self, data):
+        """Evaluate the sum of the terms for each observation in `data`.
+
+        Args:
+            data (:class:`~pandas.DataFrame`): See :meth:`~maccabee.data_generation.sampled_functions.TermTable.evaluate_terms`.
+
+        Returns:
+            :class:`numpy.ndarray`: The sum of the term values for each observation.
+        """
+        return np.sum(self.evaluate_terms(data), axis=1)
+
+    def to_expressions(self):
+        """Build the Sympy expression of each term. Uninitialized constants are left as symbols.
+
+        Returns:
+            list: A list of Sympy expressions.
+        """
+        if self._expressions is None:
+            covariate_symbols = sp.symbols(self.covariate_names)
+            if len(self.covariate_names) == 1:
+                covariate_symbols = [covariate_symbols]
+
+            expressions = []
+            for form, indices, coefficient, threshold in zip(
+                self.forms, self.covariate_indices,
+                self.coefficients, self.thresholds):
+
+                coefficient = _COEFFICIENT_SYMBOL if np.isnan(coefficient) else coefficient
+                if form == CONSTANT_TERM_CODE:
+                    expressions.append(sp.sympify(coefficient))
+                    continue
+
+                form_spec = SamplingConstants.SUBFUNCTION_FORMS[SUBFUNCTION_FORM_NAMES[form]]
+                substitutions = [
+                    (form_symbol, covariate_symbols[index])
+                    for form_symbol, index in zip(
+                        form_spec[SamplingConstants.COVARIATE_SYMBOLS_KEY], indices)
+                ]
+                substitutions.append((_COEFFICIENT_SYMBOL, coefficient))
+                if not np.isnan(threshold):
+                    substitutions.append((_THRESHOLD_SYMBOL, threshold))
+
+                expressions.append(
+                    form_spec[SamplingConstants.EXPRESSION_KEY].subs(substitutions))
+
+            self._expressions = expressions
+
+        return self._expressions
+
+    def __iter__(self):
+        return iter(self.to_expressions())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_expressions"] = None
+        return state
+
+    def __repr__(self):
+        return f"TermTable({len(self)} terms)"
+
+class SampledFunction():
+    """This class represents a sampled function of the covariates: the sum of the terms in a :class:`~maccabee.data_generation.sampled_functions.TermTable` which is scaled, offset and then passed through a link function. The value of the function is ``link(scale*sum(terms) + offset)``.
+
+    Args:
+        term_table (:class:`~maccabee.data_generation.sampled_functions.TermTable`): The function's terms.
+        scale (float): The scale applied to the sum of the terms. Defaults to 1.
+        offset (float): The offset added to the scaled sum. Defaults to 0.
+        link (str): The link function. One of "identity" or "logistic". Defaults to "identity".
+
+    Attributes:
+        term_table
+        scale
+        offset
+        link
+    """
+
+    IDENTITY_LINK = "identity"
+    LOGISTIC_LINK = "logistic"
+
+    def __init__(self, term_table, scale=1, offset=0, link=IDENTITY_LINK):
+        self.term_table = term_table
+        self.scale = scale
+        self.offset = offset
+        self.link = link
+
+        self._expression = None
+
+    def with_link(self, link):
+        """Returns a copy of this function with a different link function.
+
+        Args:
+            link (str): The new link function.
+
+        Returns:
+            :class:`~maccabee.data_generation.sampled_functions.SampledFunction`: The new function.
+        """
+        return SampledFunction(self.term_table, self.scale, self.offset, link)
+
+    def is_constant(self):
+        """Returns ``True`` if the function does not depend on the covariates."""
+        return len(self.term_table) == 0 or self.scale == 0
+
+    def _apply_link(self, value):
+        if self.link == SampledFunction.LOGISTIC_LINK:
+            return 1/(1 + np.exp(-1*value))
+        else:
+            return value
+
+    def evaluate(self, data):
+        """Evaluate the function for each observation in `data`.
+
+        Args:
+            data (:class:`~pandas.DataFrame`): The covariate data.
+
+        Returns:
+            :class:`~pandas.Series`: The function values. If the function is constant, the single (scalar) value of the function is returned instead, matching the behavior of :func:`~maccabee.data_generation.utils.evaluate_expression` for constant expressions.
+        """
+        if self.is_constant():
+            return self._apply_link(self.offset)
+
+        value = self.scale*self.term_table.evaluate(data) + self.offset
+        return pd.Series(self._apply_link(value))
+
+    def to_expression(self):
+        """Build the Sympy expression of the function.
+
+        Returns:
+            Sympy Expression: The expression.
+        """
+        if self._expression is None:
+            if self.is_constant():
+                expression = sp.sympify(self.offset)
+            else:
+                expression = self.scale*sp.Add(*self.term_table.to_expressions()) + self.offset
+
+            if self.link == SampledFunction.LOGISTIC_LINK:
+                expression = 1/(1 + sp.functions.exp(-1*expression))
+
+            self._expression = expression
+
+        return self._expression
+
+    def _sympy_(self):
+        return self.to_expression()
+
+    def __iter__(self):
+        return iter(self.term_table)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_expression"] = None
+        return state
+
+    def __str__(self):
+        return str(self.to_expression())
+
+    def __repr__(self):
+        return f"SampledFunction({len(self.term_table)} terms, link={self.link})"
@@ -0,0 +1,402 @@
+"""This submodule contains a compact, versioned, serialization format for :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess` instances. Pickling a sampled DGP stores the full covariate data, the parameter store, the data source and the sampled functions. This is slow and produces large files. The format in this module instead stores:
+
+* A fingerprint of the covariate data in the DGP's :class:`~maccabee.data_sources.data_sources.DataSource` and the (``int32``) indices of the rows observed in the DGP. The covariate values are recovered from the data source when the DGP is loaded. DGPs whose covariate data can't be recovered from their data source, for example those built on a :class:`~maccabee.data_sources.data_sources.StochasticDataSource`, have their covariate values embedded instead.
+* The :class:`~maccabee.data_generation.sampled_functions.TermTable` arrays of the sampled treatment and outcome functions along with their scales and offsets.
+* The sampling parameters as a flat record of parameter values. Identical parameter records are stored once per file.
+
+Any number of DGPs can be saved in a single file using :func:`~maccabee.data_generation.serialization.save_dgps` and loaded using :func:`~maccabee.data_generation.serialization.load_dgps`. Both functions also accept file-like objects so the format can be used to send DGPs between processes.
+"""
+
+import hashlib
+import json
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from ..exceptions import DGPSerializationException
+from ..parameters import build_default_parameters
+from ..data_sources.data_sources import StaticDataSource
+from .data_generating_process import SampledDataGeneratingProcess
+from .sampled_functions import TermTable, SampledFunction, MAX_TERM_COVARIATES
+
+from ..logging import get_logger
+logger = get_logger(__name__)
+
+#: The version of the serialization format. Files with a different version
+#: can't be loaded.
+SERIALIZATION_FORMAT_VERSION = 1
+
+# The term tables stored for each DGP, in order.
+_DGP_TERM_TABLES = ["outcome", "treatment", "treatment_effect"]
+
+# Fingerprints of static and out-of-core data sources, which don't change
+# after creation.
+_STATIC_DATA_SOURCE_FINGERPRINTS = weakref.WeakKeyDictionary()
+
+# The number of row indices hashed at once when fingerprinting out-of-core
+# data sources.
+_FINGERPRINT_INDEX_CHUNK_SIZE = 2**20
+
+def get_data_source_fingerprint(data_source, covariate_data=None):
+    """Calculate a fingerprint of the covariate data and meta-data in `data_source`. Two data sources with the same fingerprint produce identical covariate data. The covariate data of out-of-core data sources is hashed block by block as it is read, without loading the full data.
+
+    Args:
+        data_source (:class:`~maccabee.data_sources.data_sources.DataSource`): The data source.
+        covariate_data (:class:`~pandas.DataFrame`): The covariate data of the data source, if it has already been fetched using :meth:`~maccabee.data_sources.data_sources.DataSource.get_covar_df`. Defaults to None, in which case the data is fetched (or streamed, for out-of-core data sources).
+
+    Returns:
+        str: A hex digest which identifies the data source.
+    """
+    if data_source in _STATIC_DATA_SOURCE_FINGERPRINTS:
+        return _STATIC_DATA_SOURCE_FINGERPRINTS[data_source]
+
+    fingerprint_hash = hashlib.sha256()
+
+    if covariate_data is None and data_source.out_of_core:
+        # Hash the same bytes as the full covariate data, whose index is the
+        # row positions, one block at a time.
+        fingerprint_hash.update(json.dumps([
+            list(map(str, data_source.get_covar_names())),
+            list(map(str, data_source.get_discrete_covar_names()))
+        ]).encode())
+
+        n_observations = data_source.get_n_observations()
+        for start in range(0, n_observations, _FINGERPRINT_INDEX_CHUNK_SIZE):
+            fingerprint_hash.update(np.arange(
+                start, min(start + _FINGERPRINT_INDEX_CHUNK_SIZE, n_observations),
+                dtype=np.int64).tobytes())
+
+        for covariate_block in data_source.iter_covar_blocks():
+            fingerprint_hash.update(np.ascontiguousarray(
+                covariate_block, dtype=np.float64).tobytes())
+    else:
+        if covariate_data is None:
+            covariate_data = data_source.get_covar_df()
+
+        fingerprint_hash.update(json.dumps([
+            list(map(str, covariate_data.columns)),
+            list(map(str, data_source.get_discrete_covar_names()))
+        ]).encode())
+        fingerprint_hash.update(np.ascontiguousarray(
+            covariate_data.index.to_numpy(dtype=np.int64)).tobytes())
+        fingerprint_hash.update(np.ascontiguousarray(
+            covariate_data.to_numpy(dtype=np.float64)).tobytes())
+
+    fingerprint = fingerprint_hash.hexdigest()
+
+    if isinstance(data_source, StaticDataSource) or data_source.out_of_core:
+        _STATIC_DATA_SOURCE_FINGERPRINTS[data_source] = fingerprint
+
+    return fingerprint
+
+def _json_value(value):
+    # Convert numpy scalars and arrays in parameter values to JSON types.
+    if isinstance(value, np.generic):
+        return value.item()
+    elif isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Unserializable parameter value {value}")
+
+def _function_record(function):
+    # Flatten a sampled function (or constant) to its scale and offset. The
+    # term table is stored separately.
+    if isinstance(function, SampledFunction):
+        return [float(function.scale), float(function.offset)]
+    elif isinstance(function, (int, float, np.number)):
+        return float(function)
+    else:
+        raise DGPSerializationException(
+            f"Unable to serialize DGP function {function}. Compiled functions can't be serialized.")
+
+def _get_observed_rows(dgp, source_records, data_source_cache):
+    # Find the positions of the DGP's observed rows in its data source's
+    # covariate data. Returns the source record index and the positions, or
+    # None and the index labels if the observed data must be embedded.
+    observed_covariate_data = dgp.observed_covariate_data
+    data_source = dgp.data_source
+
+    if data_source is not None and data_source.out_of_core:
+        # The rows of out-of-core data sources are indexed by their
+        # positions, so the positions are read from the observed data's
+        # index rather than by searching the full covariate data.
+        if data_source not in data_source_cache:
+            data_source_cache[data_source] = get_data_source_fingerprint(data_source)
+
+        fingerprint = data_source_cache[data_source]
+        row_positions = observed_covariate_data.index.to_numpy(dtype=np.int64)
+        covariate_names = list(data_source.get_covar_names())
+
+        if (np.all(row_positions >= 0) and
+            np.all(row_positions < data_source.get_n_observations()) and
+            covariate_names == list(observed_covariate_data.columns)):
+
+            source_record = {
+                "fingerprint": fingerprint,
+                "covariate_names": list(map(str, covariate_names)),
+                "discrete_covariate_names": list(data_source.get_discrete_covar_names())
+            }
+            if source_record not in source_records:
+                source_records.append(source_record)
+
+            return source_records.index(source_record), row_positions
+
+    elif data_source is not None:
+        if data_source not in data_source_cache:
+            source_covariate_data = data_source.get_covar_df()
+            fingerprint = get_data_source_fingerprint(
+                data_source, source_covariate_data)
+            data_source_cache[data_source] = (source_covariate_data, fingerprint)
+
+        source_covariate_data, fingerprint = data_source_cache[data_source]
+        row_positions = source_covariate_data.index.get_indexer(
+            observed_covariate_data.index)
+
+        # The observed data is recoverable if all rows are found in the
+        # source data with the same values.
+        if (np.all(row_positions >= 0) and
+            list(source_covariate_data.columns) == list(observed_covariate_data.columns) and
+            np.array_equal(
+                source_covariate_data.to_numpy()[row_positions],
+                observed_covariate_data.to_numpy())):
+
+            source_record = {
+                "fingerprint": fingerprint,
+                "covariate_names": list(map(str, source_covariate_data.columns)),
+                "discrete_covariate_names": list(data_source.get_discrete_covar_names())
+            }
+            if source_record not in source_records:
+                source_records.append(source_record)
+
+            return source_records.index(source_record), row_positions
+
+    return None, observed_covariate_data.index.to_numpy()
+
+def save_dgps(file, dgps, compress=True):
+    """Save the sampled DGPs in `dgps` to `file` in the compact format described in the module docs.
+
+    Args:
+        file (str or file): A file path or file-like object to which the DGPs are written. A ``.npz`` extension is appended to paths without it.
+        dgps (list): A list of :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess` instances sampled by a :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler`.
+        compress (bool): Whether to compress the saved arrays. Compression produces much smaller files at the cost of slower saving and loading. Defaults to True.
+
+    Raises:
+        DGPSerializationException: If a DGP does not have term table based sampled functions.
+    """
+    source_records = []
+    parameter_records = []
+    dgp_records = []
+    data_source_cache = {}
+
+    row_arrays = []
+    embedded_covariate_arrays = []
+    term_tables = []
+
+    for dgp in dgps:
+        if not isinstance(dgp.outcome_covariate_transforms, TermTable):
+            raise DGPSerializationException(
+                "Only DGPs with term table sampled functions can be serialized.")
+
+        # Covariate data.
+        source_index, rows = _get_observed_rows(
+            dgp, source_records, data_source_cache)
+        row_arrays.append(rows)
+
+        covariate_names = list(map(str, dgp.observed_covariate_data.columns))
+        if source_index is None:
+            embedded_covariate_arrays.append(
+                dgp.observed_covariate_data.to_numpy(dtype=np.float64))
+
+        # Parameters.
+        parameter_record = json.dumps(
+            dgp.params.parsed_parameter_dict, sort_keys=True, default=_json_value)
+        if parameter_record not in parameter_records:
+            parameter_records.append(parameter_record)
+
+        # Sampled functions. The treatment logit function has no terms if
+        # it is constant and the treatment effect has no terms if it is
+        # homogenous.
+        treatment_effect_terms = TermTable.empty(covariate_names)
+        if isinstance(dgp.treatment_effect_subfunction, SampledFunction):
+            treatment_effect_terms = dgp.treatment_effect_subfunction.term_table
+
+        term_tables.extend([
+            dgp.outcome_covariate_transforms,
+            dgp.treatment_covariate_transforms,
+            treatment_effect_terms
+        ])
+
+        dgp_records.append({
+            "source": source_index,
+            "covariate_names": covariate_names if source_index is None else None,
+            "parameters": parameter_records.index(parameter_record),
+            "treatment_logit": _function_record(dgp.treatment_assignment_logit_function),
+            "treatment_logit_constant": bool(dgp.treatment_assignment_logit_function.is_constant()),
+            "untreated_outcome": _function_record(dgp.untreated_outcome_subfunction),
+            "treatment_effect": _function_record(dgp.treatment_effect_subfunction)
+        })
+
+    metadata = {
+        "version": SERIALIZATION_FORMAT_VERSION,
+        "sources": source_records,
+        "parameters": parameter_records,
+        "dgps": dgp_records
+    }
+
+    if len(term_tables) > 0:
+        all_terms = TermTable.concatenate(term_tables)
+    else:
+        all_terms = TermTable.empty([])
+
+    arrays = {
+        "metadata": np.frombuffer(json.dumps(metadata).encode(), dtype=np.uint8),
+        "row_indices": np.concatenate(row_arrays + [np.empty(0)]).astype(np.int32),
+        "row_offsets": np.cumsum([0] + [len(rows) for rows in row_arrays]),
+        "embedded_covariates": np.concatenate(
+            [values.reshape(-1) for values in embedded_covariate_arrays] + [np.empty(0)]),
+        "term_forms": all_terms.forms,
+        "term_covariate_indices": all_terms.covariate_indices,
+        "term_coefficients": all_terms.coefficients,
+        "term_thresholds": all_terms.thresholds,
+        "term_table_offsets": np.cumsum([0] + [len(table) for table in term_tables])
+    }
+
+    if compress:
+        np.savez_compressed(file, **arrays)
+    else:
+        np.savez(file, **arrays)
+
+def _build_function(function_record, term_table):
+    # Rebuild a sampled function (or constant) from its record and terms.
+    if isinstance(function_record, list):
+        scale, offset = function_record
+        return SampledFunction(term_table, scale=scale, offset=offset)
+    else:
+        return function_record
+
+def load_dgps(file, data_source=None,
+    dgp_class=SampledDataGeneratingProcess, dgp_kwargs={}):
+    """Load the sampled DGPs saved in `file` by :func:`~maccabee.data_generation.serialization.save_dgps`.
+
+    Args:
+        file (str or file): A file path or file-like object from which the DGPs are read.
+        data_source (:class:`~maccabee.data_sources.data_sources.DataSource`): The data source from which the DGPs' covariate data is recovered. This must have the same fingerprint as the data source of the saved DGPs. Defaults to None, which is only valid if all the DGPs have embedded covariate data.
+        dgp_class (:class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`): The class of the loaded DGPs. Defaults to :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`.
+        dgp_kwargs (dict): A dictionary of keyword arguments which is passed to the loaded DGPs at instantiation. Defaults to {}.
+
+    Returns:
+        list: A list of :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess` instances.
+
+    Raises:
+        DGPSerializationException: If the file has an unsupported format version or the DGPs require a data source which doesn't match `data_source`.
+    """
+    with np.load(file) as saved_arrays:
+        arrays = {name: saved_arrays[name] for name in saved_arrays.files}
+
+    metadata = json.loads(arrays["metadata"].tobytes().decode())
+    if metadata["version"] != SERIALIZATION_FORMAT_VERSION:
+        raise DGPSerializationException(
+            f"Unsupported DGP serialization format version {metadata['version']}. Expected version {SERIALIZATION_FORMAT_VERSION}.")
+
+    row_offsets = arrays["row_offsets"]
+
+    # Verify the data source and fetch its covariate data once. Only the rows
+    # observed in the DGPs are read from out-of-core data sources.
+    source_covariate_data = None
+    if len(metadata["sources"]) > 0:
+        if data_source is None:
+            raise DGPSerializationException(
+                "The saved DGPs require a data source to recover their covariate data.")
+
+        if data_source.out_of_core:
+            fingerprint = get_data_source_fingerprint(data_source)
+        else:
+            source_covariate_data = data_source.get_covar_df()
+            fingerprint = get_data_source_fingerprint(data_source, source_covariate_data)
+
+        for source_record in metadata["sources"]:
+            if source_record["fingerprint"] != fingerprint:
+                raise DGPSerializationException(
+                    "The supplied data source does not match the data source of the saved DGPs.")
+
+        if data_source.out_of_core:
+            source_rows = [
+                arrays["row_indices"][row_offsets[dgp_index]:row_offsets[dgp_index+1]]
+                for dgp_index, dgp_record in enumerate(metadata["dgps"])
+                if dgp_record["source"] is not None
+            ]
+            source_covariate_data = data_source.get_covar_rows(
+                np.unique(np.concatenate(source_rows)).astype(np.int64))
+
+    # Rebuild the parameter stores, one per unique parameter record.
+    parameter_stores = []
+    for parameter_record in metadata["parameters"]:
+        params = build_default_parameters()
+        params.set_parameters(
+            json.loads(parameter_record), recalculate_calculated_params=False)
+        parameter_stores.append(params)
+
+    term_table_offsets = arrays["term_table_offsets"]
+    embedded_covariate_offset = 0
+
+    dgps = []
+    for dgp_index, dgp_record in enumerate(metadata["dgps"]):
+        rows = arrays["row_indices"][row_offsets[dgp_index]:row_offsets[dgp_index+1]]
+
+        # Recover or unpack the observed covariate data.
+        if dgp_record["source"] is not None and data_source.out_of_core:
+            observed_covariate_data = source_covariate_data.loc[rows.astype(np.int64)]
+            covariate_names = metadata["sources"][dgp_record["source"]]["covariate_names"]
+        elif dgp_record["source"] is not None:
+            observed_covariate_data = source_covariate_data.iloc[rows]
+            covariate_names = metadata["sources"][dgp_record["source"]]["covariate_names"]
+        else:
+            covariate_names = dgp_record["covariate_names"]
+            n_values = len(rows)*len(covariate_names)
+            observed_covariate_data = pd.DataFrame(
+                arrays["embedded_covariates"][
+                    embedded_covariate_offset:embedded_covariate_offset+n_values
+                ].reshape((len(rows), len(covariate_names))),
+                index=rows.astype(np.int64),
+                columns=covariate_names)
+            embedded_covariate_offset += n_values
+
+        # Unpack the term tables.
+        tables = {}
+        for table_index, table_name in enumerate(_DGP_TERM_TABLES):
+            offset_index = len(_DGP_TERM_TABLES)*dgp_index + table_index
+            table_slice = slice(
+                term_table_offsets[offset_index], term_table_offsets[offset_index+1])
+
+            tables[table_name] = TermTable(
+                covariate_names,
+                arrays["term_forms"][table_slice],
+                arrays["term_covariate_indices"].reshape((-1, MAX_TERM_COVARIATES))[table_slice],
+                arrays["term_coefficients"][table_slice],
+                arrays["term_thresholds"][table_slice])
+
+        # Rebuild the sampled functions.
+        if dgp_record["treatment_logit_constant"]:
+            logit_terms = TermTable.empty(covariate_names)
+        else:
+            logit_terms = tables["treatment"]
+
+        treatment_assignment_logit_function = _build_function(
+            dgp_record["treatment_logit"], logit_terms)
+
+        dgps.append(dgp_class(
+            params=parameter_stores[dgp_record["parameters"]],
+            observed_covariate_data=observed_covariate_data,
+            outcome_covariate_transforms=tables["outcome"],
+            treatment_covariate_transforms=tables["treatment"],
+            treatment_assignment_logit_func=treatment_assignment_logit_function,
+            treatment_assignment_function=treatment_assignment_logit_function.with_link(
+                SampledFunction.LOGISTIC_LINK),
+            treatment_effect_subfunction=_build_function(
+                dgp_record["treatment_effect"], tables["treatment_effect"]),
+            untreated_outcome_subfunction=_build_function(
+                dgp_record["untreated_outcome"], tables["outcome"]),
+            data_source=data_source if dgp_record["source"] is not None else None,
+            **dgp_kwargs))
+
+    return dgps
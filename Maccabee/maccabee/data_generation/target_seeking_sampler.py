@@ -0,0 +1,294 @@
+"""This submodule contains the :class:`~maccabee.data_generation.target_seeking_sampler.TargetSeekingDGPSampler` class. This class extends the :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler` with a sampling mode which targets ranges of realized :term:`data metric <data metric>` values rather than sampling parameter values.
+
+The mapping from sampling parameters to realized data metrics is noisy and only partially known. So, rather than oversampling DGPs and filtering them by their metric values, the target-seeking sampler combines rejection sampling with stochastic approximation. Each sampled DGP is used to generate a pilot data set. The target metrics are calculated on this data set in order of their estimated cost, and the DGP is rejected as soon as one falls outside its target range. After each DGP, the sampling parameters which control the calculated metrics are adjusted toward the target using a Robbins-Monro update with a decaying gain. The parameters therefore move into the region of the parameter space which produces the target metrics and the acceptance rate rises as sampling progresses.
+
+The parameters adjusted for each metric are defined in :data:`~maccabee.data_generation.target_seeking_sampler.METRIC_PARAMETER_ADJUSTMENTS`. Target metrics without an entry in this dictionary are only used for rejection.
+"""
+
+from copy import deepcopy
+
+import numpy as np
+
+from ..constants import Constants
+from .data_generating_process import SampledDataGeneratingProcess
+from .data_generating_process_sampler import DataGeneratingProcessSampler
+
+from ..logging import get_logger
+logger = get_logger(__name__)
+
+AxisNames = Constants.AxisNames
+SchemaConstants = Constants.ParamSchemaKeysAndVals
+
+# The spaces in which the sampling parameters are adjusted.
+#: Additive adjustment, clipped to the parameter's valid range.
+LINEAR_ADJUSTMENT = "linear"
+#: Additive adjustment of the logit of a probability parameter.
+LOGIT_ADJUSTMENT = "logit"
+#: Multiplicative adjustment of the non-linear subfunction form probabilities
+#: in a selection probability dictionary parameter.
+NONLINEAR_FORMS_ADJUSTMENT = "nonlinear_forms"
+
+#: The sampling parameter adjusted for each (axis name, metric name) pair.
+#: Each entry specifies the parameter, the space in which it is adjusted,
+#: the direction of the (approximately monotonic) relationship between the
+#: parameter and the metric, and a scale which converts the metric value
+#: to a proportion for metrics which are percentages. Errors in percentage
+#: metrics are measured on the logit scale.
+METRIC_PARAMETER_ADJUSTMENTS = {
+    (AxisNames.PERCENT_TREATED, "Percent(T==1)"): {
+        "parameter": "TARGET_PROPENSITY_SCORE",
+        "space": LOGIT_ADJUSTMENT,
+        "direction": 1,
+        "metric_scale": 100
+    },
+    (AxisNames.TE_HETEROGENEITY, "std(TE)/std(Y)"): {
+        "parameter": "TREATMENT_EFFECT_HETEROGENEITY",
+        "space": LINEAR_ADJUSTMENT,
+        "direction": 1
+    },
+    (AxisNames.ALIGNMENT, "Lin r2(Y0, Treat Logit)"): {
+        "parameter": "ACTUAL_CONFOUNDER_ALIGNMENT",
+        "space": LINEAR_ADJUSTMENT,
+        "direction": 1
+    },
+    (AxisNames.BALANCE, "Mean dist X_true: T=1<->T=0"): {
+        "parameter": "FORCED_IMBALANCE_ADJUSTMENT",
+        "space": LINEAR_ADJUSTMENT,
+        "direction": 1
+    },
+    (AxisNames.TREATMENT_NONLINEARITY, "Lin r2(X_obs, Treat Logit)"): {
+        "parameter": "TREAT_MECHANISM_COVARIATE_SELECTION_PROBABILITY",
+        "space": NONLINEAR_FORMS_ADJUSTMENT,
+        "direction": -1
+    },
+    (AxisNames.OUTCOME_NONLINEARITY, "Lin r2(X_obs, Y0)"): {
+        "parameter": "OUTCOME_MECHANISM_COVARIATE_SELECTION_PROBABILITY",
+        "space": NONLINEAR_FORMS_ADJUSTMENT,
+        "direction": -1
+    }
+}
+
+# The exponent of the decaying Robbins-Monro gain sequence.
+_GAIN_DECAY_EXPONENT = 0.6
+
+def _logit(p):
+    p = np.clip(p, 1e-6, 1 - 1e-6)
+    return np.log(p/(1-p))
+
+def _logistic(x):
+    return 1/(1 + np.exp(-x))
+
+class TargetSeekingDGPSampler(DataGeneratingProcessSampler):
+    """TargetSeekingDGPSampler(...)
+
+    A :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler` which samples DGPs with data metric values in target ranges. See the module docs for a description of the sampling process. The supplied parameters are the starting point for the parameter adjustment and are copied, so the supplied :class:`~maccabee.parameters.parameter_store.ParameterStore` instance is not modified.
+
+    Args:
+        parameters (:class:`~maccabee.parameters.parameter_store.ParameterStore`): See :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler`.
+        data_source (:class:`~maccabee.data_sources.data_sources.DataSource`): See :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler`.
+        target_metric_ranges (dict): A nested dictionary which maps axis names to dictionaries that map metric names to (low, high) tuples of inclusive target bounds. Either bound can be None. The metric names are those in :data:`~maccabee.data_analysis.data_metrics.AXES_AND_METRIC_NAMES`.
+        learning_rate (float): The initial gain of the parameter adjustment. Defaults to 1.
+        approximate_metrics (bool): Whether the metrics of large pilot data sets are approximated using subsamples. See :func:`~maccabee.data_analysis.data_analysis.calculate_data_axis_metrics`. Defaults to False.
+        dgp_class (:class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess`): See :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler`.
+        dgp_kwargs (dict): See :class:`~maccabee.data_generation.data_generating_process_sampler.DataGeneratingProcessSampler`.
+
+    Attributes:
+        sampling_report: A dictionary which reports on the most recent call to :meth:`~maccabee.data_generation.target_seeking_sampler.TargetSeekingDGPSampler.sample_target_dgps`. It contains the number of sampled and accepted DGPs, the acceptance rate, the number of metric evaluations, the number of rejections by each metric and the final values of the adjusted parameters.
+    """
+
+    def __init__(self, parameters, data_source, target_metric_ranges,
+        learning_rate=1, approximate_metrics=False,
+        dgp_class=SampledDataGeneratingProcess, dgp_kwargs={}):
+
+        super().__init__(deepcopy(parameters), data_source,
+            dgp_class=dgp_class, dgp_kwargs=dgp_kwargs)
+
+        self.target_metric_ranges = target_metric_ranges
+        self.learning_rate = learning_rate
+        self.approximate_metrics = approximate_metrics
+        self.sampling_report = None
+
+        # The number of parameter updates so far, which determines the gain.
+        self._n_updates = 0
+
+        self._ordered_target_metrics = self._order_target_metrics()
+
+    def _order_target_metrics(self):
+        # Order the target metrics by their estimated cost so that cheap
+        # metrics are used to reject DGPs first.
+        from ..data_analysis.data_metrics import estimate_data_metric_cost
+
+        n_observations = int(self.data_source.get_n_observations()*self.params.OBSERVATION_PROBABILITY)
+        n_covariates = len(self.data_source.get_covar_names())
+
+        target_metrics = [
+            (axis_name, metric_name)
+            for axis_name, metric_ranges in self.target_metric_ranges.items()
+            for metric_name in metric_ranges
+        ]
+
+        return sorted(target_metrics, key=lambda target_metric: estimate_data_metric_cost(
+            *target_metric, n_observations, n_covariates))
+
+    def _metric_in_range(self, axis_name, metric_name, value):
+        low, high = self.target_metric_ranges[axis_name][metric_name]
+        return ((low is None or value >= low) and
+            (high is None or value <= high))
+
+    def _get_target_value(self, axis_name, metric_name):
+        # The value toward which a metric is pushed. This is the center of
+        # the target range or the finite bound of a half-open range.
+        low, high = self.target_metric_ranges[axis_name][metric_name]
+        if low is None and high is None:
+            return None
+        elif low is None:
+            return high
+        elif high is None:
+            return low
+        else:
+            return (low + high)/2
+
+    def _adjust_parameters(self, metric_values):
+        # Move the adjustable parameters toward the values which produce
+        # the target metrics using a Robbins-Monro update.
+        gain = self.learning_rate/((self._n_updates + 1)**_GAIN_DECAY_EXPONENT)
+        self._n_updates += 1
+
+        for (axis_name, metric_name), value in metric_values.items():
+            adjustment = METRIC_PARAMETER_ADJUSTMENTS.get((axis_name, metric_name))
+            if adjustment is None:
+                continue
+
+            target_value = self._get_target_value(axis_name, metric_name)
+            if target_value is None or not np.isfinite(value):
+                continue
+
+            # Half-open ranges are only pushed toward their bound when the
+            # metric is outside the range.
+            if self._metric_in_range(axis_name, metric_name, value) and \
+                None in self.target_metric_ranges[axis_name][metric_name]:
+                continue
+
+            metric_scale = adjustment.get("metric_scale", 1)
+            if adjustment["space"] == LOGIT_ADJUSTMENT:
+                error = _logit(target_value/metric_scale) - _logit(value/metric_scale)
+            else:
+                error = (target_value - value)/metric_scale
+
+            step = gain*adjustment["direction"]*error
+            self._apply_parameter_step(adjustment, step)
+
+    def _apply_parameter_step(self, adjustment, step):
+        # Apply an adjustment step to a parameter in its adjustment space,
+        # keeping the parameter within its valid range.
+        param_name = adjustment["parameter"]
+        param_value = getattr(self.params, param_name)
+        param_schema = Constants.ParamFilesAndPaths.SCHEMA[param_name]
+
+        if adjustment["space"] == NONLINEAR_FORMS_ADJUSTMENT:
+            linear_form = Constants.DGPSampling.LINEAR
+            new_value = {
+                form_name: probability if form_name == linear_form
+                    else float(np.clip(probability*np.exp(step), 0, 1))
+                for form_name, probability in param_value.items()
+            }
+
+            # Forms with zero probability are given a small probability when
+            # the parameter is moving toward more non-linearity.
+            if step > 0:
+                new_value = {
+                    form_name: probability if (form_name == linear_form or probability > 0)
+                        else float(min(1, 0.01*step))
+                    for form_name, probability in new_value.items()
+                }
+        else:
+            if adjustment["space"] == LOGIT_ADJUSTMENT:
+                new_value = float(_logistic(_logit(param_value) + step))
+            else:
+                new_value = float(param_value + step)
+
+            new_value = float(np.clip(new_value,
+                param_schema[SchemaConstants.MIN_KEY],
+                param_schema[SchemaConstants.MAX_KEY]))
+
+        self.params.set_parameter(param_name, new_value)
+
+    def _evaluate_pilot(self, dgp, rejection_counts):
+        # Calculate the target metrics on a pilot data set from the DGP in
+        # cost order, stopping at the first metric outside its target range.
+        # Returns whether the DGP is accepted and the calculated values.
+        from ..data_analysis import calculate_data_axis_metrics
+
+        pilot_dataset = dgp.generate_dataset()
+
+        metric_values = {}
+        for axis_name, metric_name in self._ordered_target_metrics:
+            metric_results = calculate_data_axis_metrics(
+                pilot_dataset,
+                observation_spec={axis_name: [metric_name]},
+                approximate=self.approximate_metrics)
+            value = metric_results[axis_name][metric_name]
+            metric_values[(axis_name, metric_name)] = value
+
+            if not self._metric_in_range(axis_name, metric_name, value):
+                rejection_counts[f"{axis_name} {metric_name}"] += 1
+                return False, metric_values
+
+        return True, metric_values
+
+    def sample_target_dgps(self, n_dgps, max_samples=1000):
+        """Sample DGPs until `n_dgps` DGPs with metric values in the target ranges have been accepted or `max_samples` DGPs have been sampled. The sampling parameters are adjusted after each sampled DGP. See the module docs for more detail. A report on the sampling process is stored in :attr:`sampling_report`.
+
+        Args:
+            n_dgps (int): The number of DGPs to accept.
+            max_samples (int): The maximum number of DGPs to sample. Defaults to 1000.
+
+        Returns:
+            list: A list of the accepted :class:`~maccabee.data_generation.data_generating_process.SampledDataGeneratingProcess` instances. This contains fewer than `n_dgps` DGPs if `max_samples` is reached.
+        """
+        accepted_dgps = []
+        rejection_counts = {
+            f"{axis_name} {metric_name}": 0
+            for axis_name, metric_name in self._ordered_target_metrics
+        }
+        n_sampled = 0
+        n_metric_evaluations = 0
+
+        while len(accepted_dgps) < n_dgps and n_sampled < max_samples:
+            dgp = self.sample_dgp()
+            n_sampled += 1
+
+            try:
+                accepted, metric_values = self._evaluate_pilot(dgp, rejection_counts)
+            except Exception:
+                logger.warning("Rejecting DGP with failed data metric calculation.", exc_info=True)
+                continue
+
+            n_metric_evaluations += len(metric_values)
+            if accepted:
+                accepted_dgps.append(dgp)
+
+            self._adjust_parameters(metric_values)
+
+        adjusted_parameters = set(
+            METRIC_PARAMETER_ADJUSTMENTS[target_metric]["parameter"]
+            for target_metric in self._ordered_target_metrics
+            if target_metric in METRIC_PARAMETER_ADJUSTMENTS)
+
+        self.sampling_report = {
+            "n_sampled": n_sampled,
+            "n_accepted": len(accepted_dgps),
+            "acceptance_rate": len(accepted_dgps)/max(1, n_sampled),
+            "n_metric_evaluations": n_metric_evaluations,
+            "rejections_by_metric": rejection_counts,
+            "parameters": {
+                param_name: getattr(self.params, param_name)
+                for param_name in adjusted_parameters
+            }
+        }
+
+        logger.info(f"Target-seeking sampling accepted {len(accepted_dgps)} of {n_sampled} DGPs. Acceptance rate: {self.sampling_report['acceptance_rate']:.3f}")
+        if len(accepted_dgps) < n_dgps:
+            logger.warning(f"Target-seeking sampling reached the maximum of {max_samples} samples with {len(accepted_dgps)}/{n_dgps} DGPs accepted.")
+
+        return accepted_dgps
@@ -6,11 +6,14 @@ import numpy as np
 import sympy as sp
 import pandas as pd
 from functools import partial
+from contextlib import contextmanager
+from math import comb
 import importlib
 from multiprocessing import Process
 
 from ..constants import Constants
 from ..exceptions import DGPFunctionCompilationException
+from .sampled_functions import SampledFunction, TermTable
 
 from ..logging import get_logger
 logger = get_logger(__name__)
@@ -63,6 +66,81 @@ def select_objects_given_probability(objects_to_sample, selection_probability):
     else:
         return objects_to_sample[selected_indeces, :]
 
+def _unrank_combinations(ranks, n_objects, combination_size):
+    # Convert combination ranks to the (sorted) indices of the objects in
+    # each combination using the combinatorial number system. In this system,
+    # the combination c_1 < ... < c_k has rank sum_i C(c_i, i). This is
+    # inverted greedily, from c_k down to c_1, by finding the largest c_i with
+    # C(c_i, i) less than or equal to the remaining rank.
+    remaining_ranks = np.array(ranks, dtype=np.int64)
+    combination_indices = np.empty(
+        (len(remaining_ranks), combination_size), dtype=np.int64)
+
+    candidate_indices = np.arange(n_objects)
+    for position in range(combination_size, 0, -1):
+        # Monotonic table of C(c, position) for all candidate c.
+        binomial_coefficients = np.array(
+            [comb(int(index), position) for index in candidate_indices],
+            dtype=np.int64)
+
+        indices = np.searchsorted(
+            binomial_coefficients, remaining_ranks, side="right") - 1
+
+        combination_indices[:, position-1] = indices
+        remaining_ranks -= binomial_coefficients[indices]
+
+    return combination_indices
+
+def select_combinations_given_probability(objects_to_sample, combination_size, selection_probability):
+    """Samples combinations of `combination_size` objects from `objects_to_sample`. The result has the same distribution as calling :func:`~maccabee.data_generation.utils.select_objects_given_probability` with a scalar `selection_probability` on the array of all combinations produced by :func:`itertools.combinations`, but the combinations are never materialized. Instead, the number of selected combinations is sampled first and then distinct combination ranks are drawn and unranked. Time and memory are therefore proportional to the number of selected combinations rather than the (factorially growing) number of possible combinations.
+
+    Args:
+        objects_to_sample (list or :class:`numpy.ndarray`): List of objects to combine.
+        combination_size (int): The number of objects in each combination.
+        selection_probability (float): The selection probability for each combination. As in :func:`~maccabee.data_generation.utils.select_objects_given_probability`, ``int(n_combinations*selection_probability)`` combinations will be sampled if this value is greater than 0. Otherwise each combination is selected independently with the given probability.
+
+    Returns:
+        :class:`numpy.ndarray`: An array with one row per selected combination. Rows are in the order of :func:`itertools.combinations`.
+
+    Examples
+        >>> select_combinations_given_probability(["a", "b", "c"], 2, 0.5)
+        [["a", "c"]]
+    """
+    objects_to_sample = np.array(objects_to_sample)
+    n_objects = len(objects_to_sample)
+    n_combinations = comb(n_objects, combination_size)
+
+    # Sample the number of selected combinations, matching the
+    # count distribution of select_objects_given_probability.
+    expected_num_to_select = int(n_combinations*selection_probability)
+    if Constants.DGPSampling.FORCE_PER_ITEM_SAMPLING or expected_num_to_select == 0:
+        num_to_select = np.random.binomial(n_combinations, selection_probability)
+    else:
+        num_to_select = expected_num_to_select
+
+    # Draw distinct ranks. Rejection sampling is used when few combinations
+    # are selected relative to the total. Otherwise, the selected set is
+    # a large fraction of all combinations so a direct draw is no more
+    # expensive than the output.
+    if 2*num_to_select < n_combinations:
+        selected_ranks = np.unique(np.random.randint(
+            n_combinations, size=num_to_select, dtype=np.int64))
+        while len(selected_ranks) < num_to_select:
+            selected_ranks = np.union1d(selected_ranks, np.random.randint(
+                n_combinations, size=num_to_select-len(selected_ranks), dtype=np.int64))
+    else:
+        selected_ranks = np.sort(np.random.choice(
+            n_combinations, size=num_to_select, replace=False))
+
+    # Order the combinations lexicographically, like itertools.combinations.
+    combination_indices = _unrank_combinations(
+        selected_ranks, n_objects, combination_size)
+    combination_indices = combination_indices[
+        np.lexsort(combination_indices.T[::-1])]
+
+    return objects_to_sample[combination_indices].reshape(
+        (-1, combination_size) + objects_to_sample.shape[1:])
+
 # TODO-FUTURE: the code below is kept separate from the above to enable
 # a future refactor in which compiled expressions get their own
 # submodule in the data_generation main module.
@@ -185,7 +263,7 @@ class CompiledExpression():
 
             logger.debug("Executing compiled expression code.")
             # Prep data for eval
-            data = map(lambda x: x.flatten(), np.hsplit(data.values, data.shape[1]))
+            data = map(lambda x: x.flatten(), np.hsplit(data.to_numpy(dtype=float), data.shape[1]))
 
             # Eval
             expr_result = self.expression_func(*data)
@@ -201,7 +279,7 @@ def evaluate_expression(expression, data):
     """Evaluates the Sympy expression in `expression` using the :class:`pandas.DataFrame` in `data` to fill in the value of all the variables in the expression. The expression is evaluated once for each row of the DataFrame.
 
     Args:
-        expression (Sympy Expression): A Sympy expression with variables that are a subset of the variables in columns data.
+        expression (Sympy Expression): A Sympy expression with variables that are a subset of the variables in columns data. A :class:`~maccabee.data_generation.sampled_functions.SampledFunction` or :class:`~maccabee.data_generation.utils.CompiledExpression` may also be supplied, in which case it is evaluated using its own (faster) evaluation method.
         data (:class:`~pandas.DataFrame`): A DataFrame containing observations of the variables in the expression. The names of the columns must match the names of the symbols in the expression.
 
     Returns:
@@ -213,6 +291,9 @@ def evaluate_expression(expression, data):
     if isinstance(expression, CompiledExpression):
         # If compiled, then use compiled evaluation.
         return expression.eval_expr(data)
+    elif isinstance(expression, SampledFunction):
+        # If sampled, then use the vectorized term table evaluation.
+        return expression.evaluate(data)
     else:
         # If not compiled, perform direct evaluation.
         free_symbols = getattr(expression, "free_symbols", None)
@@ -229,11 +310,29 @@ def evaluate_expression(expression, data):
                     ],
                     dummify=False)
 
-            return pd.Series(expr_func(*np.hsplit(data.values, data.shape[1])).flatten())
+            return pd.Series(expr_func(*np.hsplit(data.to_numpy(dtype=float), data.shape[1])).flatten())
         else:
             # No free symbols, return expression itself.
             return expression
 
+def as_expression(function):
+    """Returns the Sympy expression represented by `function`. This is used to recover the expression from the alternative representations of functions used in sampled DGPs.
+
+    Args:
+        function (object): A :class:`~maccabee.data_generation.sampled_functions.SampledFunction`, :class:`~maccabee.data_generation.sampled_functions.TermTable`, :class:`~maccabee.data_generation.utils.CompiledExpression` or Sympy expression. Sympy expressions and constants are returned unchanged.
+
+    Returns:
+        Sympy Expression: The expression represented by `function`.
+    """
+    if isinstance(function, SampledFunction):
+        return function.to_expression()
+    elif isinstance(function, TermTable):
+        return sp.Add(*function.to_expressions())
+    elif isinstance(function, CompiledExpression):
+        return function.expression
+    else:
+        return function
+
 def initialize_expression_constants(
     constants_sampling_distro, expressions,
     constant_symbols=Constants.DGPSampling.SUBFUNCTION_CONSTANT_SYMBOLS):
@@ -274,3 +373,26 @@ def initialize_expression_constants(
             )
 
     return initialized_expressions
+
+@contextmanager
+def seeded_random_state(seed):
+    """A context manager which seeds the global NumPy random state with `seed` on entry and restores the previous random state on exit. The sampling code in this package draws from the global random state so all of the draws made inside the context are determined by `seed`, without affecting the draws made outside it.
+
+    Args:
+        seed (int): The seed. If None, the global random state is used unchanged.
+
+    Examples
+        >>> with seeded_random_state(1):
+        ...     np.random.random()
+        0.417022004702574
+    """
+    if seed is None:
+        yield
+        return
+
+    outer_random_state = np.random.get_state()
+    np.random.seed(seed)
+    try:
+        yield
+    finally:
+        np.random.set_state(outer_random_state)
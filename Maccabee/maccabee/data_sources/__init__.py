@@ -6,4 +6,4 @@
 """
 
 from .data_source_builders import *
-from .data_sources import DataSource
+from .data_sources import DataSource, CovariateNormalization, RandomNormalDataSource, MemoryMappedDataSource, StreamingDataSource, RESERVOIR_ROW_SAMPLING, BERNOULLI_ROW_SAMPLING
@@ -2,31 +2,132 @@
 
 import numpy as np
 import pandas as pd
-from functools import partial
 
 from ..constants import Constants
 
-from .data_sources import StaticDataSource, StochasticDataSource
-from .utils import random_covar_matrix, load_covars_from_csv_path, build_covar_data_frame
+from .data_sources import StaticDataSource, StochasticDataSource, MemoryMappedDataSource, RandomNormalDataSource, StreamingDataSource, RESERVOIR_ROW_SAMPLING, STREAMING_CHUNK_SIZE
+from .utils import load_covars_from_csv_path, load_csv_covar_cache, store_csv_covar_cache
 
 
-def build_csv_datasource(csv_path, discrete_covar_names=[]):
+def build_csv_datasource(csv_path, discrete_covar_names=[], use_cache=True, cache_dir=None):
     """Builds a datasource using the CSV of covariates at `csv_path`. This method expects a CSV with covariate names in the first row.
 
+    Parsing and normalizing a CSV is slow so, by default, the normalized covariates are stored in a binary cache the first time the CSV is loaded. Later calls, including those in other processes, memory-map the cached covariates rather than parsing the CSV. The cache is rebuilt if the CSV or the discrete covariates change. See :func:`~maccabee.data_sources.utils.load_csv_covar_cache`.
+
     Args:
         csv_path (string): The path to a CSV.
         discrete_covar_names (list): A list of string covariate names corresponding to the discrete covariates. Defaults to [].
+        use_cache (bool): Indicates whether the binary cache is used. Defaults to ``True``.
+        cache_dir (string): The directory in which the cache is stored. Defaults to None, in which case the cache is stored next to the CSV if its directory is writable and in the user cache directory otherwise.
 
     Returns:
         :class:`DataSource <maccabee.data_sources.DataSource>`: A :class:`DataSource <maccabee.data_sources.DataSource>` instance which will generate the covariates from the CSV when sampled.
     """
+    if use_cache:
+        cached_covars = load_csv_covar_cache(csv_path, discrete_covar_names, cache_dir=cache_dir)
+        if cached_covars is not None:
+            covar_names, normalized_covar_data = cached_covars
+            return StaticDataSource(
+                static_covar_data=normalized_covar_data,
+                covar_names=covar_names,
+                discrete_covar_names=discrete_covar_names,
+                normalize=False)
+
     covar_names, covar_data = load_covars_from_csv_path(csv_path)
 
-    return StaticDataSource(
+    data_source = StaticDataSource(
         static_covar_data=covar_data,
         covar_names=covar_names,
         discrete_covar_names=discrete_covar_names)
 
+    if use_cache:
+        # Record the range of each continuous covariate, which defines
+        # the normalization.
+        normalization = data_source.normalization
+        normalization_constants = {
+            constant_name: {
+                covar_name: value
+                for covar_name, value, is_continuous in zip(
+                    covar_names, constant_values.tolist(), normalization.continuous_filter)
+                if is_continuous
+            }
+            for constant_name, constant_values in [
+                ("X_min", normalization.X_min), ("X_max", normalization.X_max)]
+        }
+
+        store_csv_covar_cache(csv_path, data_source.static_covar_df,
+            discrete_covar_names, normalization_constants, cache_dir=cache_dir)
+
+    return data_source
+
+def build_memory_mapped_datasource(npy_path, covar_names, discrete_covar_names=[]):
+    """Builds an out-of-core datasource using the 2D array of covariates in the ``.npy`` file at `npy_path`. The array is memory-mapped rather than loaded so this can be used for covariate data which is larger than the available memory. See :class:`~maccabee.data_sources.data_sources.MemoryMappedDataSource`.
+
+    Args:
+        npy_path (string): The path to a ``.npy`` file.
+        covar_names (list): A list of string covariate names corresponding to the columns of the array.
+        discrete_covar_names (list): A list of string covariate names corresponding to the discrete covariates. Defaults to [].
+
+    Returns:
+        :class:`DataSource <maccabee.data_sources.DataSource>`: A :class:`DataSource <maccabee.data_sources.DataSource>` instance which will read the sampled covariates from the array when sampled.
+    """
+    return MemoryMappedDataSource(
+        covar_data=npy_path,
+        covar_names=covar_names,
+        discrete_covar_names=discrete_covar_names)
+
+def build_streaming_csv_datasource(csv_path, discrete_covar_names=[],
+    sampling_method=RESERVOIR_ROW_SAMPLING, chunk_size=STREAMING_CHUNK_SIZE):
+    """Builds an out-of-core datasource which reads the CSV of covariates at `csv_path` in blocks of rows. This method expects a CSV with covariate names in the first row. Only the sampled rows are kept in memory, so this can be used for CSVs which are larger than the available memory. See :class:`~maccabee.data_sources.data_sources.StreamingDataSource`.
+
+    Args:
+        csv_path (string): The path to a CSV.
+        discrete_covar_names (list): A list of string covariate names corresponding to the discrete covariates. Defaults to [].
+        sampling_method (string): The row sampling scheme. See :class:`~maccabee.data_sources.data_sources.StreamingDataSource`. Defaults to :data:`~maccabee.data_sources.data_sources.RESERVOIR_ROW_SAMPLING`.
+        chunk_size (int): The number of rows read from the CSV at once. Defaults to :data:`~maccabee.data_sources.data_sources.STREAMING_CHUNK_SIZE`.
+
+    Returns:
+        :class:`DataSource <maccabee.data_sources.DataSource>`: A :class:`DataSource <maccabee.data_sources.DataSource>` instance which will stream the sampled covariates from the CSV when sampled.
+    """
+    covar_names = list(pd.read_csv(csv_path, nrows=0).columns)
+
+    def read_csv_blocks():
+        with pd.read_csv(csv_path, chunksize=chunk_size, dtype=np.float64) as csv_reader:
+            for csv_block in csv_reader:
+                yield csv_block.to_numpy()
+
+    return StreamingDataSource(
+        chunk_reader=read_csv_blocks,
+        covar_names=covar_names,
+        discrete_covar_names=discrete_covar_names,
+        sampling_method=sampling_method,
+        chunk_size=chunk_size)
+
+def build_npy_shards_datasource(npy_paths, covar_names, discrete_covar_names=[],
+    sampling_method=RESERVOIR_ROW_SAMPLING):
+    """Builds an out-of-core datasource using the 2D arrays of covariates in the ``.npy`` files in `npy_paths`, which are treated as consecutive blocks of rows of the covariate data. The shards are memory-mapped and streamed in order. See :class:`~maccabee.data_sources.data_sources.StreamingDataSource`.
+
+    Args:
+        npy_paths (list): A list of paths to ``.npy`` files.
+        covar_names (list): A list of string covariate names corresponding to the columns of the arrays.
+        discrete_covar_names (list): A list of string covariate names corresponding to the discrete covariates. Defaults to [].
+        sampling_method (string): The row sampling scheme. See :class:`~maccabee.data_sources.data_sources.StreamingDataSource`. Defaults to :data:`~maccabee.data_sources.data_sources.RESERVOIR_ROW_SAMPLING`.
+
+    Returns:
+        :class:`DataSource <maccabee.data_sources.DataSource>`: A :class:`DataSource <maccabee.data_sources.DataSource>` instance which will stream the sampled covariates from the shards when sampled.
+    """
+    npy_paths = list(npy_paths)
+
+    def read_npy_shards():
+        for npy_path in npy_paths:
+            yield np.load(npy_path, mmap_mode="r")
+
+    return StreamingDataSource(
+        chunk_reader=read_npy_shards,
+        covar_names=covar_names,
+        discrete_covar_names=discrete_covar_names,
+        sampling_method=sampling_method)
+
 def build_stochastic_datasource(generator_func, covar_names, discrete_covar_names):
     """Builds a datasource which generates covariates using the function in `generator_func`.
 
@@ -64,7 +165,7 @@ def build_lalonde_datasource():
 
 def build_random_normal_datasource(
     n_covars = 20, n_observations = 1000,
-    partial_correlation_degree=0.0):
+    partial_correlation_degree=0.0, fixed_covariance=False):
     """Builds a datasource using random normal covariates.
 
     Args:
@@ -72,37 +173,15 @@ def build_random_normal_datasource(
         n_observations (int): The number of observations in the data set. Defaults to 1000.
         partial_correlation_degree (float): The degree of partial correlation between the covariates. Full independance at ``0.0`` and perfect correlation at ``1.0``. A random covariance matrix is generated based on this parameter by approximating the random
         vine method. Defaults to 0.0.
+        fixed_covariance (bool): Indicates whether a single random covariance matrix is used for all sampled covariate data sets. If ``False``, a new covariance matrix is generated each time covariates are sampled. See :class:`~maccabee.data_sources.data_sources.RandomNormalDataSource`. Defaults to ``False``.
 
     Returns:
         :class:`DataSource <maccabee.data_sources.DataSource>`: A :class:`DataSource <maccabee.data_sources.DataSource>` instance which will generate random normal covariates when sampled.
 
     .. _SO: https://stats.stackexchange.com/questions/2746/how-to-efficiently-generate-random-positive-semidefinite-correlation-matrices/
     """
-
-
-    # Name covars sequentially
-    covar_names = [f"X{i}" for i in range(n_covars)]
-
-    gen_random_normal_data = partial(_gen_random_normal_data,
-        n_covars, n_observations, partial_correlation_degree)
-
-    return StochasticDataSource(
-        covar_data_generator=gen_random_normal_data,
-        covar_names=covar_names,
-        discrete_covar_names=[])
-
-def _gen_random_normal_data(n_covars, n_observations,
-    correlation_deg):
-    # Helper method which generates random normal data for the random normal data source builder.
-
-    covar = random_covar_matrix(
-        dimension=n_covars,
-        correlation_deg=correlation_deg)
-
-    # Generate standard normal random covariates
-    covar_data = np.random.multivariate_normal(
-        mean=np.full((n_covars,), 0),
-        cov=1*covar,
-        size=n_observations)
-
-    return covar_data
+    return RandomNormalDataSource(
+        n_covars=n_covars,
+        n_observations=n_observations,
+        partial_correlation_degree=partial_correlation_degree,
+        fixed_covariance=fixed_covariance)
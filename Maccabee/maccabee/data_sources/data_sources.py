@@ -1,15 +1,164 @@
 """This module contains :class:`DataSource`-derived objects that standardize access to and management of different sources of covariate data and meta-data used by Maccabee DGPs."""
 
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-from .utils import build_covar_data_frame
+import pandas as pd
+from .utils import build_covar_data_frame, compact_discrete_covariates, random_covar_matrix
+
+#: The default number of rows read from a memory-mapped covariate array at once.
+MEMORY_MAPPED_CHUNK_SIZE = 2**16
+
+#: The default number of rows processed at once by a :class:`StreamingDataSource`.
+STREAMING_CHUNK_SIZE = 2**16
+
+#: Select exactly ``round(frac*n)`` of the ``n`` streamed rows, uniformly without replacement.
+RESERVOIR_ROW_SAMPLING = "reservoir"
+
+#: Select each streamed row independently with probability ``frac``.
+BERNOULLI_ROW_SAMPLING = "bernoulli"
+
+#: The number of threads used to normalize covariate data. Normalization is
+#: split across threads only for data with more than
+#: :data:`NORMALIZATION_CHUNK_SIZE` values per thread.
+NORMALIZATION_N_THREADS = 1
+
+#: The approximate number of values normalized at once. Chunks of this size
+#: stay in the CPU cache while all of the normalization steps are applied.
+NORMALIZATION_CHUNK_SIZE = 2**16
+
+
+class CovariateNormalization():
+    """The column-wise affine transform used to normalize covariate data. Continuous covariates are mapped from the range [`X_min`, `X_max`] to [-1, 1] and discrete covariates are left as is. The transform is applied in place, to a float array, in chunks of rows which are small enough to stay in the CPU cache, so that each value is read from and written to memory once. Chunks can be processed by multiple threads.
+
+    The transform is stored so that it can be reused to normalize other data, like rows read later from the same source, or inverted to recover the original covariate values.
+
+    Args:
+        X_min (:class:`numpy.ndarray`): The minimum of each covariate.
+        X_max (:class:`numpy.ndarray`): The maximum of each covariate.
+        continuous_filter (:class:`numpy.ndarray`): A boolean array which indicates which covariates are continuous.
+
+    Attributes:
+        X_min
+        X_max
+        continuous_filter
+    """
+
+    def __init__(self, X_min, X_max, continuous_filter):
+        self.X_min = np.asarray(X_min, dtype=np.float64)
+        self.X_max = np.asarray(X_max, dtype=np.float64)
+        self.continuous_filter = np.asarray(continuous_filter, dtype=bool)
+
+        # The transform is applied as ((X - shift)/range)*scale - offset. This
+        # is the order of operations of the original pandas normalization, so
+        # the normalized values are identical to those it produced. Discrete
+        # covariates are shifted by 0 and scaled by 1.
+        self._column_shifts = np.where(self.continuous_filter, self.X_min, 0.)
+        self._column_ranges = np.where(self.continuous_filter, self.X_max - self.X_min, 1.)
+        self._column_scales = np.where(self.continuous_filter, 2., 1.)
+        self._column_offsets = np.where(self.continuous_filter, 1., 0.)
+
+    @classmethod
+    def fit(cls, covar_data, continuous_filter):
+        """Build the normalization of the covariate data in `covar_data`. Missing values are ignored when finding the range of each covariate.
+
+        Args:
+            covar_data (:class:`numpy.ndarray`): A 2D array of covariate data.
+            continuous_filter (:class:`numpy.ndarray`): See :class:`CovariateNormalization`.
+
+        Returns:
+            :class:`CovariateNormalization`: The normalization.
+        """
+        return cls(
+            np.fmin.reduce(covar_data, axis=0),
+            np.fmax.reduce(covar_data, axis=0),
+            continuous_filter)
+
+    def _apply_to_chunks(self, covar_data, transform_chunk, n_threads):
+        # Apply transform_chunk to chunks of contiguous values. Column-major
+        # data is processed through its transpose, which is row-major.
+        column_params = (self._column_shifts, self._column_ranges,
+            self._column_scales, self._column_offsets)
+        if covar_data.flags.f_contiguous and not covar_data.flags.c_contiguous:
+            covar_data = covar_data.T
+            column_params = tuple(param[:, None] for param in column_params)
+
+        if covar_data.size == 0:
+            return
+
+        chunk_rows = max(1, NORMALIZATION_CHUNK_SIZE // max(1, covar_data.shape[1]))
+        chunk_starts = range(0, len(covar_data), chunk_rows)
+
+        def transform(start):
+            params = column_params
+            if params[0].ndim == 2:
+                params = tuple(param[start:start+chunk_rows] for param in params)
+            transform_chunk(covar_data[start:start+chunk_rows], *params)
+
+        n_threads = min(n_threads, covar_data.size // NORMALIZATION_CHUNK_SIZE)
+        if n_threads > 1:
+            # NumPy releases the GIL in its arithmetic loops, so the chunks
+            # are processed in parallel.
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                for _ in executor.map(transform, chunk_starts):
+                    pass
+        else:
+            for start in chunk_starts:
+                transform(start)
+
+    def apply(self, covar_data, n_threads=None):
+        """Normalize the covariate data in `covar_data` in place.
+
+        Args:
+            covar_data (:class:`numpy.ndarray`): A writeable 2D float array of covariate data with one column per covariate.
+            n_threads (int): The number of threads used. Defaults to None, in which case :data:`NORMALIZATION_N_THREADS` is used.
+
+        Returns:
+            :class:`numpy.ndarray`: `covar_data`.
+        """
+        def normalize_chunk(chunk, shifts, ranges, scales, offsets):
+            chunk -= shifts
+            chunk /= ranges
+            chunk *= scales
+            chunk -= offsets
+
+        if n_threads is None:
+            n_threads = NORMALIZATION_N_THREADS
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self._apply_to_chunks(covar_data, normalize_chunk, n_threads)
+        return covar_data
+
+    def invert(self, covar_data, n_threads=None):
+        """Recover the original covariate data from the normalized covariate data in `covar_data`, in place.
+
+        Args:
+            covar_data (:class:`numpy.ndarray`): A writeable 2D float array of normalized covariate data.
+            n_threads (int): See :meth:`apply`.
+
+        Returns:
+            :class:`numpy.ndarray`: `covar_data`.
+        """
+        def denormalize_chunk(chunk, shifts, ranges, scales, offsets):
+            chunk += offsets
+            chunk /= scales
+            chunk *= ranges
+            chunk += shifts
+
+        if n_threads is None:
+            n_threads = NORMALIZATION_N_THREADS
+
+        self._apply_to_chunks(covar_data, denormalize_chunk, n_threads)
+        return covar_data
 
 
 class DataSource():
     """An abstract class that defines the encapsulation logic used to store, process and access covariate data and meta-data. The external API provides clean access to the data required for the sampling and application of treatment/outcome functions. Concrete implementations are responsible for the different loading/sampling and normalization schemes required to handle different static/stochastic covariate data.
 
     * The primary (abstract) method is :meth:`_generate_covar_df` which returns an unnormalized :class:`DataFrame <pandas.DataFrame>` that contains the covariate observations and covariate names.
-    * The concrete method :meth:`_normalize_covariate_data` provides a default normalization scheme for the data in the covariate :class:`DataFrame <pandas.DataFrame>`.
+    * The concrete method :meth:`_normalize_covariate_data` provides a default normalization scheme for the data in the covariate :class:`DataFrame <pandas.DataFrame>`. The scheme is stored as a :class:`CovariateNormalization`, which can be inverted using :meth:`invert_normalization`.
     * The methods :meth:`get_covar_df`, :meth:`get_covar_names` , and :meth:`get_discrete_covar_names` provide the external API which is used to access the covariate data/meta-data during DGP and data sampling.
+    * The discrete covariates named in :attr:`discrete_covar_names` are returned in the smallest integer dtype which represents them exactly (see :func:`~maccabee.data_sources.utils.compact_discrete_covariates`), rather than as floats. They are only converted to floats where a calculation requires it.
 
     Args:
         covar_names (list): `covar_names` is a list of the string names of the covariates present in the :class:`DataFrame <pandas.DataFrame>` produced by :meth:`_generate_covar_df`.
@@ -22,12 +171,17 @@ class DataSource():
         covar_names: a list of the string names of the covariates present in the covariate :class:`DataFrame <pandas.DataFrame>` produced by `_generate_covar_df`.
         discrete_covar_names: list of the string names of the discrete covariates present in the covariate :class:`DataFrame <pandas.DataFrame>` produced by :meth:`_generate_covar_df`.
         normalize: indicates whether the covariate :class:`DataFrame <pandas.DataFrame>` returned by :meth:`_generate_covar_df` will be normalized prior to use.
+        normalization: the :class:`CovariateNormalization` most recently applied to the covariate data, or None if the data has not been normalized.
+        out_of_core: a class attribute which indicates whether the full covariate data is too large to load. The DGP samplers draw the observed covariates of out-of-core data sources using :meth:`sample_covar_df` rather than loading the full data with :meth:`get_covar_df`. Out-of-core data sources also provide ``get_covar_rows`` and ``iter_covar_blocks`` methods, which the serialization of DGPs uses to read selected rows and to fingerprint the data without loading it.
     """
 
+    out_of_core = False
+
     def __init__(self, covar_names, discrete_covar_names, normalize=True):
         self.covar_names = covar_names
         self.discrete_covar_names = discrete_covar_names
         self.normalize = normalize
+        self.normalization = None
 
     def _generate_covar_df(self):
         """Abstract method which, when implemented, returns a :class:`DataFrame <pandas.DataFrame>` that contains the covariate observations and covariate names as the column names. This may involve sampling a joint distribution over the covariates, reading a static set of covariates from disk/memory etc.
@@ -49,34 +203,44 @@ class DataSource():
         Returns:
             :class:`DataFrame <pandas.DataFrame>`: a :class:`DataFrame <pandas.DataFrame>` which contains the normalized covariate observations.
         """
+        # The data is copied into a single float array once and all of the
+        # normalization steps are applied to this array in place.
+        covar_data = covar_df.to_numpy(dtype=np.float64, copy=True)
 
-        discrete_column_indeces = [
-            covar_df.columns.get_loc(name)
-            for name in self.discrete_covar_names
-        ]
+        self.normalization = CovariateNormalization.fit(
+            covar_data, self._get_continuous_filter(list(covar_df.columns)))
+        self.normalization.apply(covar_data)
 
-        included_filter = np.ones(covar_df.shape[1])
-        included_filter[discrete_column_indeces] = 0
-        excluded_filter = 1 - included_filter
+        return pd.DataFrame(covar_data,
+            index=covar_df.index, columns=covar_df.columns, copy=False)
 
-        X_min = np.min(covar_df, axis=0)
-        X_max = np.max(covar_df, axis=0)
+    def _get_continuous_filter(self, covar_names):
+        continuous_filter = np.ones(len(covar_names), dtype=bool)
+        continuous_filter[[
+            covar_names.index(name)
+            for name in self.discrete_covar_names
+        ]] = False
+        return continuous_filter
 
-        # Amount to shift columns. Excluded cols shift 0.
-        column_shifts = (-1*X_min) * included_filter
+    def invert_normalization(self, covar_df):
+        """Recover the original covariate observations from normalized covariate observations using the :attr:`normalization` of this data source.
 
-        # Amount to scale columns. Excluded cols scale by 1.
-        inverse_column_scales = ((X_max - X_min) * included_filter) + excluded_filter
+        Args:
+            covar_df (:class:`DataFrame <pandas.DataFrame>`): A :class:`DataFrame <pandas.DataFrame>` of normalized covariate observations, like one returned by :meth:`get_covar_df`.
 
-        # Shift and scale to [0, 1]
-        normalized_data = (covar_df + column_shifts)/inverse_column_scales
+        Returns:
+            :class:`DataFrame <pandas.DataFrame>`: a :class:`DataFrame <pandas.DataFrame>` which contains the unnormalized covariate observations.
 
-        # Shift and scale to [-1, 1]
-        rescaled_data = (normalized_data * \
-            ((2*included_filter) + excluded_filter)) - \
-            (1*included_filter)
+        Raises:
+            ValueError: If the data of this data source has not been normalized.
+        """
+        if self.normalization is None:
+            raise ValueError("The data of this data source has not been normalized.")
 
-        return rescaled_data
+        covar_data = covar_df.to_numpy(dtype=np.float64, copy=True)
+        self.normalization.invert(covar_data)
+        return pd.DataFrame(covar_data,
+            index=covar_df.index, columns=covar_df.columns, copy=False)
 
     def get_covar_names(self):
         """Accessor method for :attr:`covar_names`.
@@ -116,7 +280,26 @@ class DataSource():
         if self.normalize:
             covar_df = self._normalize_covariate_data(covar_df)
 
-        return covar_df
+        return compact_discrete_covariates(covar_df, self.discrete_covar_names)
+
+    def sample_covar_df(self, frac):
+        """Sample a fraction of the rows of the normalized covariate data, without replacement. The rows are drawn from the global NumPy random state.
+
+        Args:
+            frac (float): The fraction of the rows to sample.
+
+        Returns:
+            :class:`DataFrame <pandas.DataFrame>`: The :class:`DataFrame <pandas.DataFrame>` containing the sampled covariate observations, indexed by their row labels in the full covariate data.
+        """
+        return self.get_covar_df().sample(frac=frac)
+
+    def get_n_observations(self):
+        """Returns the number of covariate observations (rows) in the covariate data.
+
+        Returns:
+            int: The number of observations.
+        """
+        return len(self.get_covar_df())
 
 
 class StochasticDataSource(DataSource):
@@ -169,13 +352,18 @@ class StaticDataSource(DataSource):
 
         super().__init__(covar_names, discrete_covar_names, normalize=False)
 
-        covar_df = build_covar_data_frame(static_covar_data, covar_names)
+        # The data frame is built without copying so that memory-mapped
+        # covariate data stays on disk until it is used.
+        covar_df = build_covar_data_frame(static_covar_data, covar_names, copy=False)
         self.static_covar_df = covar_df
 
         if normalize:
             self.static_covar_df = self._normalize_covariate_data(
                 self.static_covar_df)
 
+        self.static_covar_df = compact_discrete_covariates(
+            self.static_covar_df, discrete_covar_names)
+
     def _generate_covar_df(self):
         """Concretized implementation of :meth:`DataSource._generate_covar_df` which returns a :class:`DataFrame <pandas.DataFrame>` containing the data supplied in `static_covar_data` at initialization time.
 
@@ -183,3 +371,422 @@ class StaticDataSource(DataSource):
             :class:`DataFrame <pandas.DataFrame>`: a :class:`DataFrame <pandas.DataFrame>` containing static covariate observations.
         """
         return self.static_covar_df
+
+
+class RandomNormalDataSource(DataSource):
+    """A concrete implementation of the abstract :class:`DataSource` which samples multivariate normal covariates with a random covariance matrix. Each call to :meth:`get_covar_df` samples new observations.
+
+    The observations are generated by multiplying standard normal draws by the Cholesky factor of the covariance matrix. If `fixed_covariance` is ``True``, the covariance matrix is sampled once and its factor is cached so that each call only draws and transforms the observations. Otherwise, a new covariance matrix is sampled for every call, as in earlier versions of this data source. The observations are generated into a single float array and normalized in place without building intermediate pandas objects.
+
+    Args:
+        n_covars (int): The number of covariates.
+
+        n_observations (int): The number of observations sampled by each call.
+
+        partial_correlation_degree (float): The degree of partial correlation between the covariates. See :func:`~maccabee.data_sources.data_source_builders.build_random_normal_datasource`. Defaults to 0.0.
+
+        fixed_covariance (bool): Indicates whether the covariance matrix is sampled once and reused. Defaults to ``False``.
+
+        normalize (bool): see :class:`DataSource`.
+
+    """
+
+    def __init__(self, n_covars, n_observations,
+        partial_correlation_degree=0.0, fixed_covariance=False,
+        normalize=True):
+
+        super().__init__(
+            covar_names=[f"X{i}" for i in range(n_covars)],
+            discrete_covar_names=[],
+            normalize=normalize)
+
+        self.n_covars = n_covars
+        self.n_observations = n_observations
+        self.partial_correlation_degree = partial_correlation_degree
+        self.fixed_covariance = fixed_covariance
+        self._covariance_factor = None
+
+    def _sample_covariance_factor(self):
+        covar = random_covar_matrix(
+            dimension=self.n_covars,
+            correlation_deg=self.partial_correlation_degree)
+
+        try:
+            return np.linalg.cholesky(covar)
+        except np.linalg.LinAlgError:
+            # Nearly singular matrices are factored using their
+            # eigendecomposition, clipping round-off negative eigenvalues.
+            eigenvalues, eigenvectors = np.linalg.eigh(covar)
+            return eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+    def _get_covariance_factor(self):
+        if not self.fixed_covariance:
+            return self._sample_covariance_factor()
+
+        if self._covariance_factor is None:
+            self._covariance_factor = self._sample_covariance_factor()
+        return self._covariance_factor
+
+    def _generate_covar_data(self):
+        # Transform standard normal draws into correlated draws. Rows of
+        # the result are z @ L.T for the factor L.
+        covariance_factor = self._get_covariance_factor()
+        standard_normal_data = np.random.standard_normal(
+            size=(self.n_observations, self.n_covars))
+        return standard_normal_data @ covariance_factor.T
+
+    def _generate_covar_df(self):
+        """Concretized implementation of :meth:`DataSource._generate_covar_df` which returns a :class:`DataFrame <pandas.DataFrame>` of newly sampled, unnormalized, covariate observations.
+
+        Returns:
+            :class:`DataFrame <pandas.DataFrame>`: a :class:`DataFrame <pandas.DataFrame>` containing sampled covariate observations.
+        """
+        return build_covar_data_frame(
+            self._generate_covar_data(), self.covar_names, copy=False)
+
+    def get_covar_df(self):
+        """Concretized implementation of :meth:`DataSource.get_covar_df` which samples new observations and normalizes them in place. All of the covariates are continuous, so each one is mapped to [-1, 1] as in :meth:`DataSource._normalize_covariate_data`.
+
+        Returns:
+            :class:`DataFrame <pandas.DataFrame>`: The :class:`DataFrame <pandas.DataFrame>` containing normalized covariate observations and covariate names.
+        """
+        covar_data = self._generate_covar_data()
+
+        if self.normalize:
+            self.normalization = CovariateNormalization.fit(
+                covar_data, np.ones(self.n_covars, dtype=bool))
+            self.normalization.apply(covar_data)
+
+        return build_covar_data_frame(covar_data, self.covar_names, copy=False)
+
+    def get_n_observations(self):
+        """Returns the number of observations sampled by each call to :meth:`get_covar_df`.
+
+        Returns:
+            int: The number of observations.
+        """
+        return self.n_observations
+
+
+class MemoryMappedDataSource(DataSource):
+    """A concrete implementation of the abstract :class:`DataSource` for static covariate data which is too large to hold in memory. The covariate data is a 2D array which is memory-mapped from a ``.npy`` file and read in chunks of rows, so only the rows which are used are loaded.
+
+    The normalization applied by :meth:`DataSource._normalize_covariate_data` is calculated in a single streaming pass over the rows at initialization time and is stored in :attr:`~DataSource.normalization`. It is applied to rows as they are read. The observed covariates of sampled DGPs are drawn using :meth:`sample_covar_df`, which samples a set of row indices and reads only those rows. The DGP samplers use this method instead of loading the full covariate data.
+
+    .. warning::
+        :meth:`get_covar_df` loads the full covariate data into memory. It is not used by the DGP samplers or the serialization of DGPs, which read the observed rows using ``get_covar_rows`` and fingerprint the data using :meth:`iter_covar_blocks`.
+
+    Args:
+        covar_data (string or :class:`numpy.ndarray`): The path to a ``.npy`` file containing a 2D array of covariate data, or the (memory-mapped) array itself.
+
+        covar_names (list): see :class:`DataSource`.
+
+        discrete_covar_names (list): see :class:`DataSource`.
+
+        normalize (bool): see :class:`DataSource`.
+
+        chunk_size (int): The number of rows read at once. Defaults to :data:`MEMORY_MAPPED_CHUNK_SIZE`.
+
+    """
+
+    out_of_core = True
+
+    def __init__(self, covar_data,
+        covar_names, discrete_covar_names,
+        normalize=True, chunk_size=MEMORY_MAPPED_CHUNK_SIZE):
+
+        super().__init__(covar_names, discrete_covar_names, normalize)
+
+        if isinstance(covar_data, str):
+            covar_data = np.load(covar_data, mmap_mode="r")
+
+        self._covar_data = covar_data
+        self.chunk_size = chunk_size
+
+        if normalize:
+            self._fit_normalization()
+
+    def _iter_chunks(self):
+        for start in range(0, len(self._covar_data), self.chunk_size):
+            yield np.asarray(self._covar_data[start:start+self.chunk_size], dtype=np.float64)
+
+    def _fit_normalization(self):
+        # Find the range of each covariate in one pass over the rows. The
+        # continuous covariates are mapped from this range to [-1, 1], as
+        # in DataSource._normalize_covariate_data.
+        X_min = np.full(len(self.covar_names), np.inf)
+        X_max = np.full(len(self.covar_names), -np.inf)
+        for chunk in self._iter_chunks():
+            np.fmin(X_min, np.fmin.reduce(chunk, axis=0), out=X_min)
+            np.fmax(X_max, np.fmax.reduce(chunk, axis=0), out=X_max)
+
+        self.normalization = CovariateNormalization(
+            X_min, X_max, self._get_continuous_filter(self.covar_names))
+
+    def get_covar_rows(self, row_indices):
+        """Read and normalize the covariate observations in the given rows. The rows are read in chunks, in storage order.
+
+        Args:
+            row_indices (:class:`numpy.ndarray`): The (integer) positions of the rows.
+
+        Returns:
+            :class:`DataFrame <pandas.DataFrame>`: a :class:`DataFrame <pandas.DataFrame>` containing the covariate observations, indexed by `row_indices`.
+        """
+        row_indices = np.asarray(row_indices, dtype=np.int64)
+        storage_order = np.argsort(row_indices, kind="stable")
+
+        covar_data = np.empty((len(row_indices), len(self.covar_names)))
+        for start in range(0, len(row_indices), self.chunk_size):
+            chunk_positions = storage_order[start:start+self.chunk_size]
+            covar_data[chunk_positions] = self._covar_data[row_indices[chunk_positions]]
+
+        if self.normalize:
+            self.normalization.apply(covar_data)
+
+        covar_df = build_covar_data_frame(covar_data, self.covar_names, copy=False)
+        covar_df.index = row_indices
+        return compact_discrete_covariates(covar_df, self.discrete_covar_names)
+
+    def iter_covar_blocks(self):
+        """Iterate over the normalized covariate data in blocks of rows, in storage order. Only one block is held in memory at a time.
+
+        Yields:
+            :class:`numpy.ndarray`: The next block of at most `chunk_size` rows of normalized covariate data, as a ``float64`` array.
+        """
+        for chunk in self._iter_chunks():
+            if self.normalize:
+                chunk = np.array(chunk, dtype=np.float64)
+                self.normalization.apply(chunk)
+            yield chunk
+
+    def sample_row_indices(self, frac):
+        """Sample a fraction of the row indices, without replacement, from the global NumPy random state.
+
+        Args:
+            frac (float): The fraction of the rows to sample.
+
+        Returns:
+            :class:`numpy.ndarray`: The sorted row indices.
+        """
+        n_observations = self.get_n_observations()
+        n_sampled = int(round(frac*n_observations))
+
+        if 2*n_sampled > n_observations:
+            return np.sort(np.random.choice(
+                n_observations, size=n_sampled, replace=False))
+
+        # Small fractions are sampled by drawing indices with replacement
+        # and discarding duplicates, which avoids permuting all of the rows.
+        row_indices = np.empty(0, dtype=np.int64)
+        while len(row_indices) < n_sampled:
+            row_indices = np.union1d(row_indices, np.random.randint(
+                n_observations, size=n_sampled - len(row_indices)))
+
+        return row_indices
+
+    def sample_covar_df(self, frac):
+        """Concretized implementation of :meth:`DataSource.sample_covar_df` which reads only the sampled rows. See :meth:`sample_row_indices` and :meth:`get_covar_rows`.
+
+        Args:
+            frac (float): The fraction of the rows to sample.
+
+        Returns:
+            :class:`DataFrame <pandas.DataFrame>`: a :class:`DataFrame <pandas.DataFrame>` containing the sampled covariate observations.
+        """
+        return self.get_covar_rows(self.sample_row_indices(frac))
+
+    def get_n_observations(self):
+        """Returns the number of rows in the memory-mapped covariate data.
+
+        Returns:
+            int: The number of observations.
+        """
+        return len(self._covar_data)
+
+    def get_covar_df(self):
+        """Load the full normalized covariate data. See the warning in the class docs.
+
+        Returns:
+            :class:`DataFrame <pandas.DataFrame>`: a :class:`DataFrame <pandas.DataFrame>` containing all of the covariate observations.
+        """
+        return self.get_covar_rows(np.arange(self.get_n_observations()))
+
+
+class StreamingDataSource(DataSource):
+    """A concrete implementation of the abstract :class:`DataSource` for static covariate data which is read as a stream of blocks of rows, like a CSV read in blocks, a sequence of ``.npy`` shards or a generator. The full covariate data is never held in memory.
+
+    The data source makes one pass over the stream at initialization time to count the rows and to fit the normalization of :meth:`DataSource._normalize_covariate_data`. The observed covariates of sampled DGPs are drawn using :meth:`sample_covar_df`, which selects rows in a single pass over the stream, keeping only the selected rows and one block in memory. The rows are selected using one of two schemes:
+
+    * :data:`RESERVOIR_ROW_SAMPLING` selects exactly the number of rows selected by :meth:`pandas.DataFrame.sample`, uniformly without replacement. The number of rows selected from each block is drawn from the hypergeometric distribution given the number of rows remaining in the stream.
+    * :data:`BERNOULLI_ROW_SAMPLING` selects each row independently with probability `frac`, so the number of selected rows varies.
+
+    .. warning::
+        :meth:`get_covar_df` loads the full covariate data into memory. It is not used by the DGP samplers or the serialization of DGPs, which read the observed rows using ``get_covar_rows`` and fingerprint the data using :meth:`iter_covar_blocks`.
+
+    Args:
+        chunk_reader (function): A function which takes no arguments and returns an iterable over the blocks of the covariate data, in the same order on every call. Each block is a 2D array of rows, with one column per covariate. The function is called once per pass over the data.
+
+        covar_names (list): see :class:`DataSource`.
+
+        discrete_covar_names (list): see :class:`DataSource`.
+
+        normalize (bool): see :class:`DataSource`.
+
+        sampling_method (str): The row sampling scheme, either :data:`RESERVOIR_ROW_SAMPLING` or :data:`BERNOULLI_ROW_SAMPLING`. Defaults to :data:`RESERVOIR_ROW_SAMPLING`.
+
+        chunk_size (int): The maximum number of rows processed at once. Larger blocks produced by `chunk_reader` are split. Defaults to :data:`STREAMING_CHUNK_SIZE`.
+
+    Attributes:
+        n_observations: The number of rows in the covariate data.
+    """
+
+    out_of_core = True
+
+    def __init__(self, chunk_reader,
+        covar_names, discrete_covar_names,
+        normalize=True, sampling_method=RESERVOIR_ROW_SAMPLING,
+        chunk_size=STREAMING_CHUNK_SIZE):
+
+        super().__init__(covar_names, discrete_covar_names, normalize)
+
+        if sampling_method not in (RESERVOIR_ROW_SAMPLING, BERNOULLI_ROW_SAMPLING):
+            raise ValueError(f"Unknown row sampling method {sampling_method}.")
+
+        self._chunk_reader = chunk_reader
+        self.sampling_method = sampling_method
+        self.chunk_size = chunk_size
+
+        self._scan()
+
+    def _iter_chunks(self):
+        for block in self._chunk_reader():
+            block = np.asarray(block, dtype=np.float64)
+            if block.ndim != 2 or block.shape[1] != len(self.covar_names):
+                raise ValueError(
+                    f"Expected blocks with {len(self.covar_names)} columns, got shape {block.shape}.")
+
+            for start in range(0, len(block), self.chunk_size):
+                yield block[start:start+self.chunk_size]
+
+    def _scan(self):
+        # Count the rows and find the range of each covariate in one pass
+        # over the stream.
+        X_min = np.full(len(self.covar_names), np.inf)
+        X_max = np.full(len(self.covar_names), -np.inf)
+        n_observations = 0
+        for chunk in self._iter_chunks():
+            n_observations += len(chunk)
+            if self.normalize and len(chunk) > 0:
+                np.fmin(X_min, np.fmin.reduce(chunk, axis=0), out=X_min)
+                np.fmax(X_max, np.fmax.reduce(chunk, axis=0), out=X_max)
+
+        self.n_observations = n_observations
+        if self.normalize:
+            self.normalization = CovariateNormalization(
+                X_min, X_max, self._get_continuous_filter(self.covar_names))
+
+    def _sample_chunk_rows(self, chunk_length, n_remaining_rows, n_remaining_samples, frac):
+        # The positions of the rows selected from the next chunk.
+        if self.sampling_method == BERNOULLI_ROW_SAMPLING:
+            return np.flatnonzero(np.random.random(chunk_length) < frac)
+
+        if chunk_length > n_remaining_rows:
+            raise ValueError("The streamed covariate data has more rows than when the data source was built.")
+
+        n_chunk_samples = np.random.hypergeometric(
+            chunk_length, n_remaining_rows - chunk_length, n_remaining_samples) \
+            if n_remaining_samples > 0 else 0
+        return np.sort(np.random.choice(chunk_length, size=n_chunk_samples, replace=False))
+
+    def _read_rows(self, select_chunk_rows):
+        # Read the rows selected from each chunk by select_chunk_rows, which
+        # takes the chunk position and length and returns row positions.
+        row_indices, row_blocks = [], []
+        chunk_start = 0
+        for chunk in self._iter_chunks():
+            selected_rows = select_chunk_rows(chunk_start, len(chunk))
+            row_indices.append(chunk_start + selected_rows)
+            row_blocks.append(chunk[selected_rows])
+            chunk_start += len(chunk)
+
+        if row_blocks:
+            covar_data = np.concatenate(row_blocks)
+            row_indices = np.concatenate(row_indices)
+        else:
+            covar_data = np.empty((0, len(self.covar_names)))
+            row_indices = np.empty(0, dtype=np.int64)
+
+        if self.normalize:
+            self.normalization.apply(covar_data)
+
+        covar_df = build_covar_data_frame(covar_data, self.covar_names, copy=False)
+        covar_df.index = row_indices
+        return compact_discrete_covariates(covar_df, self.discrete_covar_names)
+
+    def iter_covar_blocks(self):
+        """Iterate over the normalized covariate data in blocks of rows, in storage order, in a single pass over the stream. Only one block is held in memory at a time.
+
+        Yields:
+            :class:`numpy.ndarray`: The next block of at most `chunk_size` rows of normalized covariate data, as a ``float64`` array.
+        """
+        for chunk in self._iter_chunks():
+            if self.normalize:
+                chunk = np.array(chunk, dtype=np.float64)
+                self.normalization.apply(chunk)
+            yield chunk
+
+    def get_covar_rows(self, row_indices):
+        """Read and normalize the covariate observations in the given rows, in a single pass over the stream.
+
+        Args:
+            row_indices (:class:`numpy.ndarray`): The (integer) positions of the rows.
+
+        Returns:
+            :class:`DataFrame <pandas.DataFrame>`: a :class:`DataFrame <pandas.DataFrame>` containing the covariate observations, in the order of `row_indices` and indexed by `row_indices`.
+        """
+        row_indices = np.asarray(row_indices, dtype=np.int64)
+        selected_rows = np.unique(row_indices)
+
+        def select_chunk_rows(chunk_start, chunk_length):
+            first, last = np.searchsorted(
+                selected_rows, [chunk_start, chunk_start + chunk_length])
+            return selected_rows[first:last] - chunk_start
+
+        return self._read_rows(select_chunk_rows).loc[row_indices]
+
+    def sample_covar_df(self, frac):
+        """Concretized implementation of :meth:`DataSource.sample_covar_df` which selects rows in a single pass over the stream using the `sampling_method` of the data source. The rows are drawn from the global NumPy random state.
+
+        Args:
+            frac (float): The fraction of the rows to sample.
+
+        Returns:
+            :class:`DataFrame <pandas.DataFrame>`: a :class:`DataFrame <pandas.DataFrame>` containing the sampled covariate observations in storage order, indexed by their row positions.
+        """
+        n_remaining_samples = int(round(frac*self.n_observations))
+
+        def select_chunk_rows(chunk_start, chunk_length):
+            nonlocal n_remaining_samples
+            selected_rows = self._sample_chunk_rows(chunk_length,
+                self.n_observations - chunk_start, n_remaining_samples, frac)
+            n_remaining_samples -= len(selected_rows)
+            return selected_rows
+
+        return self._read_rows(select_chunk_rows)
+
+    def get_n_observations(self):
+        """Returns the number of rows in the covariate data, counted at initialization time.
+
+        Returns:
+            int: The number of observations.
+        """
+        return self.n_observations
+
+    def get_covar_df(self):
+        """Load the full normalized covariate data. See the warning in the class docs.
+
+        Returns:
+            :class:`DataFrame <pandas.DataFrame>`: a :class:`DataFrame <pandas.DataFrame>` containing all of the covariate observations.
+        """
+        return self._read_rows(
+            lambda chunk_start, chunk_length: np.arange(chunk_length))
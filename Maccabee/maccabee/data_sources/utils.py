@@ -1,6 +1,18 @@
+import hashlib
+import json
+import os
+import uuid
+
 import numpy as np
 import pandas as pd
 
+#: The version of the format of the binary CSV caches.
+CSV_CACHE_FORMAT_VERSION = 1
+
+# The suffixes of the binary CSV cache files.
+_CSV_CACHE_DATA_SUFFIX = ".maccabee-cache.npy"
+_CSV_CACHE_METADATA_SUFFIX = ".maccabee-cache.json"
+
 
 def random_covar_matrix(dimension, correlation_deg = 0.5):
     """
@@ -29,7 +41,199 @@ def load_covars_from_csv_path(covar_path):
     covar_names = list(covar_data.dtype.names)
     return covar_names, covar_data
 
-def build_covar_data_frame(data, covar_names):
+def build_covar_data_frame(data, covar_names, copy=None):
     return pd.DataFrame(
             data=data,
-            columns=covar_names)
+            columns=covar_names,
+            copy=copy)
+
+def get_compact_discrete_dtype(values):
+    """Find the smallest signed integer dtype which can represent all of the values in `values` exactly.
+
+    Args:
+        values (:class:`numpy.ndarray`): The values of a discrete covariate.
+
+    Returns:
+        :class:`numpy.dtype`: The integer dtype, or None if some of the values are not finite integers or are too large to store compactly.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == "b":
+        return values.dtype
+    if values.dtype.kind not in "iuf":
+        return None
+    if values.dtype.kind == "f" and not np.all(np.isfinite(values)):
+        return None
+    if values.size == 0:
+        return np.dtype(np.int8)
+
+    min_value, max_value = values.min(), values.max()
+    for dtype in (np.int8, np.int16, np.int32):
+        dtype_info = np.iinfo(dtype)
+        if dtype_info.min <= min_value and max_value <= dtype_info.max:
+            if values.dtype.kind == "f" and not np.array_equal(values, values.astype(dtype)):
+                return None
+            return np.dtype(dtype)
+
+    return None
+
+def compact_discrete_covariates(covar_df, discrete_covar_names):
+    """Store the discrete covariates in `covar_df` in the smallest integer dtype which represents them exactly. See :func:`get_compact_discrete_dtype`. Discrete covariates with non-integer or missing values and all continuous covariates are left as is, without copying.
+
+    Args:
+        covar_df (:class:`DataFrame <pandas.DataFrame>`): The covariate data.
+        discrete_covar_names (list): The names of the discrete covariates.
+
+    Returns:
+        :class:`DataFrame <pandas.DataFrame>`: The covariate data with compact discrete covariates. This is `covar_df` if none of its covariates are converted.
+    """
+    compact_dtypes = {}
+    for covar_name in discrete_covar_names:
+        if covar_name not in covar_df.columns or covar_df[covar_name].dtype.itemsize == 1:
+            continue
+
+        compact_dtype = get_compact_discrete_dtype(covar_df[covar_name].to_numpy())
+        if compact_dtype is not None and compact_dtype != covar_df[covar_name].dtype:
+            compact_dtypes[covar_name] = compact_dtype
+
+    if not compact_dtypes:
+        return covar_df
+    return covar_df.astype(compact_dtypes)
+
+def _get_user_cache_dir():
+    # The per-user cache directory, following the XDG convention.
+    return os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+        "maccabee")
+
+def _get_csv_cache_base_paths(csv_path, cache_dir=None):
+    # The candidate locations of the cache of a CSV, in order of
+    # preference. The cache is a sidecar of the CSV if its directory is
+    # writable and is otherwise stored in the user cache directory.
+    csv_path = os.path.abspath(csv_path)
+    csv_dir, csv_name = os.path.split(csv_path)
+    path_digest = hashlib.sha1(csv_path.encode()).hexdigest()[:16]
+
+    if cache_dir is not None:
+        return [os.path.join(cache_dir, f"{csv_name}.{path_digest}")]
+
+    return [
+        os.path.join(csv_dir, f".{csv_name}"),
+        os.path.join(_get_user_cache_dir(), f"{csv_name}.{path_digest}")
+    ]
+
+def _get_file_sha256(path):
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as data_file:
+        for block in iter(lambda: data_file.read(2**20), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def _get_csv_file_record(csv_path, sha256=None):
+    csv_stat = os.stat(csv_path)
+    return {
+        "size": csv_stat.st_size,
+        "mtime_ns": csv_stat.st_mtime_ns,
+        "sha256": sha256 if sha256 is not None else _get_file_sha256(csv_path)
+    }
+
+def _write_file_atomically(path, write):
+    # Write to a temporary path and move the file into place so that
+    # concurrent readers never see a partially written file.
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_path, "wb") as temp_file:
+            write(temp_file)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def load_csv_covar_cache(csv_path, discrete_covar_names, cache_dir=None):
+    """Load the normalized covariate data of the CSV at `csv_path` from its binary cache, written by :func:`~maccabee.data_sources.utils.store_csv_covar_cache`. The cache is valid if it was built with the same discrete covariates and the CSV is unchanged. The CSV is unchanged if its size and modification time match those recorded in the cache or, if they don't, if its hash matches the recorded hash.
+
+    Args:
+        csv_path (string): The path to the CSV.
+        discrete_covar_names (list): The names of the discrete covariates, which are not normalized.
+        cache_dir (string): The directory of the cache. Defaults to None, in which case the cache is looked for next to the CSV and then in the user cache directory.
+
+    Returns:
+        tuple: A tuple with the covariate names as the first entry and the normalized covariate data, as a read-only memory-mapped :class:`numpy.ndarray`, as the second entry. None if there is no valid cache.
+    """
+    for base_path in _get_csv_cache_base_paths(csv_path, cache_dir):
+        metadata_path = base_path + _CSV_CACHE_METADATA_SUFFIX
+        try:
+            with open(metadata_path, "r") as metadata_file:
+                metadata = json.load(metadata_file)
+        except (OSError, ValueError):
+            continue
+
+        if metadata.get("version") != CSV_CACHE_FORMAT_VERSION or \
+            metadata["discrete_covar_names"] != list(discrete_covar_names):
+            continue
+
+        csv_record = _get_csv_file_record(csv_path, sha256=metadata["csv"]["sha256"])
+        if csv_record != metadata["csv"]:
+            # The file has been touched or changed. Compare its contents.
+            csv_record["sha256"] = _get_file_sha256(csv_path)
+            if csv_record["sha256"] != metadata["csv"]["sha256"]:
+                continue
+
+            # Record the new modification time so that the contents are
+            # not hashed again.
+            metadata["csv"] = csv_record
+            try:
+                _write_file_atomically(metadata_path,
+                    lambda metadata_file: metadata_file.write(json.dumps(metadata).encode()))
+            except OSError:
+                pass
+
+        try:
+            covar_data = np.load(base_path + _CSV_CACHE_DATA_SUFFIX, mmap_mode="r")
+        except (OSError, ValueError):
+            continue
+
+        if covar_data.shape != tuple(metadata["shape"]):
+            continue
+
+        return metadata["covar_names"], covar_data
+
+    return None
+
+def store_csv_covar_cache(csv_path, covar_df, discrete_covar_names,
+    normalization_constants=None, cache_dir=None):
+    """Write the binary cache of the CSV at `csv_path`. The cache consists of a ``.npy`` file of the normalized covariate data and a JSON metadata file which records the covariate names, the discrete covariate names, the normalization constants and the size, modification time and hash of the CSV. The cache is written next to the CSV if possible and in the user cache directory otherwise.
+
+    Args:
+        csv_path (string): The path to the CSV.
+        covar_df (:class:`DataFrame <pandas.DataFrame>`): The normalized covariate data.
+        discrete_covar_names (list): The names of the discrete covariates.
+        normalization_constants (dict): The constants used to normalize the covariates. Defaults to None.
+        cache_dir (string): The directory of the cache. Defaults to None.
+
+    Returns:
+        string: The base path of the written cache files, or None if the cache could not be written.
+    """
+    metadata = {
+        "version": CSV_CACHE_FORMAT_VERSION,
+        "csv": _get_csv_file_record(csv_path),
+        "covar_names": list(map(str, covar_df.columns)),
+        "discrete_covar_names": list(discrete_covar_names),
+        "normalization": normalization_constants,
+        "shape": list(covar_df.shape)
+    }
+    covar_data = covar_df.to_numpy(dtype=np.float64)
+
+    for base_path in _get_csv_cache_base_paths(csv_path, cache_dir):
+        try:
+            os.makedirs(os.path.dirname(base_path), exist_ok=True)
+            # The data is written first. The metadata completes the cache.
+            _write_file_atomically(base_path + _CSV_CACHE_DATA_SUFFIX,
+                lambda data_file: np.save(data_file, covar_data))
+            _write_file_atomically(base_path + _CSV_CACHE_METADATA_SUFFIX,
+                lambda metadata_file: metadata_file.write(json.dumps(metadata).encode()))
+        except OSError:
+            continue
+
+        return base_path
+
+    return None
@@ -14,12 +14,6 @@ from functools import partial
 
 from sklearn.linear_model import LogisticRegression
 
-# R in python. The imports below augment the CausalModelR
-# functionality by performing data conversion.
-from rpy2.robjects import IntVector, FloatVector
-from rpy2.robjects import numpy2ri
-numpy2ri.activate()
-
 MILD_NONLINEARITY = [1]
 MODERATE_NONLINEARITY = [1, 3, 6]
 MILD_NONADDITIVITY = [(0,2, 0.5), (1, 3, 0.7), (3,4, 0.5), (4,5, 0.5)]
@@ -176,76 +170,88 @@ class GenmatchDataGeneratingProcess(ConcreteDataGeneratingProcess):
     def _generate_treatment_effects(self, input_vars):
         return self.true_treat_effect
 
+# The R functions used by the matching models below. They are evaluated
+# once per R instance by CausalModelR.call_r_function. Each fits a model to
+# a single data set and returns the ATT estimate.
+MATCHING_R_SOURCE = """
+maccabee_propensity_score_match <- function(Y, Tr, X) {
+    match_out <- Matching::Match(
+        Y=Y, Tr=Tr, X=X,
+        estimand="ATT", replace=TRUE, version="fast")
+    as.numeric(match_out$est[1, 1])
+}
+
+maccabee_genetic_match <- function(Y, Tr, X) {
+    gen_out <- Matching::GenMatch(Tr=Tr, X=X, print.level=0)
+    match_out <- Matching::Match(
+        Y=Y, Tr=Tr, X=X, replace=TRUE, Weight.matrix=gen_out,
+        estimand="ATT", version="fast")
+    as.numeric(match_out$est[1, 1])
+}
+"""
+
+def _estimate_propensity_scores(dataset):
+    logistic_model = LogisticRegression(solver='lbfgs', n_jobs=1)
+    logistic_model.fit(
+        dataset.X.to_numpy(), dataset.T.to_numpy())
+    class_proba = logistic_model.predict_proba(
+        dataset.X.to_numpy())
+    return class_proba[:, logistic_model.classes_ == 1].flatten()
+
 class LogisticPropensityMatchingCausalModel(CausalModelR):
+    R_PACKAGES = ["Matching"]
+    R_SOURCE = MATCHING_R_SOURCE
+    R_FUNCTION = "maccabee_propensity_score_match"
+
     def __init__(self, dataset):
         self.dataset = dataset
-        self.matching_lib = self._import_r_package("Matching")
-
-    def fit(self):
-        logistic_model = LogisticRegression(solver='lbfgs', n_jobs=1)
-        logistic_model.fit(
-            self.dataset.X.to_numpy(), self.dataset.T.to_numpy())
-        class_proba = logistic_model.predict_proba(
-            self.dataset.X.to_numpy())
-        propensity_scores = class_proba[:, logistic_model.classes_ == 1].flatten()
 
+    def build_r_function_args(self):
         # Run matching on prop scores
-        self.match_out = self.matching_lib.Match(
-            Y=FloatVector(self.dataset.Y),
-            Tr=IntVector(self.dataset.T),
-            X=FloatVector(propensity_scores),
-            estimand="ATT",
-            replace=True,
-            version="fast")
+        return {
+            "Y": self.dataset.Y.to_numpy(),
+            "Tr": self.dataset.T.to_numpy(),
+            "X": _estimate_propensity_scores(self.dataset)
+        }
 
     def estimate_ITE(self):
         ate = self.estimate_ATE()
         return np.full(len(self.dataset.X), ate)
 
     def estimate_ATT(self):
-        return np.array(self.match_out.rx2("est").rx(1,1))[0]
+        return self.r_estimate
 
     def estimate_ATE(self):
-        return np.array(self.match_out.rx2("est").rx(1,1))[0]
+        return self.r_estimate
 
 class GeneticMatchingCausalModel(CausalModelR):
+    R_PACKAGES = ["Matching"]
+    R_SOURCE = MATCHING_R_SOURCE
+    R_FUNCTION = "maccabee_genetic_match"
+
     def __init__(self, dataset):
         self.dataset = dataset
-        self.matching_lib = self._import_r_package("Matching")
 
-    def fit(self):
-        logistic_model = LogisticRegression(solver='lbfgs', n_jobs=1)
-        logistic_model.fit(
-            self.dataset.X.to_numpy(), self.dataset.T.to_numpy())
-        class_proba = logistic_model.predict_proba(
-            self.dataset.X.to_numpy())
-        propensity_scores = class_proba[:, logistic_model.classes_ == 1].flatten()
+    def build_r_function_args(self):
+        propensity_scores = _estimate_propensity_scores(self.dataset)
 
         matching_data = np.hstack([
             self.dataset.X.to_numpy(),
             propensity_scores.reshape((-1, 1))
         ])
 
-        gen_out = self.matching_lib.GenMatch(
-            Tr=IntVector(self.dataset.T),
-            X=matching_data,
-            print_level=0)
-
-        self.match_out = self.matching_lib.Match(
-            Y=FloatVector(self.dataset.Y),
-            Tr=IntVector(self.dataset.T),
-            X=matching_data,
-            replace=True,
-            Weight_matrix=gen_out,
-            estimand="ATT",
-            version="fast")
+        return {
+            "Y": self.dataset.Y.to_numpy(),
+            "Tr": self.dataset.T.to_numpy(),
+            "X": matching_data
+        }
 
     def estimate_ITE(self):
         ate = self.estimate_ATE()
         return np.full(len(self.dataset.X), ate)
 
     def estimate_ATT(self):
-        return np.array(self.match_out.rx2("est").rx(1,1))[0]
+        return self.r_estimate
 
     def estimate_ATE(self):
-        return np.array(self.match_out.rx2("est").rx(1,1))[0]
+        return self.r_estimate
@@ -8,6 +8,10 @@ class UnknownEstimandAggregationException(Exception):
     def __init__(self):
         super().__init__("Estimand with unknown aggregation provided")
 
+class RSessionException(Exception):
+    def __init__(self, msg):
+        super().__init__(msg)
+
 # DGP exceptions
 
 class UnknownDGPVariableException(Exception):
@@ -22,6 +26,18 @@ class DGPInvalidSpecificationException(Exception):
     def __init__(self, method_obj):
         super().__init__(f"Invalid DGP class specification. {method_obj} is a _generate* method without the data_generating_method decorator.")
 
+class DGPSerializationException(Exception):
+    def __init__(self, msg):
+        super().__init__(msg)
+
+class DGPBankException(Exception):
+    def __init__(self, msg):
+        super().__init__(msg)
+
+class DatasetCorpusException(Exception):
+    def __init__(self, msg):
+        super().__init__(msg)
+
 class DGPFunctionCompilationException(Exception):
     def __init__(self, base_exception):
         super().__init__(f"Failure in compilation of expression. Root exception: {e}")
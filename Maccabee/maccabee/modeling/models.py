@@ -5,9 +5,13 @@ The submodule also contains some example concrete implementations. These serve a
 
 from ..constants import Constants
 from ..exceptions import UnknownEstimandException
+from .r_sessions import get_r_session_client, _array_header, _r_result_to_arrays
 from sklearn.linear_model import LinearRegression
 import numpy as np
 
+from ..logging import get_logger
+logger = get_logger(__name__)
+
 
 import importlib
 rpy2_spec = importlib.util.find_spec("rpy2")
@@ -15,12 +19,26 @@ if rpy2_spec is not None:
     # RPY2 is used an interconnect between Python and R. It allows
     # python to run R code in a subprocess.
     import rpy2
+    from rpy2 import robjects
     from rpy2.robjects import IntVector, FloatVector, Formula
     from rpy2.robjects.packages import importr
     from rpy2.robjects import numpy2ri
     from rpy2.robjects.packages import SignatureTranslatedAnonymousPackage
     numpy2ri.activate()
 
+DGPVariables = Constants.DGPVariables
+
+# Per-process caches of the imported R packages and the evaluated R source
+# code. The embedded R instance lives for the life of the process so these
+# are only loaded once.
+_R_PACKAGE_CACHE = {}
+_R_EVALUATED_SOURCES = set()
+
+def _import_r_package_cached(package_name):
+    if package_name not in _R_PACKAGE_CACHE:
+        _R_PACKAGE_CACHE[package_name] = importr(package_name)
+    return _R_PACKAGE_CACHE[package_name]
+
 class CausalModel():
     """The base :class:`maccabee.modeling.models.CausalModel` class presents a minimal interface. This is important because many models, with diverse operation/characteristics, are expected to conform to this interface. It takes a :class:`~maccabee.data_generation.generated_data_set.GeneratedDataSet` instance which contains the data to be used for estimation. It has an abstract :meth:`~maccabee.modeling.models.CausalModel.fit` method which, when called on inheriting classes, should prepare the model to produce an estimate. This preparation could mean pre-processing data, training a neural network etc. Finally, it has a concrete :meth:`~maccabee.modeling.models.CausalModel.estimate` method which expects to find a defined method with the ``estimate_*`` where \* is an estimand name. It is up to the inheriting class to define the appropriate estimator methods depending on the estimands which will be evaluated.
 
@@ -44,6 +62,33 @@ class CausalModel():
         """
         raise NotImplementedError
 
+    @classmethod
+    def fit_batch(cls, datasets):
+        """The batch fit method builds and fits one model instance for each of the supplied data sets. It is used by the benchmarking functions to fit models to all of the data sets sampled from a DGP in a sampling run. The default implementation simply fits each model separately. Inheriting classes can override this method to exploit the structure shared by data sets sampled from the same DGP - such as identical covariates - so long as the returned instances behave as if :meth:`~maccabee.modeling.models.CausalModel.fit` had been called on each.
+
+        Args:
+            datasets (list): A list of :class:`~maccabee.data_generation.generated_data_set.GeneratedDataSet` instances.
+
+        Returns:
+            list: A list of fitted model instances, one per data set, in the order of `datasets`.
+        """
+        models = []
+        for dataset in datasets:
+            model = cls(dataset)
+            model.fit()
+            models.append(model)
+
+        return models
+
+    @classmethod
+    def supports_batch_fit(cls):
+        """Indicates whether the class has an optimized :meth:`~maccabee.modeling.models.CausalModel.fit_batch` method. If so, the benchmarking functions fit the model to all the data sets in a sampling run at once. Otherwise, models are fit as each data set is generated.
+
+        Returns:
+            bool: ``True`` if the class overrides the default batch fit method.
+        """
+        return cls.fit_batch.__func__ is not CausalModel.fit_batch.__func__
+
     def estimate_ITE(self):
         raise NotImplementedError
 
@@ -80,13 +125,201 @@ class CausalModel():
 class CausalModelR(CausalModel):
     """
     This class inherits from :class:`maccabee.modeling.models.CausalModel` and implements additional tooling using to write causal models with major components in R.
+
+    The recommended approach is to define the R components of the model as R functions, in the ``R_SOURCE`` class attribute, which take numeric arrays and return a numeric vector or a named list of numeric values. The R packages used by these functions are listed in the ``R_PACKAGES`` class attribute. The functions are then called using :meth:`~maccabee.modeling.models.CausalModelR.call_r_function`. This runs the function in a persistent :class:`~maccabee.modeling.r_sessions.RSessionPool` session if a pool is active and in the process-local embedded R instance otherwise. In both cases, packages and source code are loaded only once per R instance.
+
+    Models which can be expressed as a single R function of per-observation arrays can instead set the ``R_FUNCTION`` class attribute to the name of that function and implement :meth:`~maccabee.modeling.models.CausalModelR.build_r_function_args`. The R function should return the effect estimate, optionally followed by the ITE estimate for each observation. The class then provides concrete :meth:`~maccabee.modeling.models.CausalModelR.fit`, estimand and :meth:`~maccabee.modeling.models.CausalModelR.fit_batch` methods. The batch fit method stacks the arguments for many data sets into a single set of arrays, along with a data set index vector, and loops over the data sets inside R. This means that the data for all the data sets crosses the Python/R boundary in a single call. Data sets whose fit fails in R are refit separately.
+
+    Attributes:
+        R_PACKAGES (list): The names of the R packages used by the model.
+        R_SOURCE (str): R source code which defines the functions used by the model. None if the model has no source code.
+        R_FUNCTION (str): The name of the R function which fits the model to a single data set. None if the model does not use the single function protocol.
     """
 
+    R_PACKAGES = []
+    R_SOURCE = None
+    R_FUNCTION = None
+
+    # The R function used to apply an R_FUNCTION to each of the
+    # stacked data sets in a batch. Matrix arguments are split by row and
+    # vector arguments by element. Errors are caught per data set, so that
+    # one failed fit doesn't discard the rest of the batch, and returned
+    # as messages alongside the results.
+    _R_BATCH_SOURCE = """
+maccabee_apply_by_dataset <- function(function_name, dataset_index, ...) {
+    fit_function <- get(function_name)
+    args <- list(...)
+    n_datasets <- max(dataset_index)
+    estimates <- numeric(n_datasets)
+    ITE <- rep(NA_real_, length(dataset_index))
+    errors <- rep("", n_datasets)
+    for (k in seq_len(n_datasets)) {
+        rows <- which(dataset_index == k)
+        dataset_args <- lapply(args, function(arg) {
+            if (is.matrix(arg)) arg[rows, , drop=FALSE] else arg[rows]
+        })
+        result <- tryCatch(
+            as.numeric(do.call(fit_function, dataset_args)),
+            error=function(e) {
+                errors[k] <<- conditionMessage(e)
+                NA_real_
+            })
+        estimates[k] <- result[1]
+        if (length(result) == length(rows) + 1) {
+            ITE[rows] <- result[-1]
+        }
+    }
+    list(estimates=estimates, ITE=ITE, errors=errors)
+}
+"""
+
     def __init__(self, dataset):
         super().__init__(dataset)
 
+    @classmethod
+    def call_r_function(cls, function_name, *args, **kwargs):
+        """Call an R function, defined in one of the ``R_PACKAGES`` or the ``R_SOURCE`` of the class, with numeric array arguments.
+
+        Args:
+            function_name (str): The name of the R function.
+            *args (list): Array-like positional arguments. Integer and boolean arrays are converted to R integer vectors and all other arrays to R numeric vectors/matrices.
+            **kwargs (dict): Keyword arguments. Array-like values are converted as for `args`. Other values, like strings and scalars, are passed as-is.
+
+        Returns:
+            object: If the R function returns a named list, a dictionary mapping the names to numpy arrays. Otherwise, a numpy array.
+        """
+        sources = [CausalModelR._R_BATCH_SOURCE]
+        if cls.R_SOURCE is not None:
+            sources.append(cls.R_SOURCE)
+
+        client = get_r_session_client()
+        if client is not None:
+            return client.call(
+                function_name, *args,
+                packages=cls.R_PACKAGES, sources=sources, **kwargs)
+
+        # No active pool, use the embedded R instance of this process.
+        for package_name in cls.R_PACKAGES:
+            _import_r_package_cached(package_name)
+
+        for source in sources:
+            if source not in _R_EVALUATED_SOURCES:
+                robjects.r(source)
+                _R_EVALUATED_SOURCES.add(source)
+
+        r_args = [_array_header(arg)[0] for arg in args]
+        r_kwargs = dict(
+            (name, _array_header(value)[0])
+            if isinstance(value, (np.ndarray, list, tuple)) else (name, value)
+            for name, value in kwargs.items())
+
+        result_arrays = _r_result_to_arrays(
+            robjects.r[function_name](*r_args, **r_kwargs))
+
+        if len(result_arrays) == 1 and result_arrays[0][0] is None:
+            return result_arrays[0][1]
+        else:
+            return dict(result_arrays)
+
+    def build_r_function_args(self):
+        """Build the arguments of the ``R_FUNCTION`` for the data set of this model instance. Any Python-side preprocessing, like propensity score estimation, is done here.
+
+        Returns:
+            dict: A dictionary mapping R argument names to numpy arrays with one entry (or matrix row) per observation.
+
+        Raises:
+            NotImplementedError: this is an abstract implementation.
+        """
+        raise NotImplementedError
+
+    def _set_r_function_result(self, estimate, ITE=None):
+        # Store the results of the R function for this data set.
+        self.r_estimate = estimate
+        self.r_ITE = ITE
+
+    def fit(self):
+        """Fit the model by calling the ``R_FUNCTION`` on the data set of this instance. This requires the ``R_FUNCTION`` protocol described above, otherwise inheriting classes must implement this method.
+
+        Raises:
+            NotImplementedError: if the class does not use the single function protocol.
+        """
+        if self.R_FUNCTION is None:
+            raise NotImplementedError
+
+        result = np.atleast_1d(self.call_r_function(
+            self.R_FUNCTION, **self.build_r_function_args()))
+
+        ITE = result[1:] if len(result) > 1 else None
+        self._set_r_function_result(result[0], ITE)
+
+    @classmethod
+    def fit_batch(cls, datasets):
+        """Fit one model per data set using a single R call. The arguments built by :meth:`~maccabee.modeling.models.CausalModelR.build_r_function_args` for each data set are stacked and the ``R_FUNCTION`` is applied to each data set in an R loop. Data sets for which the R function raises an error are refit separately with :meth:`~maccabee.modeling.models.CausalModelR.fit`, so the error is raised as it would be without batching. If the class does not use the single function protocol, the models are fit separately.
+
+        Args:
+            datasets (list): See :meth:`~maccabee.modeling.models.CausalModel.fit_batch`.
+
+        Returns:
+            list: See :meth:`~maccabee.modeling.models.CausalModel.fit_batch`.
+        """
+        if cls.R_FUNCTION is None:
+            return super().fit_batch(datasets)
+
+        if len(datasets) == 0:
+            return []
+
+        models = [cls(dataset) for dataset in datasets]
+        dataset_args = [model.build_r_function_args() for model in models]
+
+        # Stack the arguments of all the data sets. The index vector
+        # records the (1-based) data set of each observation.
+        stacked_args = {}
+        for arg_name in dataset_args[0]:
+            stacked_args[arg_name] = np.concatenate(
+                [np.asarray(args[arg_name]) for args in dataset_args], axis=0)
+
+        dataset_sizes = [len(next(iter(args.values()))) for args in dataset_args]
+        dataset_index = np.repeat(
+            np.arange(1, len(datasets) + 1, dtype=np.int32), dataset_sizes)
+
+        result = cls.call_r_function(
+            "maccabee_apply_by_dataset",
+            function_name=cls.R_FUNCTION,
+            dataset_index=dataset_index,
+            **stacked_args)
+
+        estimates = np.atleast_1d(result["estimates"])
+        ITEs = np.split(np.asarray(result["ITE"]), np.cumsum(dataset_sizes)[:-1])
+
+        errors = np.atleast_1d(result["errors"])
+        for batch_index, (model, estimate, ITE, error) in enumerate(
+            zip(models, estimates, ITEs, errors)):
+            if error:
+                # Refit the failed data set on its own. This raises the
+                # R error just as an unbatched fit would.
+                logger.warning(
+                    f"Batch fit of {cls.__name__} failed for data set {batch_index+1}: {error}. Refitting separately.")
+                model.fit()
+                continue
+
+            if np.all(np.isnan(ITE)):
+                ITE = None
+            model._set_r_function_result(estimate, ITE)
+
+        return models
+
+    @classmethod
+    def supports_batch_fit(cls):
+        """See :meth:`~maccabee.modeling.models.CausalModel.supports_batch_fit`. R models support batch fitting if they use the single function protocol or override the batch fit method.
+
+        Returns:
+            bool: ``True`` if the class supports batch fitting.
+        """
+        return (cls.R_FUNCTION is not None) or \
+            (cls.fit_batch.__func__ is not CausalModelR.fit_batch.__func__)
+
     def _import_r_package(self, package_name):
-        """Helper function to import a package pre-installed in the system's R language.
+        """Helper function to import a package pre-installed in the system's R language. Packages are imported once per process and cached.
 
         Args:
             package_name (str): The string name of the package, as would be used in the R `load` command.
@@ -94,7 +327,7 @@ class CausalModelR(CausalModel):
         Returns:
             object: A python object representing the R package with all functions as attribute methods of the object.
         """
-        return importr(package_name)
+        return _import_r_package_cached(package_name)
 
     def _import_r_file_as_package(self, file_path, package_name):
         """Helper function to import an R file as a psuedo-package. The functions from the R file are translated as exported methods of a package called `package_name`.
@@ -112,18 +345,85 @@ class CausalModelR(CausalModel):
 
 class LinearRegressionCausalModel(CausalModel):
     """This class inherits from :class:`maccabee.modeling.models.CausalModel` and implements a linear-regression based estimator for the ATE and ITE using SciKit Learn linear regression model. The ITE is a dummy estimand in this case given the linear model assumes a homogenous effect amongst all units.
+
+    The class implements an optimized :meth:`~maccabee.modeling.models.LinearRegressionCausalModel.fit_batch` method for data sets which share their covariates.
     """
 
     def __init__(self, dataset):
         super().__init__(dataset)
         self.model = LinearRegression(fit_intercept=True)
-        self.data = dataset.observed_data.drop("Y", axis=1)
 
     def fit(self):
         """Fit the linear regression model.
         """
-        # self.model.fit(np.hstack([self.dataset.X, self.dataset.T.to_numpy().reshape((-1, 1))]), self.dataset.Y)
-        self.model.fit(self.data, self.dataset.Y)
+        # The design matrix is the covariates with the treatment status as
+        # the final column.
+        self.model.fit(
+            self.dataset.covariate_treatment_matrix,
+            self.dataset.get_dgp_variable_array(DGPVariables.OBSERVED_OUTCOME_NAME))
+
+    @classmethod
+    def fit_batch(cls, datasets):
+        """Fit linear regression models to many data sets which share the same covariates, as is the case for data sets sampled from a single DGP. The QR factorization of the shared covariate design matrix is computed once. The treatment coefficient for each data set is then found from the Schur complement of the shared block in the normal equations and the covariate coefficients follow by back substitution. All data sets are solved at once. If the covariates are not shared, or the design is rank deficient, the models are fit separately.
+
+        Args:
+            datasets (list): See :meth:`~maccabee.modeling.models.CausalModel.fit_batch`.
+
+        Returns:
+            list: See :meth:`~maccabee.modeling.models.CausalModel.fit_batch`.
+        """
+        if len(datasets) == 0:
+            return []
+
+        X = datasets[0].X
+        X_arr = datasets[0].covariate_matrix
+        for dataset in datasets[1:]:
+            if (dataset.X is not X) and \
+                not np.array_equal(X_arr, dataset.covariate_matrix):
+                return super().fit_batch(datasets)
+
+        n_observations, n_covariates = X_arr.shape
+
+        # Shared block: the covariates with an intercept column.
+        A = np.column_stack([np.ones(n_observations), X_arr])
+        Q, R = np.linalg.qr(A)
+
+        R_diag = np.abs(np.diag(R))
+        if np.any(R_diag <= (np.finfo(float).eps * n_observations * np.max(R_diag))):
+            return super().fit_batch(datasets)
+
+        # Stacked treatment statuses and outcomes with shape (n, K).
+        T = np.column_stack([
+            dataset.get_dgp_variable_array(DGPVariables.TREATMENT_ASSIGNMENT_NAME)
+            for dataset in datasets])
+        Y = np.column_stack([
+            dataset.get_dgp_variable_array(DGPVariables.OBSERVED_OUTCOME_NAME)
+            for dataset in datasets])
+
+        QtT = Q.T @ T
+        QtY = Q.T @ Y
+
+        # The treatment coefficient is the ratio of the treatment/outcome
+        # cross product and treatment sum of squares after projecting out
+        # the shared block.
+        treatment_residual_ss = np.sum(T*T, axis=0) - np.sum(QtT*QtT, axis=0)
+        if np.any(treatment_residual_ss <= (np.finfo(float).eps * n_observations)):
+            return super().fit_batch(datasets)
+
+        treatment_coefs = (np.sum(T*Y, axis=0) - np.sum(QtT*QtY, axis=0)) / \
+            treatment_residual_ss
+
+        block_coefs = np.linalg.solve(R, QtY - QtT*treatment_coefs)
+
+        models = []
+        for i, dataset in enumerate(datasets):
+            model = cls(dataset)
+            model.model.intercept_ = block_coefs[0, i]
+            model.model.coef_ = np.append(block_coefs[1:, i], treatment_coefs[i])
+            model.model.n_features_in_ = n_covariates + 1
+            models.append(model)
+
+        return models
 
     def estimate_ATE(self):
         """
@@ -139,16 +439,6 @@ class LinearRegressionCausalModel(CausalModel):
         to 1 and 0 as the ITE. This will be a constant equal to the ATE given
         that this is a linear model.
         """
-        # Generate potential outcomes
-        X_under_treatment = self.data.copy()
-        X_under_treatment["T"] = 1
-
-        X_under_control = self.data.copy()
-        X_under_control["T"] = 0
-
-        y_1_predicted = self.model.predict(X_under_treatment)
-        y_0_predicted = self.model.predict(X_under_control)
-
-        ITE = y_1_predicted - y_0_predicted
-
-        return ITE
+        # The predicted potential outcomes differ only in the treatment
+        # term so the difference is the treatment coefficient for all units.
+        return np.full(len(self.dataset.T), self.model.coef_[-1])
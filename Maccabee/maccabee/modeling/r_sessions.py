@@ -0,0 +1,440 @@
+"""This submodule contains the tooling used to run the R components of :class:`~maccabee.modeling.models.CausalModelR` models in a pool of persistent R sessions.
+
+By default, each Python process which fits an R model starts its own embedded R instance (via rpy2) and loads the required R packages. When benchmarking, this setup cost is paid in every worker process and, if packages are imported when models are constructed, for every data set. The :class:`~maccabee.modeling.r_sessions.RSessionPool` class instead starts a number of long-lived R worker processes, each of which loads the required packages and R source code once. Models then call R functions through a thin RPC layer built on :mod:`multiprocessing.connection`. Numeric arrays are transferred as contiguous binary buffers rather than being pickled or converted element-wise.
+
+The pool publishes the addresses of its sessions in an environment variable. This means that any Python process started after the pool - including the benchmarking worker processes - can dispatch R calls to the pool without any additional configuration. :meth:`maccabee.modeling.models.CausalModelR.call_r_function` uses the pool if one is available and falls back to the process-local embedded R otherwise.
+
+>>> from maccabee.modeling.r_sessions import RSessionPool
+>>> from maccabee.examples.genmatch import GeneticMatchingCausalModel
+>>> with RSessionPool(n_sessions=4, model_classes=[GeneticMatchingCausalModel]):
+>>>     benchmark_model_using_concrete_dgp(dgp, GeneticMatchingCausalModel, ...)
+"""
+
+import os
+import json
+import fcntl
+import shutil
+import secrets
+import tempfile
+from itertools import count
+from contextlib import contextmanager
+from multiprocessing import get_context, AuthenticationError
+from multiprocessing.connection import Listener, Client
+import numpy as np
+
+from ..exceptions import RSessionException
+
+from ..logging import get_logger
+logger = get_logger(__name__)
+
+#: The name of the environment variable in which the addresses and
+#: authentication key of the active R session pool are published.
+R_SESSION_POOL_ENV_VAR = "MACCABEE_R_SESSION_POOL"
+
+# The time, in seconds, to wait for a new R session to load its packages
+# and source code.
+R_SESSION_STARTUP_TIMEOUT = 300
+
+# The per-process counter used to pick the first session tried by each
+# call, so that consecutive calls are spread over the sessions.
+_SESSION_COUNTER = count()
+
+### Array transport
+
+# Arrays are sent as a small, pickled, header which describes the array
+# followed by the raw bytes of the array. Integer and boolean arrays are
+# sent as int32 (R's integer type), string arrays, like error messages, as
+# fixed width unicode and all other arrays as float64.
+
+def _array_header(value):
+    array = np.asarray(value)
+    if array.dtype.kind in "biu":
+        array = np.ascontiguousarray(array, dtype=np.int32)
+    elif (array.dtype.kind == "U") or ((array.dtype.kind == "O") and
+        (array.size > 0) and all(isinstance(item, str) for item in array.flat)):
+        array = np.ascontiguousarray(array, dtype=str)
+    else:
+        array = np.ascontiguousarray(array, dtype=np.float64)
+
+    return array, {"shape": array.shape, "dtype": array.dtype.str}
+
+def _send_arrays(conn, arrays):
+    for array in arrays:
+        conn.send_bytes(memoryview(array).cast("B"))
+
+def _recv_array(conn, header):
+    buffer = conn.recv_bytes()
+    array = np.frombuffer(buffer, dtype=np.dtype(header["dtype"]))
+    return array.reshape(header["shape"])
+
+def _send_message(conn, message, arrays):
+    """Helper method which sends a message dictionary and an associated list of (named) arrays over a connection.
+
+    Args:
+        conn (:class:`multiprocessing.connection.Connection`): The connection.
+        message (dict): A dictionary of picklable message data. The array headers are added under the "arrays" key.
+        arrays (list): A list of (name, array-like) tuples. The names may be None.
+    """
+    contiguous_arrays = []
+    headers = []
+    for name, value in arrays:
+        array, header = _array_header(value)
+        header["name"] = name
+        contiguous_arrays.append(array)
+        headers.append(header)
+
+    message["arrays"] = headers
+    conn.send(message)
+    _send_arrays(conn, contiguous_arrays)
+
+def _recv_message(conn):
+    """Helper method which receives a message sent with :func:`~maccabee.modeling.r_sessions._send_message`.
+
+    Returns:
+        tuple: a tuple with the message dictionary as the first entry and the list of (name, array) tuples as the second.
+    """
+    message = conn.recv()
+    arrays = [
+        (header["name"], _recv_array(conn, header))
+        for header in message["arrays"]
+    ]
+    return message, arrays
+
+### R session worker
+
+def _r_result_to_arrays(result):
+    # Convert the value returned by an R function into a list of named
+    # numeric arrays. Named R lists are converted entry-wise and all other
+    # values are treated as a single numeric vector/matrix.
+    names = getattr(result, "names", None)
+    if hasattr(result, "rx2") and names is not None and len(names) == len(result):
+        return [(str(name), np.asarray(result.rx2(str(name)))) for name in names]
+    else:
+        return [(None, np.asarray(result))]
+
+def _serve_r_session(handshake_conn, authkey, packages, sources):
+    """The function run by each R session worker process. It loads the R packages and source code, publishes the address of the session's listener through the handshake connection and then serves RPC requests until a shutdown request is received.
+
+    Requests are served from one client connection at a time, in the order the connections are made.
+
+    Args:
+        handshake_conn (:class:`multiprocessing.connection.Connection`): The connection used to report the session's address (or startup failure) to the pool.
+        authkey (bytes): The authentication key for client connections.
+        packages (list): A list of R package names to load.
+        sources (list): A list of strings of R source code to evaluate.
+    """
+    try:
+        from rpy2 import robjects
+        from rpy2.robjects.packages import importr
+        from rpy2.robjects import numpy2ri
+        numpy2ri.activate()
+
+        loaded_packages = set()
+        for package_name in packages:
+            importr(package_name)
+            loaded_packages.add(package_name)
+
+        evaluated_sources = set()
+        for source in sources:
+            robjects.r(source)
+            evaluated_sources.add(source)
+
+        listener = Listener(("localhost", 0), authkey=authkey)
+    except Exception as e:
+        handshake_conn.send(("error", repr(e)))
+        handshake_conn.close()
+        return
+
+    handshake_conn.send(("ok", listener.address))
+    handshake_conn.close()
+
+    while True:
+        try:
+            conn = listener.accept()
+        except (AuthenticationError, ConnectionError) as e:
+            # A failed handshake only affects the connecting client.
+            logger.warning(f"Rejected R session client connection: {e!r}")
+            continue
+
+        while True:
+            try:
+                message, arrays = _recv_message(conn)
+            except (EOFError, ConnectionError):
+                break # client closed the connection.
+
+            request_type = message["type"]
+            if request_type == "shutdown":
+                conn.close()
+                listener.close()
+                return
+
+            try:
+                # Packages and source code are only loaded the first
+                # time they are requested.
+                for package_name in message.get("packages", []):
+                    if package_name not in loaded_packages:
+                        importr(package_name)
+                        loaded_packages.add(package_name)
+
+                for source in message.get("sources", []):
+                    if source not in evaluated_sources:
+                        robjects.r(source)
+                        evaluated_sources.add(source)
+
+                if request_type == "call":
+                    args = [array for name, array in arrays if name is None]
+                    kwargs = dict(
+                        (name, array) for name, array in arrays if name is not None)
+                    kwargs.update(message["kwargs"])
+
+                    result = robjects.r[message["function"]](*args, **kwargs)
+                    result_arrays = _r_result_to_arrays(result)
+                else:
+                    result_arrays = []
+
+                response = ({"status": "ok"}, result_arrays)
+            except Exception as e:
+                response = ({"status": "error", "message": repr(e)}, [])
+
+            try:
+                _send_message(conn, *response)
+            except ConnectionError:
+                break # client went away before the response was sent.
+
+        conn.close()
+
+### Pool and clients
+
+class RSessionPool():
+    """This class manages a pool of persistent R worker processes. The pool is started with :meth:`~maccabee.modeling.r_sessions.RSessionPool.start` and stopped with :meth:`~maccabee.modeling.r_sessions.RSessionPool.stop`. It can also be used as a context manager. While the pool is running, its session addresses are published in the ``MACCABEE_R_SESSION_POOL`` environment variable so that the R calls made by :class:`~maccabee.modeling.models.CausalModelR` models in this process and its child processes are executed by the pool.
+
+    Each session serves one client connection at a time. Each call is sent to a free session, if there is one, and otherwise waits for a busy session, chosen in round-robin order. Sessions are marked as busy by holding a lock on a per-session file in a temporary directory created by the pool. The number of sessions should match the number of processes which will fit R models concurrently.
+
+    Args:
+        n_sessions (int): The number of R sessions. Defaults to 1.
+        packages (list): A list of R package names which are loaded when each session starts. Defaults to [].
+        sources (list): A list of strings of R source code which are evaluated when each session starts. Defaults to [].
+        model_classes (list): A list of :class:`~maccabee.modeling.models.CausalModelR` subclasses. The ``R_PACKAGES`` and ``R_SOURCE`` attributes of these classes are added to `packages` and `sources`. Defaults to [].
+
+    Attributes:
+        n_sessions
+        packages
+        sources
+    """
+
+    def __init__(self, n_sessions=1, packages=[], sources=[], model_classes=[]):
+        self.n_sessions = n_sessions
+        self.packages = list(packages)
+        self.sources = list(sources)
+
+        for model_class in model_classes:
+            self.packages.extend(getattr(model_class, "R_PACKAGES", []))
+            source = getattr(model_class, "R_SOURCE", None)
+            if source is not None:
+                self.sources.append(source)
+
+        # Remove duplicates while preserving order.
+        self.packages = list(dict.fromkeys(self.packages))
+        self.sources = list(dict.fromkeys(self.sources))
+
+        self._authkey = None
+        self._lock_dir = None
+        self._processes = []
+        self._addresses = []
+
+    def start(self):
+        """Start the R sessions and publish their addresses. This blocks until all sessions have loaded their packages and source code.
+
+        Raises:
+            RSessionException: If an R session fails to start.
+        """
+        if len(self._processes) > 0:
+            return
+
+        self._authkey = secrets.token_bytes(32)
+        self._lock_dir = tempfile.mkdtemp(prefix="maccabee-r-sessions-")
+
+        # R sessions are spawned rather than forked. The embedded R
+        # instance of a parent process cannot be safely shared by a fork.
+        context = get_context("spawn")
+
+        handshake_conns = []
+        for session_index in range(self.n_sessions):
+            parent_conn, child_conn = context.Pipe(duplex=False)
+            proc = context.Process(
+                target=_serve_r_session,
+                args=(child_conn, self._authkey, self.packages, self.sources),
+                daemon=True)
+            proc.start()
+            child_conn.close()
+
+            self._processes.append(proc)
+            handshake_conns.append(parent_conn)
+
+        for session_index, handshake_conn in enumerate(handshake_conns):
+            if not handshake_conn.poll(R_SESSION_STARTUP_TIMEOUT):
+                self.stop()
+                raise RSessionException(f"R session {session_index} did not start.")
+
+            try:
+                status, value = handshake_conn.recv()
+            except EOFError:
+                status, value = "error", "the session process exited."
+            handshake_conn.close()
+            if status != "ok":
+                self.stop()
+                raise RSessionException(f"R session {session_index} failed to start: {value}")
+
+            self._addresses.append(value)
+
+        logger.info(f"Started {self.n_sessions} R sessions.")
+
+        os.environ[R_SESSION_POOL_ENV_VAR] = json.dumps({
+            "addresses": self._addresses,
+            "authkey": self._authkey.hex(),
+            "lock_dir": self._lock_dir
+        })
+
+    def stop(self):
+        """Stop the R sessions and unpublish their addresses.
+        """
+        if os.environ.get(R_SESSION_POOL_ENV_VAR, None) is not None:
+            del os.environ[R_SESSION_POOL_ENV_VAR]
+
+        for address in self._addresses:
+            try:
+                with Client(tuple(address), authkey=self._authkey) as conn:
+                    _send_message(conn, {"type": "shutdown"}, [])
+            except (OSError, EOFError):
+                pass
+
+        for proc in self._processes:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+
+        if self._lock_dir is not None:
+            shutil.rmtree(self._lock_dir, ignore_errors=True)
+
+        self._lock_dir = None
+        self._processes = []
+        self._addresses = []
+        logger.info("Stopped R sessions.")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+class RSessionClient():
+    """This class is used to make RPC calls to the sessions of a running :class:`~maccabee.modeling.r_sessions.RSessionPool`. A new connection is made for each call so that a session is never held by an idle client.
+
+    Args:
+        addresses (list): The addresses of the pool's sessions.
+        authkey (bytes): The pool's authentication key.
+        lock_dir (str): The directory of the pool's session lock files. If None, calls are sent to the sessions in round-robin order without checking whether they are busy. Defaults to None.
+    """
+
+    def __init__(self, addresses, authkey, lock_dir=None):
+        self.addresses = [tuple(address) for address in addresses]
+        self.authkey = authkey
+        self.lock_dir = lock_dir
+
+    @contextmanager
+    def _acquire_session(self):
+        # Yield the address of a session, holding its lock for the duration
+        # of the call. The sessions are tried in round-robin order, starting
+        # from the next session for this process, and the first free one is
+        # used. If all the sessions are busy, wait for the first one.
+        n_sessions = len(self.addresses)
+        first_session = (os.getpid() + next(_SESSION_COUNTER)) % n_sessions
+        session_order = [
+            (first_session + offset) % n_sessions for offset in range(n_sessions)]
+
+        if self.lock_dir is None:
+            yield self.addresses[first_session]
+            return
+
+        lock_files = []
+        try:
+            for session_index in session_order:
+                lock_file = open(os.path.join(
+                    self.lock_dir, f"session-{session_index}.lock"), "a")
+                lock_files.append(lock_file)
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+
+                yield self.addresses[session_index]
+                return
+
+            fcntl.flock(lock_files[0], fcntl.LOCK_EX)
+            yield self.addresses[first_session]
+        finally:
+            # Closing the files releases any lock held on them.
+            for lock_file in lock_files:
+                lock_file.close()
+
+    def call(self, function_name, *args, packages=[], sources=[], **kwargs):
+        """Call an R function in one of the pool's sessions.
+
+        Args:
+            function_name (str): The name of an R function defined in the session, either from a loaded package or evaluated source code.
+            *args (list): Array-like positional arguments which are sent as numeric buffers.
+            packages (list): R packages which must be loaded before the call. Each session loads a package the first time it is requested. Defaults to [].
+            sources (list): Strings of R source code which must be evaluated before the call. Each session evaluates a source string the first time it is requested. Defaults to [].
+            **kwargs (dict): Keyword arguments. Array-like values (numpy arrays and lists of numbers) are sent as numeric buffers and all other values (strings, scalars) are pickled.
+
+        Returns:
+            object: If the R function returns a named list, a dictionary mapping the names to numpy arrays. Otherwise, a numpy array.
+
+        Raises:
+            RSessionException: If the R call fails.
+        """
+        array_args = [(None, arg) for arg in args]
+        scalar_kwargs = {}
+        for name, value in kwargs.items():
+            if isinstance(value, (np.ndarray, list, tuple)):
+                array_args.append((name, value))
+            else:
+                scalar_kwargs[name] = value
+
+        message = {
+            "type": "call",
+            "function": function_name,
+            "kwargs": scalar_kwargs,
+            "packages": list(packages),
+            "sources": list(sources)
+        }
+
+        with self._acquire_session() as address:
+            with Client(address, authkey=self.authkey) as conn:
+                _send_message(conn, message, array_args)
+                response, result_arrays = _recv_message(conn)
+
+        if response["status"] != "ok":
+            raise RSessionException(
+                f"R call to {function_name} failed: {response['message']}")
+
+        if len(result_arrays) == 1 and result_arrays[0][0] is None:
+            return result_arrays[0][1]
+        else:
+            return dict(result_arrays)
+
+def get_r_session_client():
+    """Returns a :class:`~maccabee.modeling.r_sessions.RSessionClient` for the R session pool published in the environment of the current process, or None if there is no active pool.
+
+    Returns:
+        :class:`~maccabee.modeling.r_sessions.RSessionClient`: The client or None.
+    """
+    pool_spec = os.environ.get(R_SESSION_POOL_ENV_VAR, None)
+    if pool_spec is None:
+        return None
+
+    pool_spec = json.loads(pool_spec)
+    return RSessionClient(
+        pool_spec["addresses"], bytes.fromhex(pool_spec["authkey"]),
+        pool_spec.get("lock_dir", None))
@@ -15,6 +15,8 @@ Beyond specifying axis levels, there are also ways to specify parameter values m
 
 See the :class:`~maccabee.parameters.parameter_store.ParameterStore` docs for detail on the set of sampling parameters, parameter specification files, and the parameter schema file.
 
+The values in a :class:`~maccabee.parameters.parameter_store.ParameterStore` instance can be captured in an immutable, hashable :class:`~maccabee.parameters.parameter_store.ParameterSnapshot` using the :meth:`~maccabee.parameters.parameter_store.ParameterStore.snapshot` method. Snapshots are cheap to pickle and can be used as cache keys. The :func:`~maccabee.parameters.parameter_store_builders.build_parameters_from_snapshot` function builds a new store from a snapshot.
+
 .. note::
   For convenience, the classes and functions in the :mod:`maccabee.parameters.parameter_store` submodule can be imported directly from this module.
 """
@@ -4,10 +4,12 @@
 import numpy as np
 import sympy as sp
 from sympy.abc import x
-import yaml
+import json
+import hashlib
+from types import MappingProxyType
 from ..constants import Constants
 from ..exceptions import ParameterMissingFromSpecException, ParameterInvalidValueException, CalculatedParameterException
-from .utils import _non_zero_uniform_sampler
+from .utils import _non_zero_uniform_sampler, _load_yaml_file
 
 from ..logging import get_logger
 logger = get_logger(__name__)
@@ -17,6 +19,89 @@ SchemaConstants = Constants.ParamSchemaKeysAndVals
 
 
 
+# Compiled calculated parameter expressions keyed by expression string.
+_COMPILED_CALCULATED_PARAM_EXPRESSIONS = {}
+
+def _json_parameter_value(value):
+    # Convert numpy scalars and arrays in parameter values to JSON types.
+    if isinstance(value, np.generic):
+        return value.item()
+    elif isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+def _freeze_parameter_value(value):
+    # Convert a parameter value to an immutable equivalent.
+    if isinstance(value, dict):
+        return MappingProxyType({
+            key: _freeze_parameter_value(val) for key, val in value.items()})
+    elif isinstance(value, (list, tuple)):
+        return tuple(_freeze_parameter_value(val) for val in value)
+    elif isinstance(value, np.generic):
+        return value.item()
+    return value
+
+class ParameterSnapshot():
+    """An immutable snapshot of the values in a :class:`~maccabee.parameters.parameter_store.ParameterStore`, taken using :meth:`~maccabee.parameters.parameter_store.ParameterStore.snapshot`. Like the store, the snapshot makes the parameter values available as attributes. Unlike the store, it can't be modified, it is hashable and snapshots with the same values are equal. This makes snapshots usable as dictionary and cache keys. Snapshots are pickled as a single canonical string so they are also cheap to send between processes.
+
+    Dictionary parameter values are exposed as read-only mappings and list values as tuples. Use :meth:`~maccabee.parameters.parameter_store.ParameterSnapshot.to_dict` for mutable copies of the values and :func:`~maccabee.parameters.parameter_store_builders.build_parameters_from_snapshot` to build a new store from a snapshot.
+
+    Args:
+        parameter_values (dict): A dictionary mapping parameter names to values.
+    """
+
+    __slots__ = ("_record", "_values", "_hash")
+
+    def __init__(self, parameter_values):
+        # The canonical record of the values determines equality, hashing
+        # and the fingerprint.
+        record = json.dumps(
+            parameter_values, sort_keys=True, default=_json_parameter_value)
+
+        object.__setattr__(self, "_record", record)
+        object.__setattr__(self, "_values", {
+            param_name: _freeze_parameter_value(param_value)
+            for param_name, param_value in parameter_values.items()
+        })
+        object.__setattr__(self, "_hash", hash(record))
+
+    @classmethod
+    def _from_record(cls, record):
+        return cls(json.loads(record))
+
+    def __getattr__(self, param_name):
+        try:
+            return self._values[param_name]
+        except KeyError:
+            raise AttributeError(f"Unknown parameter {param_name}") from None
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ParameterSnapshot instances are immutable.")
+
+    def __eq__(self, other):
+        return isinstance(other, ParameterSnapshot) and self._record == other._record
+
+    def __hash__(self):
+        return self._hash
+
+    def __reduce__(self):
+        return (ParameterSnapshot._from_record, (self._record,))
+
+    def __repr__(self):
+        return f"ParameterSnapshot({self.get_fingerprint()[:12]})"
+
+    def get_fingerprint(self):
+        """Calculate a fingerprint of the parameter values. Unlike the built-in hash, the fingerprint is stable across processes and sessions.
+
+        Returns:
+            str: A hex digest which identifies the parameter values.
+        """
+        return hashlib.sha256(self._record.encode()).hexdigest()
+
+    def to_dict(self):
+        """Returns a dictionary which maps the parameter names to (mutable) copies of their values."""
+        return json.loads(self._record)
+
 class ParameterStore():
     """
     **The Design of the ParameterStore**
@@ -57,8 +142,7 @@ class ParameterStore():
 
     def __init__(self, parameter_spec_path):
         logger.debug(f"Reading parameter spec from path {parameter_spec_path}")
-        with open(parameter_spec_path, "r") as params_file:
-            raw_parameter_dict = yaml.safe_load(params_file)
+        raw_parameter_dict = _load_yaml_file(parameter_spec_path)
 
         self.parsed_parameter_dict = {}
         self.calculated_parameters = {}
@@ -142,6 +226,26 @@ class ParameterStore():
                 param_name, param_dict[param_name],
                 recalculate_calculated_params=recalculate_calculated_params)
 
+    def get_fingerprint(self):
+        """Calculate a fingerprint of the parameter values in this store. Two stores of the same class with the same fingerprint have the same parameter values.
+
+        Returns:
+            str: A hex digest which identifies the parameter values.
+        """
+        fingerprint_hash = hashlib.sha256()
+        fingerprint_hash.update(
+            f"{type(self).__module__}.{type(self).__qualname__}".encode())
+        fingerprint_hash.update(self.snapshot().get_fingerprint().encode())
+        return fingerprint_hash.hexdigest()
+
+    def snapshot(self):
+        """Take an immutable snapshot of the current parameter values. See :class:`~maccabee.parameters.parameter_store.ParameterSnapshot`.
+
+        Returns:
+            :class:`~maccabee.parameters.parameter_store.ParameterSnapshot`: The snapshot.
+        """
+        return ParameterSnapshot(self.parsed_parameter_dict)
+
     def write(self):
         # TODO-FUTURE: enable parsed params to be dumped as yaml spec for later
         # reuse.
@@ -153,7 +257,12 @@ class ParameterStore():
         # supplied in param_info using the existing parameter
         # values in the parsed_parameter_dict attribute.
         expr = param_info[SchemaConstants.EXPRESSION_KEY]
-        return eval(expr, globals(), self.parsed_parameter_dict)
+        if expr not in _COMPILED_CALCULATED_PARAM_EXPRESSIONS:
+            _COMPILED_CALCULATED_PARAM_EXPRESSIONS[expr] = compile(
+                expr, "<calculated parameter>", "eval")
+
+        return eval(_COMPILED_CALCULATED_PARAM_EXPRESSIONS[expr],
+            globals(), self.parsed_parameter_dict)
 
     def _recalculate_calculated_params(self):
         # Recalculate all calculated param values
@@ -1,6 +1,6 @@
-import yaml
 from ..constants import Constants
 from .parameter_store import ParameterStore
+from .utils import _load_yaml_file
 
 ParamFileConstants = Constants.ParamFilesAndPaths
 
@@ -39,6 +39,28 @@ def build_parameters_from_specification(parameter_spec_path):
     """
     return ParameterStore(parameter_spec_path=parameter_spec_path)
 
+def build_parameters_from_snapshot(parameter_snapshot):
+    """Return a :class:`~maccabee.parameters.parameter_store.ParameterStore` instance with the parameter values in a :class:`~maccabee.parameters.parameter_store.ParameterSnapshot`.
+
+    Args:
+        parameter_snapshot (:class:`~maccabee.parameters.parameter_store.ParameterSnapshot`): The snapshot.
+
+    Returns:
+        :class:`~maccabee.parameters.parameter_store.ParameterStore`: A :class:`~maccabee.parameters.parameter_store.ParameterStore` instance.
+
+    Examples
+        >>> from maccabee.parameters import build_default_parameters, build_parameters_from_snapshot
+        >>> snapshot = build_default_parameters().snapshot()
+        >>> build_parameters_from_snapshot(snapshot).snapshot() == snapshot
+        True
+
+    """
+    params = build_default_parameters()
+    params.set_parameters(
+        parameter_snapshot.to_dict(), recalculate_calculated_params=False)
+
+    return params
+
 def build_parameters_from_axis_levels(metric_levels, save=False):
     """Return a :class:`~maccabee.parameters.parameter_store.ParameterStore` instance based on the provided :term:`parameter specification file`.
 
@@ -63,8 +85,7 @@ def build_parameters_from_axis_levels(metric_levels, save=False):
 
     params = build_default_parameters()
 
-    with open(ParamFileConstants.AXIS_LEVEL_SPEC_PATH, "r") as metric_level_file:
-        metric_level_param_specs = yaml.safe_load(metric_level_file)
+    metric_level_param_specs = _load_yaml_file(ParamFileConstants.AXIS_LEVEL_SPEC_PATH)
 
     # Set the value of each metric to the correct values.
     for metric_name, metric_level in metric_levels.items():
@@ -1,4 +1,8 @@
+import os
+from copy import deepcopy
+
 import numpy as np
+import yaml
 
 
 # Sample from a range of values that have an *absolute* value
@@ -12,3 +16,22 @@ def _non_zero_uniform_sampler(abs_low, abs_high, size):
     neg_mask = np.full(size, 1)
     neg_mask[neg_locs] = -1
     return vals*neg_mask
+
+# Parsed YAML files keyed by absolute path. Each entry stores the
+# modification time and size of the file when it was parsed so that
+# changed files are parsed again.
+_PARSED_YAML_FILES = {}
+
+def _load_yaml_file(path):
+    # Load the YAML file at path, reusing the parsed content if the file
+    # hasn't changed since it was last parsed. A copy is returned because
+    # the parsed values are used directly as parameter values.
+    path = os.path.abspath(path)
+    file_stat = os.stat(path)
+    file_version = (file_stat.st_mtime_ns, file_stat.st_size)
+
+    if path not in _PARSED_YAML_FILES or _PARSED_YAML_FILES[path][0] != file_version:
+        with open(path, "r") as yaml_file:
+            _PARSED_YAML_FILES[path] = (file_version, yaml.safe_load(yaml_file))
+
+    return deepcopy(_PARSED_YAML_FILES[path][1])